@@ -0,0 +1,7 @@
+"""
+Offline analysis of production data.
+
+Provides:
+- analyze_traces: latency percentiles per stage, cost per persona / language and
+  slowest requests from the per-request trace files
+"""
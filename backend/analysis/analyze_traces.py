@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+Offline latency / cost report over request trace files (utils/request_trace.py).
+
+Reads the JSONL traces line by line - memory stays flat however large the day
+was - and prints:
+  1. p50 / p95 / p99 / max per pipeline stage (and end to end) per mode
+  2. token usage and estimated cost per persona (character) and language
+  3. the slowest requests with their stage breakdown
+
+Usage:
+    python analysis/analyze_traces.py                       # today's file in REQUEST_TRACE_DIR
+    python analysis/analyze_traces.py --date 2026-10-18
+    python analysis/analyze_traces.py logs/traces/*.jsonl.gz --top 20 --json
+    python analysis/analyze_traces.py --prices prices.json  # {"azure": {"input": 2.5, "cached_input": 1.25, "output": 10}}
+"""
+
+import os
+import sys
+import gzip
+import json
+import math
+import heapq
+import argparse
+from pathlib import Path
+from datetime import datetime
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# USD per 1M tokens; override with --prices for the deployments actually in use.
+# "embedding" is charged to the request's embed_provider.
+DEFAULT_PRICES = {
+    "azure": {"input": 2.50, "cached_input": 1.25, "output": 10.00, "embedding": 0.02},
+    "openai": {"input": 2.50, "cached_input": 1.25, "output": 10.00, "embedding": 0.02},
+    "claude": {"input": 3.00, "cached_input": 0.30, "output": 15.00},
+    "gemini": {"input": 1.25, "cached_input": 0.31, "output": 10.00},
+}
+
+STAGE_ORDER = ("compose_query", "embed", "vector_query", "rerank", "format_context", "ttft", "generation", "total")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LogHistogram:
+    """
+    Constant-memory quantile sketch: values land in geometric buckets of width
+    `precision`, so any quantile is accurate to about that relative error.
+    """
+
+    def __init__(self, precision: float = 0.01):
+        self._log_base = math.log1p(precision)
+        self._buckets: Dict[int, int] = defaultdict(int)
+        self._zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self._zeros += 1
+        else:
+            self._buckets[math.floor(math.log(value) / self._log_base)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                # Geometric midpoint of the bucket, clamped to what was observed
+                value = math.exp((index + 0.5) * self._log_base)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def buckets(self) -> List[Tuple[float, float, int]]:
+        """Non-empty buckets as (lower, upper, count) in increasing order; values <= 0 are (0, 0, n)."""
+        out = [(0.0, 0.0, self._zeros)] if self._zeros else []
+        for index in sorted(self._buckets):
+            lower = math.exp(index * self._log_base)
+            out.append((lower, math.exp((index + 1) * self._log_base), self._buckets[index]))
+        return out
+
+
+def iter_records(paths: Iterable[Path], errors: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """Stream trace records from plain or gzipped JSONL files, skipping lines that don't parse."""
+    for path in paths:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    errors["malformed_lines"] += 1
+
+
+def request_cost(record: Dict[str, Any], prices: Dict[str, Dict[str, float]]) -> Optional[float]:
+    """USD cost of one request from its token counts, None for a provider without prices."""
+    price = prices.get(record.get("provider") or "")
+    if price is None:
+        return None
+    tokens = record.get("tokens") or {}
+    prompt = tokens.get("prompt", 0)
+    cached = min(tokens.get("cached_prompt", 0), prompt)
+    completion = tokens.get("completion", 0)
+    embed_price = prices.get(record.get("embed_provider") or "", {}).get("embedding", 0.0)
+    return (
+        (prompt - cached) * price["input"]
+        + cached * price.get("cached_input", price["input"])
+        + completion * price["output"]
+        + tokens.get("embedding", 0) * embed_price
+    ) / 1_000_000
+
+
+class TraceReport:
+    """Accumulates one pass over the records."""
+
+    def __init__(self, prices: Dict[str, Dict[str, float]], top: int = 10):
+        self.prices = prices
+        self.top = top
+        self.requests = 0
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.error_stages: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[Tuple[str, str], LogHistogram] = defaultdict(LogHistogram)
+        self.costs: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.unpriced: Dict[str, int] = defaultdict(int)
+        self._slowest: List[Tuple[float, int, Dict[str, Any]]] = []
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.requests += 1
+        mode = record.get("mode") or "unknown"
+        self.statuses[record.get("status") or "unknown"] += 1
+        if record.get("error_stage"):
+            self.error_stages[record["error_stage"]] += 1
+
+        for stage, ms in (record.get("stages_ms") or {}).items():
+            self.stages[(mode, stage)].add(ms)
+        total_ms = record.get("total_ms")
+        if total_ms is not None:
+            self.stages[(mode, "total")].add(total_ms)
+            entry = (total_ms, self.requests, record)
+            if len(self._slowest) < self.top:
+                heapq.heappush(self._slowest, entry)
+            elif total_ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+        group = self.costs[(record.get("character") or "default", record.get("lang") or "en")]
+        group["requests"] += 1
+        for kind, count in (record.get("tokens") or {}).items():
+            group[f"{kind}_tokens"] += count
+        cost = request_cost(record, self.prices)
+        if cost is None:
+            self.unpriced[record.get("provider") or "unknown"] += 1
+        else:
+            group["cost_usd"] += cost
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [record for _, _, record in sorted(self._slowest, key=lambda e: -e[0])]
+
+    def summary(self) -> Dict[str, Any]:
+        def stage_rank(key):
+            mode, stage = key
+            return mode, STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER), stage
+
+        return {
+            "requests": self.requests,
+            "statuses": dict(self.statuses),
+            "error_stages": dict(self.error_stages),
+            "stages_ms": [
+                {
+                    "mode": mode,
+                    "stage": stage,
+                    "count": hist.count,
+                    **{f"p{int(q * 100)}": _round(hist.quantile(q)) for q in QUANTILES},
+                    "max": _round(hist.max),
+                }
+                for (mode, stage), hist in sorted(self.stages.items(), key=lambda item: stage_rank(item[0]))
+            ],
+            "cost": [
+                {"character": character, "lang": lang, **{k: _round(v, 6) for k, v in values.items()}}
+                for (character, lang), values in sorted(self.costs.items())
+            ],
+            "unpriced_requests": dict(self.unpriced),
+            "slowest": [
+                {key: record.get(key) for key in ("ts", "request_id", "mode", "lang", "character", "total_ms", "stages_ms", "query")}
+                for record in self.slowest()
+            ],
+        }
+
+
+def _round(value: Optional[float], digits: int = 1) -> Optional[float]:
+    return None if value is None or math.isinf(value) else round(value, digits)
+
+
+def print_report(summary: Dict[str, Any]) -> None:
+    print(f"Requests: {summary['requests']}  statuses: {summary['statuses']}")
+    if summary["error_stages"]:
+        print(f"Errors by stage: {summary['error_stages']}")
+
+    print("\nLatency per stage (ms)")
+    print(f"{'mode':<8}{'stage':<16}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for row in summary["stages_ms"]:
+        print(
+            f"{row['mode']:<8}{row['stage']:<16}{row['count']:>8}"
+            + "".join(f"{_fmt(row[key]):>10}" for key in ("p50", "p95", "p99", "max"))
+        )
+
+    print("\nTokens and cost per persona / language")
+    print(f"{'character':<12}{'lang':<6}{'requests':>10}{'prompt':>12}{'cached':>12}{'completion':>12}{'embedding':>12}{'cost USD':>12}{'USD/req':>10}")
+    for row in summary["cost"]:
+        requests = row.get("requests", 0) or 1
+        cost = row.get("cost_usd", 0.0)
+        print(
+            f"{row['character']:<12}{row['lang']:<6}{int(row.get('requests', 0)):>10}"
+            f"{int(row.get('prompt_tokens', 0)):>12}{int(row.get('cached_prompt_tokens', 0)):>12}"
+            f"{int(row.get('completion_tokens', 0)):>12}{int(row.get('embedding_tokens', 0)):>12}"
+            f"{cost:>12.4f}{cost / requests:>10.5f}"
+        )
+    if summary["unpriced_requests"]:
+        print(f"(no prices for: {summary['unpriced_requests']}; pass --prices)")
+
+    print(f"\nSlowest {len(summary['slowest'])} requests")
+    for record in summary["slowest"]:
+        stages = ", ".join(f"{stage} {ms:.0f}" for stage, ms in (record.get("stages_ms") or {}).items())
+        print(f"{record['total_ms']:>10.0f} ms  {record['mode']:<7}{record['lang']:<6}{record['character']:<10}{(record['query'] or '')[:60]!r}")
+        print(f"{'':>14}{stages}")
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def resolve_paths(args) -> List[Path]:
+    if args.paths:
+        return [Path(p) for p in args.paths]
+    date = args.date or datetime.now().strftime("%Y-%m-%d")
+    directory = Path(args.dir)
+    return [p for p in (directory / f"{date}.jsonl", directory / f"{date}.jsonl.gz") if p.exists()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency / cost report over request trace files")
+    parser.add_argument("paths", nargs="*", help="Trace files (.jsonl or .jsonl.gz); default: the --date file in --dir")
+    parser.add_argument("--dir", default=os.getenv("REQUEST_TRACE_DIR", "./logs/traces"), help="Trace directory")
+    parser.add_argument("--date", default=None, help="Day to analyse, YYYY-MM-DD (default today)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest requests to list")
+    parser.add_argument("--prices", default=None, help="JSON file of USD per 1M tokens per provider")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    paths = resolve_paths(args)
+    if not paths:
+        print("No trace files found", file=sys.stderr)
+        sys.exit(1)
+
+    prices = dict(DEFAULT_PRICES)
+    if args.prices:
+        prices.update(json.loads(Path(args.prices).read_text(encoding="utf-8")))
+
+    report = TraceReport(prices, top=args.top)
+    errors: Dict[str, int] = defaultdict(int)
+    for record in iter_records(paths, errors):
+        report.add(record)
+
+    summary = report.summary()
+    if errors:
+        summary["read_errors"] = dict(errors)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_report(summary)
+        if errors:
+            print(f"\nSkipped: {dict(errors)}")
+
+
+if __name__ == "__main__":
+    main()
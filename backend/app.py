@@ -1,9 +1,10 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 
 from routes.chat_routes import chat_bp
 # from routes.uploaded_routes import upload_bp
 from routes.doc_process_routes import process_bp
+from utils.metrics import PROMETHEUS_CONTENT_TYPE, metrics
 
 
 def create_app() -> Flask:
@@ -22,6 +23,11 @@ def create_app() -> Flask:
     def healthz():
         return jsonify({"status": "ok"})
 
+    @app.get("/metrics")
+    def prometheus_metrics():
+        # Latency histograms and counters recorded in-process (utils/metrics.py)
+        return Response(metrics.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
     # Blueprints
     app.register_blueprint(chat_bp, url_prefix="/chat")
     # app.register_blueprint(upload_bp, url_prefix="/upload")
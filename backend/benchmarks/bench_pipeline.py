@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+End-to-end benchmark of the RAG chat pipeline with offline providers.
+
+Drives, at each concurrency level (closed loop: N workers, each sending its next
+request when the previous one finished):
+    achat        ChatService.achat
+    astream      ChatService.astream_chat
+    http_chat    Flask POST /chat/         (in-process WSGI test client)
+    http_stream  Flask POST /chat/stream   (SSE parsed as it arrives)
+
+and reports throughput, total-latency and TTFT percentiles, the per-stage
+breakdown from the request traces (embed, vector_query, ttft, generation, ...)
+and process RSS (start / peak / end, and peak growth per concurrent worker).
+
+Providers default to the offline stub (LLM_PROVIDER=stub, shaped by the STUB_*
+variables); --provider replay serves a recorded cassette instead. A synthetic CV
+corpus is indexed with the same embedder into a temporary Chroma directory
+unless --chroma-dir points at an existing index.
+
+Results are written as JSON. With --baseline the run is compared against an
+earlier result file and exits with status 1 when a metric is worse by more than
+--threshold (relative). Any run whose error rate exceeds --max-error-rate (default 0)
+also fails it, baseline or not.
+
+Usage:
+    python backend/benchmarks/bench_pipeline.py
+    python backend/benchmarks/bench_pipeline.py --targets achat,http_stream --concurrency 1,8,32 --requests 200
+    python backend/benchmarks/bench_pipeline.py --output base.json
+    python backend/benchmarks/bench_pipeline.py --baseline base.json --threshold 0.15
+    python backend/benchmarks/bench_pipeline.py --provider replay   # CASSETTE_PATH from the environment
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import os
+import gc
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+TARGETS = ("achat", "astream", "http_chat", "http_stream")
+PERCENTILES = (50, 90, 95, 99)
+
+SECTIONS = {
+    "Work Experience": "senior engineer backend platform team company role led migration kubernetes services",
+    "Skills": "python go typescript sql pytorch docker kubernetes aws terraform languages frameworks",
+    "Projects": "built retrieval system machine learning pipeline open source project dashboard",
+    "Education": "university degree master computer science bachelor school graduated thesis",
+    "Leadership": "managed team mentored engineers hiring roadmap stakeholders leadership",
+}
+FILLER = "and the with for on of delivered improved reduced designed owned shipped measured".split()
+
+# (metric path, direction): "lower" / "higher" is better
+REGRESSION_METRICS = (
+    (("throughput_rps",), "higher"),
+    (("latency_ms", "p50"), "lower"),
+    (("latency_ms", "p95"), "lower"),
+    (("latency_ms", "p99"), "lower"),
+    (("ttft_ms", "p50"), "lower"),
+    (("ttft_ms", "p95"), "lower"),
+    (("rss_mb", "peak"), "lower"),
+)
+# Error rate may rise by this much (absolute) before it counts as a regression
+ERROR_RATE_TOLERANCE = 0.01
+
+
+# ---------------------------------------------------------------- statistics
+
+def percentile_summary(values: List[float]) -> Optional[Dict[str, float]]:
+    """Nearest-rank percentiles, mean and max of a sample (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    summary = {f"p{p}": round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2) for p in PERCENTILES}
+    summary["mean"] = round(sum(ordered) / len(ordered), 2)
+    summary["max"] = round(ordered[-1], 2)
+    return summary
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process now (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+
+
+class RssSampler:
+    """Samples RSS in a background thread while a target runs."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.end_mb = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, self.end_mb)
+
+
+# ---------------------------------------------------------------- setup
+
+def configure_environment(args) -> Path:
+    """Set provider / trace / index configuration before the app modules read it at import."""
+    os.environ["LLM_PROVIDER"] = args.provider
+    os.environ["EMBED_PROVIDER"] = args.embed_provider or args.provider
+    os.environ["SINGLEFLIGHT_ENABLED"] = "true" if args.singleflight else "false"
+    os.environ["REQUEST_TRACE_ENABLED"] = "true"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    os.environ["REQUEST_TRACE_DIR"] = str(work_dir / "traces")
+    os.environ["CHROMA_DIR"] = args.chroma_dir or str(work_dir / "chroma")
+    return work_dir
+
+
+def make_corpus(n_docs: int, rng: random.Random) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Synthetic CV chunks spread over the sections the evaluation questions ask about."""
+    texts, metadatas = [], []
+    names = list(SECTIONS)
+    for i in range(n_docs):
+        section = names[i % len(names)]
+        words = SECTIONS[section].split() + FILLER
+        texts.append(f"{section}\n" + " ".join(rng.choice(words) for _ in range(rng.randint(60, 160))))
+        metadatas.append({"filename": f"cv_{i % 3}.md", "Header_1": section, "doc_id": f"bench-{i}"})
+    return texts, metadatas
+
+
+def index_corpus(n_docs: int, seed: int) -> None:
+    """Embed the synthetic corpus with the configured embedder into the English collection."""
+    from llm import embed_client
+    from services.chat_serv import chroma_usage_en
+    from utils.async_bridge import get_async_bridge
+
+    texts, metadatas = make_corpus(n_docs, random.Random(seed))
+    embeddings = []
+    for start in range(0, len(texts), 64):
+        result = embed_client.embed(texts[start:start + 64])
+        embeddings.extend(get_async_bridge().run(result) if asyncio.iscoroutine(result) else result)
+    chroma_usage_en.add_data_to_collection(texts, embeddings, metadatas, node_id_prefix="bench")
+
+
+def load_queries(path: Optional[str]) -> List[str]:
+    path = Path(path) if path else BACKEND_DIR / "evaluation" / "test_cases.json"
+    data = json.loads(path.read_text(encoding="utf-8"))
+    cases = data["test_cases"] if isinstance(data, dict) else data
+    return [case["question"] if isinstance(case, dict) else str(case) for case in cases]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ---------------------------------------------------------------- one request per target
+# Each returns (ttft_seconds or None, completion_tokens or None); errors raise.
+
+def _request(query: str) -> Dict[str, Any]:
+    # A fresh session per request: no history growth, no retrieval reuse across requests
+    return {"query": query, "lang": "en", "session_id": f"bench-{uuid.uuid4().hex}"}
+
+
+async def run_achat(chat_service, query: str) -> Tuple[Optional[float], Optional[int]]:
+    response = await chat_service.achat(**_request(query))
+    return None, (response.get("usage") or {}).get("completion_tokens")
+
+
+async def run_astream(chat_service, query: str) -> Tuple[Optional[float], Optional[int]]:
+    from llm.rate_limiter import estimate_tokens
+
+    start = time.perf_counter()
+    ttft = None
+    chunks = []
+    async for chunk in chat_service.astream_chat(**_request(query)):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        chunks.append(chunk)
+    # astream_chat yields answer text only; count its tokens the way the rate limiter estimates them
+    return ttft, estimate_tokens("".join(chunks))
+
+
+def run_http_chat(client, query: str) -> Tuple[Optional[float], Optional[int]]:
+    response = client.post("/chat/", json=_request(query))
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return None, (response.get_json().get("usage") or {}).get("completion_tokens")
+
+
+def run_http_stream(client, query: str) -> Tuple[Optional[float], Optional[int]]:
+    from utils.sse import SSEParser
+
+    start = time.perf_counter()
+    response = client.post("/chat/stream", json=_request(query), buffered=False)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    parser = SSEParser()
+    ttft, completion, done = None, None, False
+    try:
+        for chunk in response.response:
+            for event in parser.feed(chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk):
+                data = event["data"] or ""
+                if event["event"] == "usage":
+                    completion = (json.loads(data).get("usage") or {}).get("completion_tokens")
+                elif event["event"] is None:
+                    if data.startswith("[ERROR]"):
+                        raise RuntimeError(data)
+                    if data == "[DONE]":
+                        done = True
+                    elif ttft is None and not data.startswith("[SESSION_ID]"):
+                        ttft = time.perf_counter() - start
+    finally:
+        response.close()
+    if not done:
+        raise RuntimeError("stream ended without [DONE]")
+    return ttft, completion
+
+
+# ---------------------------------------------------------------- drivers
+
+class Collector:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.completion_tokens = 0
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def ok(self, seconds: float, ttft: Optional[float], completion: Optional[int]) -> None:
+        with self._lock:
+            self.latencies.append(seconds * 1000)
+            if ttft is not None:
+                self.ttfts.append(ttft * 1000)
+            self.completion_tokens += completion or 0
+
+    def error(self, e: Exception) -> None:
+        with self._lock:
+            name = str(e) if str(e).startswith("HTTP ") else type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def drive_async(fn: Callable, chat_service, queries: Iterator[str], total: int, concurrency: int, collector: Collector) -> None:
+    async def worker(counter: List[int]):
+        while counter[0] < total:
+            counter[0] += 1
+            query = next(queries)
+            start = time.perf_counter()
+            try:
+                ttft, completion = await fn(chat_service, query)
+                collector.ok(time.perf_counter() - start, ttft, completion)
+            except Exception as e:
+                collector.error(e)
+
+    async def run():
+        counter = [0]
+        await asyncio.gather(*(worker(counter) for _ in range(concurrency)))
+
+    asyncio.run(run())
+
+
+def drive_threads(fn: Callable, client, queries: Iterator[str], total: int, concurrency: int, collector: Collector) -> None:
+    lock = threading.Lock()
+    counter = [0]
+
+    def worker():
+        while True:
+            with lock:
+                if counter[0] >= total:
+                    return
+                counter[0] += 1
+                query = next(queries)
+            start = time.perf_counter()
+            try:
+                ttft, completion = fn(client, query)
+                collector.ok(time.perf_counter() - start, ttft, completion)
+            except Exception as e:
+                collector.error(e)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+
+
+def stage_breakdown(trace_dir: Path) -> Dict[str, Any]:
+    """Per-stage percentiles from the request traces written during one target's run."""
+    from analysis.analyze_traces import iter_records
+
+    stages: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for record in iter_records(sorted(trace_dir.glob("*.jsonl")), errors):
+        for stage, ms in (record.get("stages_ms") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+    return {stage: percentile_summary(values) for stage, values in sorted(stages.items())}
+
+
+def run_target(target: str, concurrency: int, args, queries: List[str], work_dir: Path) -> Dict[str, Any]:
+    from services import chat_service
+    from utils import request_trace
+
+    cycle = iter(queries * (1 + (args.requests + args.warmup) // max(1, len(queries))))
+    is_http = target.startswith("http_")
+    if is_http:
+        from app import app
+        driver, context = drive_threads, app.test_client()
+    else:
+        driver, context = drive_async, chat_service
+    fn = {"achat": run_achat, "astream": run_astream, "http_chat": run_http_chat, "http_stream": run_http_stream}[target]
+
+    if args.warmup:
+        driver(fn, context, cycle, args.warmup, min(concurrency, args.warmup), Collector())
+
+    # This target's traces go to their own directory
+    trace_dir = work_dir / "traces" / f"{target}_c{concurrency}"
+    request_trace.trace_writer = request_trace.TraceWriter(str(trace_dir))
+    gc.collect()
+    collector = Collector()
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        driver(fn, context, cycle, args.requests, concurrency, collector)
+        wall = time.perf_counter() - start
+    request_trace.trace_writer.close()
+
+    completed = len(collector.latencies)
+    failed = sum(collector.errors.values())
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": completed + failed,
+        "errors": collector.errors,
+        "error_rate": round(failed / max(1, completed + failed), 4),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(completed / wall, 3) if wall else None,
+        "completion_tokens_per_second": round(collector.completion_tokens / wall, 1) if wall else None,
+        "latency_ms": percentile_summary(collector.latencies),
+        "ttft_ms": percentile_summary(collector.ttfts),
+        "stages_ms": stage_breakdown(trace_dir),
+        "rss_mb": {
+            "start": round(rss.start_mb, 1),
+            "peak": round(rss.peak_mb, 1),
+            "end": round(rss.end_mb, 1),
+            "peak_growth_per_worker": round((rss.peak_mb - rss.start_mb) / concurrency, 2),
+        },
+    }
+
+
+# ---------------------------------------------------------------- reporting / regression
+
+def _fmt(summary: Optional[Dict[str, float]], key: str) -> str:
+    return "-" if not summary else f"{summary[key]:.0f}"
+
+
+def print_results(results: Dict[str, Dict[str, Any]]) -> None:
+    print("=" * 118)
+    print(f"{'target':<14}{'conc':>5}{'req':>6}{'err%':>7}{'rps':>9}{'tok/s':>9}"
+          f"{'lat p50':>9}{'p95':>8}{'p99':>8}{'ttft p50':>10}{'p95':>8}{'rss peak':>10}{'/worker':>9}")
+    print("-" * 118)
+    for result in results.values():
+        print(
+            f"{result['target']:<14}{result['concurrency']:>5}{result['requests']:>6}{result['error_rate']:>7.1%}"
+            f"{result['throughput_rps'] or 0:>9.2f}{result['completion_tokens_per_second'] or 0:>9.0f}"
+            f"{_fmt(result['latency_ms'], 'p50'):>9}{_fmt(result['latency_ms'], 'p95'):>8}{_fmt(result['latency_ms'], 'p99'):>8}"
+            f"{_fmt(result['ttft_ms'], 'p50'):>10}{_fmt(result['ttft_ms'], 'p95'):>8}"
+            f"{result['rss_mb']['peak']:>10.1f}{result['rss_mb']['peak_growth_per_worker']:>9.2f}"
+        )
+    print("\nStage breakdown (ms, p50 / p95)")
+    for name, result in results.items():
+        stages = ", ".join(
+            f"{stage} {summary['p50']:.0f}/{summary['p95']:.0f}" for stage, summary in result["stages_ms"].items() if summary
+        )
+        print(f"  {name:<18}{stages}")
+    if any(result["errors"] for result in results.values()):
+        print("\nErrors: " + "; ".join(f"{name}: {result['errors']}" for name, result in results.items() if result["errors"]))
+
+
+def _metric(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """Metrics of runs present in both results that got worse by more than threshold."""
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for path, direction in REGRESSION_METRICS:
+            now, before = _metric(result, path), _metric(base, path)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            worse = change < -threshold if direction == "higher" else change > threshold
+            if worse:
+                regressions.append(f"{name} {'.'.join(path)}: {before} -> {now} ({change:+.1%})")
+        if result["error_rate"] > base.get("error_rate", 0) + ERROR_RATE_TOLERANCE:
+            regressions.append(f"{name} error_rate: {base.get('error_rate', 0)} -> {result['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end RAG pipeline benchmark with offline providers")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma list of {', '.join(TARGETS)}")
+    parser.add_argument("--concurrency", default="1,8", help="Comma list of concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per target and level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each run")
+    parser.add_argument("--provider", default="stub", help="LLM provider (stub, replay, ...)")
+    parser.add_argument("--embed-provider", default=None, help="Embedding provider (default: --provider)")
+    parser.add_argument("--queries", default=None, help="JSON file of questions (default: evaluation/test_cases.json)")
+    parser.add_argument("--chroma-dir", default=None, help="Use this existing index instead of a synthetic one")
+    parser.add_argument("--corpus-docs", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--singleflight", action="store_true", help="Keep stream coalescing on (off by default)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Result JSON (default: benchmarks/results/pipeline_<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Fail when any run's error rate is above this (with or without --baseline)")
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {sorted(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    work_dir = configure_environment(args)
+    # Relative paths in the app (logs, cassettes) resolve against the backend directory
+    os.chdir(BACKEND_DIR)
+    if not args.chroma_dir:
+        index_corpus(args.corpus_docs, args.seed)
+    queries = load_queries(args.queries)
+    random.Random(args.seed).shuffle(queries)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for target in targets:
+        for concurrency in levels:
+            print(f"Running {target} at concurrency {concurrency} ...", flush=True)
+            results[f"{target}@{concurrency}"] = run_target(target, concurrency, args, queries, work_dir)
+
+    print_results(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "provider": os.environ["LLM_PROVIDER"],
+            "embed_provider": os.environ["EMBED_PROVIDER"],
+            "args": vars(args),
+            "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith(("STUB_", "CASSETTE_", "ADMISSION_", "SSE_"))},
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else BACKEND_DIR / "benchmarks" / "results" / f"pipeline_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+    failed = False
+    failing = {name: r["error_rate"] for name, r in results.items() if r["error_rate"] > args.max_error_rate}
+    if failing:
+        print(f"\nERROR RATE above {args.max_error_rate:.1%}: " + ", ".join(f"{n} {rate:.1%}" for n, rate in failing.items()))
+        failed = True
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSIONS vs {args.baseline} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            failed = True
+        else:
+            print(f"\nNo regressions vs {args.baseline} (threshold {args.threshold:.0%})")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
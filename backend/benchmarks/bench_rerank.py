@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+Re-rank latency vs prompt tokens saved.
+
+Compares the plain "crank k up" retrieval (top baseline_k by distance) with
+fetching fetch_k candidates and re-ranking them down to top_n. Runs offline on
+a synthetic CV-like corpus with noisy dense distances, so no vector store or
+embedding provider is needed.
+
+Usage:
+    python backend/benchmarks/bench_rerank.py
+    python backend/benchmarks/bench_rerank.py --reranker cross_encoder --queries 50
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import time
+import random
+import argparse
+import statistics
+from typing import List, Tuple
+
+from services.reranker import create_reranker
+
+SECTIONS = ["Summary", "Professional Experience", "Projects", "Skills", "Education", "Leadership"]
+VOCAB = (
+    "python flask fastapi rag retrieval milvus chroma embedding rabbitmq async latency "
+    "lora slm evaluation prompt agent ner intent multilingual docker kubernetes azure "
+    "openai claude gemini streamlit pandas numpy pytorch transformers redis postgres "
+    "mentoring roadmap stakeholder customer japan taiwan deployment monitoring testing"
+).split()
+FILLER = (
+    "worked closely with the team to deliver reliable features and improve the overall "
+    "quality of the product while keeping the system maintainable and well documented"
+).split()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def build_corpus(n_docs: int, rng: random.Random) -> List[Tuple[str, dict]]:
+    corpus = []
+    for i in range(n_docs):
+        section = SECTIONS[i % len(SECTIONS)]
+        sub = f"Role {i} at Company {i % 7}"
+        keywords = rng.sample(VOCAB, 4)
+        body = " ".join(rng.choices(FILLER, k=rng.randint(60, 160)) + keywords)
+        text = f"{section}\n{sub}\n{body}"
+        corpus.append((text, {"filename": "resume.md", "Header_2": section, "Header_3": sub, "keywords": keywords}))
+    return corpus
+
+
+def make_queries(corpus, n_queries: int, rng: random.Random) -> List[Tuple[str, int]]:
+    queries = []
+    for _ in range(n_queries):
+        target = rng.randrange(len(corpus))
+        meta = corpus[target][1]
+        terms = rng.sample(meta["keywords"], 2)
+        queries.append((f"Tell me about her {meta['Header_2'].lower()} with {' and '.join(terms)}", target))
+    return queries
+
+
+def dense_candidates(corpus, target: int, k: int, rng: random.Random) -> List[tuple]:
+    """Simulate a vector-store result: the relevant doc is only loosely favoured by distance."""
+    scored = []
+    for i, (text, meta) in enumerate(corpus):
+        dist = rng.uniform(0.22, 0.42) if i == target else rng.uniform(0.2, 0.65)
+        scored.append((text, {**meta, "_idx": i}, dist))
+    scored.sort(key=lambda c: c[2])
+    return scored[:k]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark re-rank latency against prompt tokens saved")
+    parser.add_argument("--reranker", default="lexical", help="Re-ranker name (lexical, cross_encoder)")
+    parser.add_argument("--docs", type=int, default=60, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=300, help="Number of queries")
+    parser.add_argument("--baseline-k", type=int, default=10, help="k used without re-ranking")
+    parser.add_argument("--fetch-k", type=int, default=20, help="Candidates fetched before re-ranking")
+    parser.add_argument("--top-n", type=int, default=4, help="Documents passed to the LLM after re-ranking")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = build_corpus(args.docs, rng)
+    queries = make_queries(corpus, args.queries, rng)
+    reranker = create_reranker(args.reranker)
+
+    baseline_tokens, baseline_hits = [], 0
+    rerank_tokens, rerank_hits, latencies = [], 0, []
+
+    for query, target in queries:
+        candidates = dense_candidates(corpus, target, args.fetch_k, rng)
+
+        baseline = candidates[:args.baseline_k]
+        baseline_tokens.append(sum(estimate_tokens(doc) for doc, _, _ in baseline))
+        baseline_hits += any(meta["_idx"] == target for _, meta, _ in baseline)
+
+        t = time.perf_counter()
+        reranked = reranker.rerank(query, candidates, top_n=args.top_n)
+        latencies.append((time.perf_counter() - t) * 1000)
+        rerank_tokens.append(sum(estimate_tokens(doc) for doc, _, _ in reranked))
+        rerank_hits += any(meta["_idx"] == target for _, meta, _ in reranked)
+
+    n = len(queries)
+    avg_base = statistics.mean(baseline_tokens)
+    avg_rerank = statistics.mean(rerank_tokens)
+
+    print("=" * 64)
+    print(f"RE-RANK BENCHMARK ({reranker.name}, {n} queries, {args.docs} docs)")
+    print("=" * 64)
+    print(f"{'':<28}{'context tokens':>16}{'hit rate':>12}")
+    print(f"{f'baseline top-{args.baseline_k}':<28}{avg_base:>16.1f}{baseline_hits / n:>12.2%}")
+    print(f"{f'rerank {args.fetch_k} -> top-{args.top_n}':<28}{avg_rerank:>16.1f}{rerank_hits / n:>12.2%}")
+    print("-" * 64)
+    print(f"Tokens saved per request: {avg_base - avg_rerank:.1f} ({1 - avg_rerank / avg_base:.1%})")
+    print(f"Re-rank latency (ms):     p50={percentile(latencies, 50):.3f}  "
+          f"p95={percentile(latencies, 95):.3f}  max={max(latencies):.3f}")
+    print("=" * 64)
+
+
+if __name__ == "__main__":
+    main()
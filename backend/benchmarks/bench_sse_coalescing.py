@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+Benchmark: SSE frames and CPU per streamed answer, with and without token coalescing.
+
+Drives a synthetic provider stream through the same path /chat/stream uses
+(async events -> coalesce_tokens -> event-loop bridge -> format_sse -> socket
+write), then parses the frames the way a client would. Writes go to a real
+file descriptor so the per-frame syscall cost is included.
+
+Reports per stream: frames sent, server CPU (process time), client parse time,
+time to first frame and wall time.
+
+Usage:
+    python backend/benchmarks/bench_sse_coalescing.py
+    python backend/benchmarks/bench_sse_coalescing.py --chunks 4000 --chunk-delay-ms 0.5
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from typing import List
+
+from utils.async_bridge import get_async_bridge
+from utils.sse import coalesce_tokens, format_sse
+
+WORDS = "the candidate built a retrieval system with python and reduced latency for customers".split()
+
+
+def make_chunks(n: int, rng: random.Random) -> List[str]:
+    """Provider-sized chunks: a word or part of one, like most chat model streams."""
+    chunks = []
+    for _ in range(n):
+        word = rng.choice(WORDS) + " "
+        chunks.append(word[:rng.randint(1, len(word))])
+    return chunks
+
+
+async def provider_events(chunks: List[str], delay: float):
+    yield {"type": "sources", "sources": [], "timings": {}}
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield {"type": "token", "content": chunk}
+    yield {"type": "usage", "usage": None, "timings": {}}
+
+
+def parse_frames(payload: str) -> str:
+    """Minimal SSE client: split frames, join data lines, concatenate token text."""
+    out = []
+    for frame in payload.split("\n\n"):
+        if not frame:
+            continue
+        data, is_event = [], False
+        for line in frame.split("\n"):
+            if line.startswith("data: "):
+                data.append(line[6:])
+            elif line.startswith("event: "):
+                is_event = True
+        if not is_event:
+            out.append("\n".join(data))
+    return "".join(out)
+
+
+def run_stream(chunks: List[str], delay: float, interval_ms: float, max_bytes: int, fd: int) -> dict:
+    bridge = get_async_bridge()
+    frames = []
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    first_frame = None
+    events = coalesce_tokens(provider_events(chunks, delay), interval_ms=interval_ms, max_bytes=max_bytes)
+    for event in bridge.iterate(events):
+        event_type = event.pop("type")
+        if event_type == "token":
+            frame = format_sse(event["content"])
+            if first_frame is None:
+                first_frame = time.perf_counter() - wall_start
+        else:
+            frame = format_sse(event, event=event_type)
+        os.write(fd, frame.encode("utf-8"))
+        frames.append(frame)
+    server_cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    t = time.perf_counter()
+    text = parse_frames("".join(frames))
+    parse = time.perf_counter() - t
+    assert text == "".join(chunks), "coalescing changed the streamed text"
+    return {"frames": len(frames), "cpu": server_cpu, "parse": parse, "ttff": first_frame, "wall": wall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSE token coalescing")
+    parser.add_argument("--chunks", type=int, default=2000, help="provider chunks per answer")
+    parser.add_argument("--chunk-delay-ms", type=float, default=1.0, help="delay between provider chunks")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, random.Random(args.seed))
+    delay = args.chunk_delay_ms / 1000
+    policies = [
+        ("per-chunk", 0, 0),
+        ("20ms/256B", 20, 256),
+        ("40ms/512B", 40, 512),
+        ("100ms/2KB", 100, 2048),
+    ]
+
+    print(f"{len(chunks)} chunks, {sum(len(c) for c in chunks)} chars, {args.chunk_delay_ms} ms between chunks, "
+          f"median of {args.runs} runs")
+    print("=" * 86)
+    print(f"{'policy':>12}{'frames':>10}{'server CPU ms':>16}{'client parse ms':>18}{'first frame ms':>16}{'wall ms':>12}")
+    print("-" * 86)
+    with open(os.devnull, "wb") as sink:
+        for name, interval_ms, max_bytes in policies:
+            results = [run_stream(chunks, delay, interval_ms, max_bytes, sink.fileno()) for _ in range(args.runs)]
+            med = lambda key: statistics.median(r[key] for r in results)
+            print(f"{name:>12}{med('frames'):>10.0f}{med('cpu') * 1000:>16.1f}{med('parse') * 1000:>18.2f}"
+                  f"{med('ttff') * 1000:>16.2f}{med('wall') * 1000:>12.0f}")
+    print("=" * 86)
+
+
+if __name__ == "__main__":
+    main()
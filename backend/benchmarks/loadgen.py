@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+HTTP load generator for the Flask chat API.
+
+Replays a question corpus against a running server as multi-turn conversations:
+every conversation starts with a fresh session_id and keeps the one the server
+returns (JSON "session_id" on /chat/, the "[SESSION_ID]" frame on /chat/stream),
+so later turns carry real history.
+
+/chat/stream responses are parsed as they arrive. Per stream it measures:
+    preamble   time to the [SESSION_ID] frame (headers and first byte)
+    sources    time to the "sources" event (retrieval finished)
+    ttft       time to the first answer frame - not the preamble or the sources event
+    gaps       time between consecutive answer frames
+    latency    time to [DONE]
+
+Two arrival models:
+    closed loop  --concurrency N   N users, each starting its next conversation
+                                   when the previous one finished
+    open loop    --rate R          conversations start at R per second (Poisson or
+                                   uniform) whether or not earlier ones finished; a
+                                   start finding --max-inflight conversations still
+                                   running is dropped and counted, and latencies are
+                                   also measured from the scheduled start so client
+                                   back-pressure doesn't hide server slowness
+
+Histograms (log buckets, ~2% wide) and percentiles are written as JSON.
+
+Corpus: evaluation/test_cases.json (default), a JSON list of questions, a list of
+conversations (lists of questions), or {"conversations": [...]}. Flat question
+lists are grouped into conversations of --turns questions.
+
+Usage:
+    python backend/benchmarks/loadgen.py --url http://localhost:5000 --concurrency 8 --duration 60
+    python backend/benchmarks/loadgen.py --rate 2 --arrival poisson --duration 120 --turns 3
+    python backend/benchmarks/loadgen.py --endpoint mixed --stream-ratio 0.8 --output load.json
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import json
+import time
+import uuid
+import codecs
+import random
+import argparse
+import threading
+from datetime import datetime
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from analysis.analyze_traces import LogHistogram
+from utils.sse import SSEParser
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+# Relative bucket width of the written histograms
+HISTOGRAM_PRECISION = 0.02
+
+
+@dataclass
+class TurnResult:
+    """One request of a conversation. Times are seconds from sending the request."""
+    endpoint: str
+    turn: int
+    status: Optional[int] = None
+    session_id: Optional[str] = None
+    latency: Optional[float] = None
+    preamble: Optional[float] = None
+    sources: Optional[float] = None
+    ttft: Optional[float] = None
+    gaps: List[float] = field(default_factory=list)
+    answer_chars: int = 0
+    completion_tokens: Optional[int] = None
+    done: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and self.error is None
+
+
+# ---------------------------------------------------------------- API clients
+
+def chat_turn(http: requests.Session, base_url: str, payload: Dict[str, Any], timeout: float, turn: int) -> TurnResult:
+    """POST /chat/ and wait for the JSON answer."""
+    result = TurnResult("chat", turn)
+    start = time.perf_counter()
+    try:
+        response = http.post(f"{base_url}/chat/", json=payload, timeout=timeout)
+        result.latency = time.perf_counter() - start
+        result.status = response.status_code
+        if response.status_code != 200:
+            result.error = f"HTTP {response.status_code}"
+            return result
+        body = response.json()
+        result.session_id = body.get("session_id")
+        result.answer_chars = len(body.get("response") or "")
+        result.completion_tokens = (body.get("usage") or {}).get("completion_tokens")
+        result.done = True
+    except (requests.RequestException, ValueError) as e:
+        result.error = type(e).__name__
+    return result
+
+
+def stream_turn(http: requests.Session, base_url: str, payload: Dict[str, Any], timeout: float, turn: int) -> TurnResult:
+    """POST /chat/stream and read the SSE frames as they arrive."""
+    result = TurnResult("stream", turn)
+    start = time.perf_counter()
+    try:
+        with http.post(f"{base_url}/chat/stream", json=payload, stream=True, timeout=timeout) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                result.error = f"HTTP {response.status_code}"
+                return result
+            parser = SSEParser()
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            last_token = None
+            # chunk_size=None yields whatever the server has flushed, as soon as it arrives
+            for raw in response.iter_content(chunk_size=None):
+                now = time.perf_counter() - start
+                for event in parser.feed(decoder.decode(raw)):
+                    data = event["data"] or ""
+                    if event["event"] == "sources":
+                        result.sources = now
+                    elif event["event"] == "usage":
+                        result.completion_tokens = (json.loads(data).get("usage") or {}).get("completion_tokens")
+                    elif event["event"] is not None:
+                        continue
+                    elif data.startswith("[SESSION_ID]"):
+                        result.session_id = data[len("[SESSION_ID]"):].strip()
+                        result.preamble = now
+                    elif data == "[DONE]":
+                        result.done = True
+                    elif data.startswith("[ERROR]"):
+                        result.error = "stream_error"
+                    else:
+                        if last_token is None:
+                            result.ttft = now
+                        else:
+                            result.gaps.append(now - last_token)
+                        last_token = now
+                        result.answer_chars += len(data)
+            result.latency = time.perf_counter() - start
+            if not result.done and result.error is None:
+                result.error = "incomplete_stream"
+    except (requests.RequestException, ValueError) as e:
+        result.error = type(e).__name__
+    return result
+
+
+# ---------------------------------------------------------------- recording
+
+class Recorder:
+    """Thread-safe histograms and counters over all turns."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, LogHistogram] = {}
+        self.statuses: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.turns = 0
+        self.failed = 0
+        self.conversations = 0
+        self.dropped = 0
+        self.completion_tokens = 0
+
+    def _observe(self, name: str, seconds: Optional[float]) -> None:
+        if seconds is None:
+            return
+        if name not in self.histograms:
+            self.histograms[name] = LogHistogram(HISTOGRAM_PRECISION)
+        self.histograms[name].add(seconds * 1000)
+
+    def add(self, result: TurnResult, queued: float = 0.0) -> None:
+        with self._lock:
+            self.turns += 1
+            status = str(result.status) if result.status is not None else "none"
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not result.ok:
+                self.failed += 1
+                self.errors[result.error] = self.errors.get(result.error, 0) + 1
+                return
+            prefix = result.endpoint
+            self._observe(f"{prefix}.latency_ms", result.latency)
+            if queued:
+                self._observe(f"{prefix}.latency_from_schedule_ms", result.latency + queued)
+            self._observe(f"{prefix}.preamble_ms", result.preamble)
+            self._observe(f"{prefix}.sources_ms", result.sources)
+            self._observe(f"{prefix}.ttft_ms", result.ttft)
+            # Follow-up turns carry history: keep their TTFT apart from first turns
+            self._observe(f"{prefix}.ttft_turn{'1' if result.turn == 0 else '2+'}_ms", result.ttft)
+            for gap in result.gaps:
+                self._observe(f"{prefix}.inter_token_gap_ms", gap)
+            self.completion_tokens += result.completion_tokens or 0
+
+    def conversation_started(self) -> None:
+        with self._lock:
+            self.conversations += 1
+
+    def conversation_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        with self._lock:
+            metrics = {}
+            for name, histogram in sorted(self.histograms.items()):
+                metrics[name] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.total / histogram.count, 2),
+                    "min": round(histogram.min, 2),
+                    **{f"p{int(q * 100)}": round(histogram.quantile(q), 2) for q in QUANTILES},
+                    "max": round(histogram.max, 2),
+                }
+            return {
+                "elapsed_seconds": round(elapsed, 2),
+                "conversations": self.conversations,
+                "dropped_conversations": self.dropped,
+                "turns": self.turns,
+                "failed_turns": self.failed,
+                "turns_per_second": round(self.turns / elapsed, 3) if elapsed else None,
+                "completion_tokens_per_second": round(self.completion_tokens / elapsed, 1) if elapsed else None,
+                "statuses": dict(self.statuses),
+                "errors": dict(self.errors),
+                "metrics": metrics,
+                "histograms": {
+                    name: [[round(lower, 3), round(upper, 3), count] for lower, upper, count in histogram.buckets()]
+                    for name, histogram in sorted(self.histograms.items())
+                },
+            }
+
+
+# ---------------------------------------------------------------- workload
+
+def load_conversations(path: Optional[str], turns: int, rng: random.Random) -> List[List[str]]:
+    path = Path(path) if path else BACKEND_DIR / "evaluation" / "test_cases.json"
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = data.get("conversations") or data.get("test_cases") or []
+    items = [item["question"] if isinstance(item, dict) else item for item in data]
+    if items and all(isinstance(item, list) for item in items):
+        return items
+    questions = [str(item) for item in items]
+    if not questions:
+        raise ValueError(f"no questions in {path}")
+    # Flat corpus: one conversation starting at each question, continuing with the next ones
+    rng.shuffle(questions)
+    n = len(questions)
+    return [[questions[(start + j) % n] for j in range(max(1, turns))] for start in range(n)]
+
+
+class LoadGenerator:
+    def __init__(self, args, conversations: List[List[str]]):
+        self.args = args
+        self.base_url = args.url.rstrip("/")
+        self.conversations = conversations
+        self.recorder = Recorder()
+        self._rng = random.Random(args.seed)
+        self._rng_lock = threading.Lock()
+        self._local = threading.local()
+        self._next = 0
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _http(self) -> requests.Session:
+        # One connection pool per worker thread
+        if not hasattr(self._local, "http"):
+            self._local.http = requests.Session()
+        return self._local.http
+
+    def _take(self) -> Optional[List[str]]:
+        with self._rng_lock:
+            if self.args.conversations and self._next >= self.args.conversations:
+                return None
+            self._next += 1
+            return self.conversations[(self._next - 1) % len(self.conversations)]
+
+    def _use_stream(self) -> bool:
+        if self.args.endpoint != "mixed":
+            return self.args.endpoint == "stream"
+        with self._rng_lock:
+            return self._rng.random() < self.args.stream_ratio
+
+    def _think(self) -> None:
+        if self.args.think_time > 0:
+            with self._rng_lock:
+                pause = self._rng.expovariate(1 / self.args.think_time)
+            self._stop.wait(pause)
+
+    def run_conversation(self, questions: List[str], queued: float = 0.0) -> None:
+        self.recorder.conversation_started()
+        session_id = f"load-{uuid.uuid4().hex}"
+        for turn, query in enumerate(questions):
+            if self._stop.is_set():
+                return
+            payload = {"query": query, "lang": self.args.lang, "session_id": session_id}
+            if self.args.character:
+                payload["character"] = self.args.character
+            send = stream_turn if self._use_stream() else chat_turn
+            result = send(self._http(), self.base_url, payload, self.args.timeout, turn)
+            self.recorder.add(result, queued if turn == 0 else 0.0)
+            if not result.ok:
+                # Without the answer in history the rest of the conversation isn't comparable
+                return
+            session_id = result.session_id or session_id
+            if turn < len(questions) - 1:
+                self._think()
+
+    # ----- closed loop -----
+
+    def _closed_worker(self) -> None:
+        while not self._stop.is_set():
+            questions = self._take()
+            if questions is None:
+                return
+            self.run_conversation(questions)
+
+    def run_closed(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for future in [pool.submit(self._closed_worker) for _ in range(self.args.concurrency)]:
+                future.result()
+
+    # ----- open loop -----
+
+    def _open_task(self, questions: List[str], scheduled: float) -> None:
+        try:
+            self.run_conversation(questions, queued=max(0.0, time.perf_counter() - scheduled))
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def run_open(self) -> None:
+        interval = 1.0 / self.args.rate
+        with ThreadPoolExecutor(max_workers=self.args.max_inflight) as pool:
+            next_start = time.perf_counter()
+            while not self._stop.is_set():
+                delay = next_start - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                questions = self._take()
+                if questions is None:
+                    break
+                with self._inflight_lock:
+                    admitted = self._inflight < self.args.max_inflight
+                    if admitted:
+                        self._inflight += 1
+                if admitted:
+                    pool.submit(self._open_task, questions, next_start)
+                else:
+                    self.recorder.conversation_dropped()
+                if self.args.arrival == "poisson":
+                    with self._rng_lock:
+                        next_start += self._rng.expovariate(self.args.rate)
+                else:
+                    next_start += interval
+
+    def _report_progress(self, start: float) -> None:
+        while not self._stop.wait(self.args.report_every):
+            elapsed = time.perf_counter() - start
+            r = self.recorder
+            print(f"[{elapsed:6.1f}s] conversations {r.conversations:>5}  turns {r.turns:>6}  "
+                  f"failed {r.failed:>4}  dropped {r.dropped:>4}  {r.turns / elapsed:6.2f} turns/s", flush=True)
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        timer = threading.Timer(self.args.duration, self._stop.set) if self.args.duration else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        reporter = threading.Thread(target=self._report_progress, args=(start,), daemon=True)
+        reporter.start()
+        try:
+            if self.args.rate:
+                self.run_open()
+            else:
+                self.run_closed()
+        except KeyboardInterrupt:
+            print("Interrupted, stopping ...")
+        finally:
+            # Open loop: the pool exit above already waited for in-flight conversations
+            self._stop.set()
+            if timer:
+                timer.cancel()
+        return self.recorder.summary(time.perf_counter() - start)
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print("=" * 96)
+    print(f"{summary['conversations']} conversations, {summary['turns']} turns in {summary['elapsed_seconds']}s "
+          f"({summary['turns_per_second']} turns/s, {summary['completion_tokens_per_second']} completion tokens/s)")
+    print(f"failed turns: {summary['failed_turns']}  dropped conversations: {summary['dropped_conversations']}  "
+          f"statuses: {summary['statuses']}")
+    if summary["errors"]:
+        print(f"errors: {summary['errors']}")
+    print("-" * 96)
+    print(f"{'metric (ms)':<38}{'count':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, m in summary["metrics"].items():
+        print(f"{name:<38}{m['count']:>8}{m['mean']:>9.0f}{m['p50']:>9.0f}{m['p90']:>9.0f}"
+              f"{m['p95']:>9.0f}{m['p99']:>9.0f}{m['max']:>9.0f}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the chat API (/chat/, /chat/stream)")
+    parser.add_argument("--url", default="http://localhost:5000", help="Server base URL")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "mixed"], default="stream")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="Share of streamed turns with --endpoint mixed")
+    parser.add_argument("--corpus", default=None, help="Questions / conversations JSON (default: evaluation/test_cases.json)")
+    parser.add_argument("--turns", type=int, default=1, help="Turns per conversation for flat question lists")
+    parser.add_argument("--lang", default="en", choices=["en", "zhtw"])
+    parser.add_argument("--character", default=None, help="hr or engineer")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed loop: concurrent users")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: conversations started per second")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson", help="Open loop arrival process")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open loop: conversations running at once")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between turns (seconds, exponential)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Stop after this many seconds (0 = no limit)")
+    parser.add_argument("--conversations", type=int, default=0, help="Stop after starting this many (0 = no limit)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (seconds)")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Progress line interval (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Result JSON (default: benchmarks/results/loadgen_<time>.json)")
+    args = parser.parse_args()
+    if not args.duration and not args.conversations:
+        parser.error("set --duration or --conversations")
+
+    conversations = load_conversations(args.corpus, args.turns, random.Random(args.seed))
+    mode = f"open loop, {args.rate}/s {args.arrival}" if args.rate else f"closed loop, {args.concurrency} users"
+    print(f"{args.url}  endpoint={args.endpoint}  {mode}  {len(conversations)} conversations in corpus")
+
+    summary = LoadGenerator(args, conversations).run()
+    print_summary(summary)
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "args": vars(args)},
+        **summary,
+    }
+    output = Path(args.output) if args.output else BACKEND_DIR / "benchmarks" / "results" / f"loadgen_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
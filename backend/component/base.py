@@ -63,20 +63,50 @@ import textwrap
 
 @dataclass
 class Usage:
+    """
+    Provider-neutral token usage. prompt_tokens always counts the whole prompt;
+    cached_prompt_tokens is the part of it served from the provider's prompt cache.
+    """
     prompt_tokens: int = 0
     completion_tokens: int = 0
     embedding_tokens: int = 0
+    cached_prompt_tokens: int = 0
+
+    @classmethod
+    def from_openai(cls, usage: Any) -> "Usage":
+        """From an OpenAI / Azure OpenAI CompletionUsage (None gives an empty Usage)."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        return cls(
+            prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+            cached_prompt_tokens=getattr(details, "cached_tokens", None) or 0,
+        )
+
+    @classmethod
+    def from_anthropic(cls, usage: Any) -> "Usage":
+        """From an Anthropic Usage, whose input_tokens only counts the uncached remainder of the prompt."""
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", None) or 0
+        return cls(
+            prompt_tokens=(getattr(usage, "input_tokens", None) or 0) + cache_read + cache_creation,
+            completion_tokens=getattr(usage, "output_tokens", None) or 0,
+            cached_prompt_tokens=cache_read,
+        )
 
-    def add_usages(self, usage: dict):
+    def add_usages(self, usage: Union[dict, "Usage"]):
+        if isinstance(usage, Usage):
+            usage = usage.get_usages()
         self.prompt_tokens += usage.get("prompt_tokens", 0)
         self.completion_tokens += usage.get("completion_tokens", 0)
         self.embedding_tokens += usage.get("embedding_tokens", 0)
+        self.cached_prompt_tokens += usage.get("cached_prompt_tokens", 0)
 
     def get_usages(self):
         return {
             "prompt_tokens": self.prompt_tokens,
             "completion_tokens": self.completion_tokens,
             "embedding_tokens": self.embedding_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
             "total_tokens": self.prompt_tokens + self.completion_tokens
         }
     
@@ -1,6 +1,6 @@
-cot_user_prompt = """<context>{context_str}</context>
+cot_user_prompt = """<history_dialogue>{history}</history_dialogue>
 
-<history_dialogue>{history}</history_dialogue>
+<context>{context_str}</context>
 
 <question>{query_str}</question>
 
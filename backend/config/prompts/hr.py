@@ -38,8 +38,8 @@ If <context> lacks relevant information → Output: None
 If <context> contains relevant information → Answer naturally as the candidate
 </example>
 
-<context>{context_str}</context>
 <history_dialogue>{history}</history_dialogue>
+<context>{context_str}</context>
 <query>{query_str}</query>
 
 <answer>"""
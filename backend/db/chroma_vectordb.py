@@ -7,6 +7,7 @@ sys.path.append("../")
 
 from utils.app_logger import LoggerSetup
 
+import os
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Literal
 import chromadb
@@ -14,7 +15,8 @@ from chromadb.api.models.Collection import Collection
 
 logger = LoggerSetup("ChromaUsage").logger
 
-DEFAULT_CHROMA_DIR = Path(__file__).parent / ".chroma"
+# CHROMA_DIR points the app (or a benchmark) at another index
+DEFAULT_CHROMA_DIR = Path(os.getenv("CHROMA_DIR") or Path(__file__).parent / ".chroma")
 
 collection_name = "chat_cv"
 
@@ -25,13 +27,16 @@ class ChromaUsage:
         collection_name: str,
         persist_dir: Optional[str | Path] = None,
         auto_create: bool = True,
-        distance_fn: Literal["cosine", "l2", "ip"] = "cosine"
+        distance_fn: Literal["cosine", "l2", "ip"] = "cosine",
+        hnsw_params: Optional[Dict[str, int]] = None
     ):
         self.persist_dir = Path(persist_dir) if persist_dir else DEFAULT_CHROMA_DIR
         self.persist_dir.mkdir(parents=True, exist_ok=True)
         self.client = chromadb.PersistentClient(path=str(self.persist_dir))
         self.collection_name = collection_name
         self.distance_fn = distance_fn
+        # Index build / search settings for new collections, e.g. {"M": 16, "construction_ef": 100, "search_ef": 50}
+        self.hnsw_params = hnsw_params or {}
 
         self.collection = self.get_collection(collection_name)
         logger.info(f'Collection loaded: {self.collection}')
@@ -47,7 +52,7 @@ class ChromaUsage:
     def create_collection(self, collection_name: str) -> Collection:
         return self.client.create_collection(
             name=collection_name,
-            metadata={"hnsw:space": self.distance_fn}
+            metadata={"hnsw:space": self.distance_fn, **{f"hnsw:{k}": v for k, v in self.hnsw_params.items()}}
         )
 
     def get_data(self) -> dict[str, Any]:
@@ -107,7 +112,7 @@ class ChromaUsage:
             where_document: Optional full-text filter (e.g., {"$contains": "keyword"})
 
         Returns:
-            List of tuples: (document, metadata, distance)
+            List of tuples: (document, metadata, distance); metadata carries the chunk id as "doc_id"
         """
         results = self.collection.query(
             query_embeddings=query_embedding,
@@ -117,11 +122,15 @@ class ChromaUsage:
             include=["documents", "metadatas", "distances"]
         )
 
+        ids = results.get("ids", [[]])[0]
         docs = results.get("documents", [[]])[0]
         metas = results.get("metadatas", [[]])[0]
         dists = results.get("distances", [[]])[0]
 
-        return [(doc, meta, dist) for doc, meta, dist in zip(docs, metas, dists)]
+        return [
+            (doc, {**(meta or {}), "doc_id": doc_id}, dist)
+            for doc_id, doc, meta, dist in zip(ids, docs, metas, dists)
+        ]
 
     def list_all_collection_names(self) -> List[str]:
         collections = self.client.list_collections()
@@ -4,6 +4,7 @@ Evaluation module for ChatMyCV.
 Provides:
 - Custom LLM-as-Judge evaluation (faithfulness, relevance, citation)
 - Simple retrieval metrics (hit rate, MRR, P@K)
+- Retrieval-only evaluation and parameter sweep (retrieval_sweep.py)
 - RAGAS integration (optional)
 """
 
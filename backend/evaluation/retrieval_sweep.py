@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+Retrieval-only evaluation and index-parameter sweep.
+
+Scores retrieval against the test cases' expected_sources without generating
+answers or calling the LLM judge: each question is embedded once (and cached on
+disk, keyed by embedding provider), then every configuration in the grid is run
+over the whole test set.
+
+Grid dimensions:
+    backend        live    the app's collection as it is (production settings)
+                   exact   brute-force numpy search over the collection's vectors
+                   chroma  a temporary Chroma copy built with the given metric / HNSW settings
+    metric         cosine, l2, ip                         (exact, chroma)
+    hnsw M / ef    --hnsw-m, --hnsw-construction-ef, --hnsw-ef (search)   (chroma)
+    k, fetch       final k and candidates fetched per final document (RERANK_CANDIDATE_MULTIPLIER)
+    rerank         none, lexical, cross_encoder
+    hybrid weights dense:lexical:header weights of the lexical re-ranker
+
+Per configuration it reports recall@k, hit rate (share of expected sources
+found), MRR, nDCG@k and P@k - computed as array operations over all queries at
+once - next to per-query latency (search + re-rank, p50 / p95) and memory
+(index size, and RSS growth while building it).
+
+A chunk is relevant when an expected source name occurs in its header path
+(as in SimpleRetrievalMetrics). Recall and nDCG divide by min(relevant chunks, k),
+so a perfect top-k scores 1 even when a section has more chunks than k.
+Questions without expected_sources are left out of the averages.
+
+Usage:
+    python backend/evaluation/retrieval_sweep.py                       # production settings only
+    python backend/evaluation/retrieval_sweep.py --backend exact,chroma --metric cosine,l2,ip --k 3,5,10
+    python backend/evaluation/retrieval_sweep.py --backend chroma --hnsw-m 8,16,32 --hnsw-ef 10,50,200
+    python backend/evaluation/retrieval_sweep.py --rerank none,lexical --hybrid-weights 0.5:0.35:0.15,0.8:0.1:0.1
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import argparse
+import resource
+import tempfile
+import itertools
+from datetime import datetime
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db.chroma_vectordb import ChromaUsage
+from llm import embed_client
+from services.reranker import LexicalReranker, create_reranker
+from utils.app_logger import LoggerSetup
+from utils.async_bridge import get_async_bridge
+
+logger = LoggerSetup("RetrievalSweep").logger
+
+EVAL_DIR = Path(__file__).parent
+OUTPUT_DIR = EVAL_DIR / "results"
+CACHE_DIR = EVAL_DIR / ".cache"
+COLLECTIONS = {"en": "chat_cv_en", "zhtw": "chat_cv_zhtw"}
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+@dataclass
+class SweepGrid:
+    """Values to sweep; the defaults are the settings the app runs with."""
+    backends: List[str] = field(default_factory=lambda: ["live"])
+    metrics: List[str] = field(default_factory=lambda: ["cosine"])
+    ks: List[int] = field(default_factory=lambda: [5])
+    fetch_multipliers: List[int] = field(default_factory=lambda: [int(os.getenv("RERANK_CANDIDATE_MULTIPLIER", "4"))])
+    # Chroma's own defaults
+    hnsw_m: List[int] = field(default_factory=lambda: [16])
+    hnsw_construction_ef: List[int] = field(default_factory=lambda: [100])
+    hnsw_search_ef: List[int] = field(default_factory=lambda: [10])
+    rerankers: List[str] = field(default_factory=lambda: [os.getenv("RERANKER", "lexical").lower()])
+    hybrid_weights: List[Tuple[float, float, float]] = field(default_factory=lambda: [(0.5, 0.35, 0.15)])
+
+
+def source_label(metadata: Dict[str, Any]) -> str:
+    """Header path of a chunk ("Work Experience / Company"), or its filename."""
+    headers = [str(v) for k, v in sorted(metadata.items()) if k.startswith("Header_") and v]
+    return " / ".join(headers) or str(metadata.get("filename", ""))
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+
+
+def _dir_mb(path: Path) -> float:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) / 2**20
+
+
+# ---------------------------------------------------------------- inputs
+
+class QueryEmbeddingCache:
+    """
+    Query vectors on disk, keyed by question text, one file per embedding provider:
+    a sweep (and every later one) embeds each question once.
+    """
+
+    def __init__(self, path: Optional[Path] = None, refresh: bool = False):
+        self.path = path or CACHE_DIR / f"query_embeddings_{embed_client.provider}.json"
+        self._vectors: Dict[str, List[float]] = {}
+        if self.path.exists() and not refresh:
+            self._vectors = json.loads(self.path.read_text(encoding="utf-8"))
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        missing = [t for t in dict.fromkeys(texts) if self._key(t) not in self._vectors]
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start:start + EMBED_BATCH_SIZE]
+            vectors = embed_client.embed(batch)
+            if inspect.isawaitable(vectors):
+                vectors = get_async_bridge().run(vectors)
+            self._vectors.update({self._key(t): list(map(float, v)) for t, v in zip(batch, vectors)})
+        if missing:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self._vectors), encoding="utf-8")
+            logger.info(f"Embedded {len(missing)} new queries, cache: {self.path}")
+        return np.asarray([self._vectors[self._key(t)] for t in texts], dtype=np.float32)
+
+
+@dataclass
+class Corpus:
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    embeddings: np.ndarray
+
+    @classmethod
+    def load(cls, store: ChromaUsage) -> "Corpus":
+        data = store.collection.get(include=["documents", "metadatas", "embeddings"])
+        if not len(data["ids"]):
+            raise ValueError(f'Collection "{store.collection_name}" is empty; index the CV first')
+        return cls(
+            ids=list(data["ids"]),
+            documents=list(data["documents"]),
+            metadatas=[m or {} for m in data["metadatas"]],
+            embeddings=np.asarray(data["embeddings"], dtype=np.float32),
+        )
+
+
+class RelevanceTable:
+    """
+    Which corpus chunks are relevant to which query, as arrays.
+
+    match[u, d] says whether unique expected source u occurs in chunk d's label;
+    slots[q, s] indexes the s-th expected source of query q into match, padded
+    with an all-False row. Retrieved results use index N (one past the corpus)
+    for "no result", also all-False.
+    """
+
+    def __init__(self, expected: List[List[str]], labels: List[str]):
+        sources = sorted({s for sources in expected for s in sources})
+        index = {s: i for i, s in enumerate(sources)}
+        lowered = [label.lower() for label in labels]
+        self.n_docs = len(labels)
+        self.match = np.zeros((len(sources) + 1, self.n_docs + 1), dtype=bool)
+        for i, source in enumerate(sources):
+            self.match[i, :self.n_docs] = [source.lower() in label for label in lowered]
+        width = max([len(s) for s in expected] + [1])
+        self.slots = np.full((len(expected), width), len(sources), dtype=np.int64)
+        for q, query_sources in enumerate(expected):
+            self.slots[q, :len(query_sources)] = [index[s] for s in query_sources]
+        self.slot_mask = self.slots != len(sources)
+        self.valid = self.slot_mask.any(axis=1)
+        # Relevant chunks per query in the whole corpus
+        self.n_relevant = self.match[self.slots][:, :, :self.n_docs].any(axis=1).sum(axis=1)
+
+    def scores(self, ranked: np.ndarray) -> Dict[str, float]:
+        """Mean metrics over the valid queries for ranked[q, rank] = corpus index (N = no result)."""
+        k = ranked.shape[1]
+        # [queries, expected sources, ranks]
+        slot_hits = self.match[self.slots[:, :, None], ranked[:, None, :]]
+        relevant = slot_hits.any(axis=1)
+        found = relevant.sum(axis=1)
+        ideal_n = np.minimum(self.n_relevant, k)
+
+        hit_rate = (slot_hits.any(axis=2) & self.slot_mask).sum(axis=1) / np.maximum(self.slot_mask.sum(axis=1), 1)
+        first = relevant.argmax(axis=1)
+        mrr = np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+        recall = np.where(ideal_n > 0, found / np.maximum(ideal_n, 1), 0.0)
+        discounts = 1.0 / np.log2(np.arange(2, k + 2))
+        dcg = (relevant * discounts).sum(axis=1)
+        idcg = np.concatenate([[0.0], np.cumsum(discounts)])[ideal_n]
+        ndcg = np.where(idcg > 0, dcg / np.where(idcg > 0, idcg, 1.0), 0.0)
+        precision = found / k
+
+        valid = self.valid
+        return {
+            "recall": float(recall[valid].mean()) if valid.any() else 0.0,
+            "hit_rate": float(hit_rate[valid].mean()) if valid.any() else 0.0,
+            "mrr": float(mrr[valid].mean()) if valid.any() else 0.0,
+            "ndcg": float(ndcg[valid].mean()) if valid.any() else 0.0,
+            "precision": float(precision[valid].mean()) if valid.any() else 0.0,
+        }
+
+
+# ---------------------------------------------------------------- backends
+# search(vector, n) -> [(corpus index, distance)], nearest first
+
+class ExactIndex:
+    """Brute-force search with Chroma's distance definitions (cosine: 1 - cos, l2: squared, ip: 1 - dot)."""
+
+    def __init__(self, corpus: Corpus, metric: str):
+        self.metric = metric
+        matrix = corpus.embeddings
+        if metric == "cosine":
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.matrix = np.ascontiguousarray(matrix)
+        self.sq_norms = (self.matrix ** 2).sum(axis=1)
+        self.index_mb = self.matrix.nbytes / 2**20
+
+    def search(self, vector: np.ndarray, n: int) -> List[Tuple[int, float]]:
+        if self.metric == "cosine":
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+            distances = 1.0 - self.matrix @ vector
+        elif self.metric == "ip":
+            distances = 1.0 - self.matrix @ vector
+        else:
+            distances = self.sq_norms - 2.0 * (self.matrix @ vector) + float(vector @ vector)
+        n = min(n, len(distances))
+        top = np.argpartition(distances, n - 1)[:n]
+        top = top[np.argsort(distances[top])]
+        return [(int(i), float(distances[i])) for i in top]
+
+    def close(self) -> None:
+        pass
+
+
+class ChromaIndex:
+    """A Chroma collection queried through ChromaUsage.query_collection, as the app does."""
+
+    def __init__(self, store: ChromaUsage, corpus: Corpus, owned_dir: Optional[Path] = None):
+        self.store = store
+        self.positions = {doc_id: i for i, doc_id in enumerate(corpus.ids)}
+        self.owned_dir = owned_dir
+        self.metric = (store.collection.metadata or {}).get("hnsw:space", "l2")
+        self.index_mb = _dir_mb(owned_dir or store.persist_dir)
+
+    @classmethod
+    def build(cls, corpus: Corpus, metric: str, hnsw_params: Dict[str, int], work_dir: Path) -> "ChromaIndex":
+        directory = Path(tempfile.mkdtemp(prefix="index_", dir=work_dir))
+        store = ChromaUsage(collection_name="retrieval_sweep", persist_dir=directory, distance_fn=metric, hnsw_params=hnsw_params)
+        for start in range(0, len(corpus.ids), 1000):
+            end = start + 1000
+            store.collection.add(
+                ids=corpus.ids[start:end],
+                documents=corpus.documents[start:end],
+                metadatas=corpus.metadatas[start:end],
+                embeddings=corpus.embeddings[start:end].tolist(),
+            )
+        return cls(store, corpus, directory)
+
+    def search(self, vector: np.ndarray, n: int) -> List[Tuple[int, float]]:
+        results = self.store.query_collection(vector.tolist(), k=min(n, len(self.positions)))
+        return [(self.positions[meta["doc_id"]], float(distance)) for _, meta, distance in results]
+
+    def close(self) -> None:
+        if self.owned_dir:
+            shutil.rmtree(self.owned_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------- sweep
+
+def _rerank_configs(grid: SweepGrid) -> List[Tuple[str, Optional[Tuple[float, float, float]]]]:
+    configs = []
+    for name in grid.rerankers:
+        if name == "lexical":
+            configs.extend(("lexical", weights) for weights in grid.hybrid_weights)
+        else:
+            configs.append((name, None))
+    return configs
+
+
+def _index_configs(grid: SweepGrid) -> List[Tuple[str, Optional[str], Dict[str, int]]]:
+    configs = []
+    for backend in grid.backends:
+        if backend == "live":
+            configs.append((backend, None, {}))
+        elif backend == "exact":
+            configs.extend((backend, metric, {}) for metric in grid.metrics)
+        elif backend == "chroma":
+            for metric, m, construction_ef, search_ef in itertools.product(
+                grid.metrics, grid.hnsw_m, grid.hnsw_construction_ef, grid.hnsw_search_ef
+            ):
+                configs.append((backend, metric, {"M": m, "construction_ef": construction_ef, "search_ef": search_ef}))
+        else:
+            raise ValueError(f"Unknown backend: {backend}. Available backends: live, exact, chroma")
+    return configs
+
+
+def run_sweep(test_cases_path: Path, language: str, grid: SweepGrid, refresh_embeddings: bool = False) -> Dict[str, Any]:
+    """Run every configuration of the grid over the test set and return metadata and one row per configuration."""
+    with open(test_cases_path, "r", encoding="utf-8") as f:
+        test_cases = json.load(f).get("test_cases", [])
+    questions = [tc["question"] for tc in test_cases]
+    expected = [tc.get("expected_sources", []) for tc in test_cases]
+
+    live_store = ChromaUsage(collection_name=COLLECTIONS[language], auto_create=False)
+    if live_store.collection is None:
+        raise ValueError(f'Collection "{COLLECTIONS[language]}" not found; index the CV first')
+    corpus = Corpus.load(live_store)
+    relevance = RelevanceTable(expected, [source_label(m) for m in corpus.metadatas])
+    query_vectors = QueryEmbeddingCache(refresh=refresh_embeddings).embed(questions)
+    logger.info(f"{len(questions)} queries, {len(corpus.ids)} chunks, {int(relevance.valid.sum())} queries with expected sources")
+
+    rerank_configs = _rerank_configs(grid)
+    model_rerankers = {config: create_reranker(config[0]) for config in rerank_configs if config[0] != "lexical"}
+
+    rows = []
+    work_dir = Path(tempfile.mkdtemp(prefix="retrieval_sweep_"))
+    try:
+        for backend, metric, hnsw_params in _index_configs(grid):
+            rss_before = _rss_mb()
+            start = time.perf_counter()
+            if backend == "live":
+                index = ChromaIndex(live_store, corpus)
+            elif backend == "exact":
+                index = ExactIndex(corpus, metric)
+            else:
+                index = ChromaIndex.build(corpus, metric, hnsw_params, work_dir)
+            build_seconds = time.perf_counter() - start
+            rss_growth = max(0.0, _rss_mb() - rss_before)
+            # The lexical re-ranker turns distances into similarities with the index's metric
+            rerankers = {
+                (name, weights): LexicalReranker(*weights, metric=index.metric) if name == "lexical"
+                else model_rerankers[(name, weights)]
+                for name, weights in rerank_configs
+            }
+
+            for k, multiplier in itertools.product(grid.ks, grid.fetch_multipliers):
+                fetch_k = max(k, k * multiplier)
+                candidates, search_ms = [], np.zeros(len(questions))
+                for q, vector in enumerate(query_vectors):
+                    start = time.perf_counter()
+                    candidates.append(index.search(vector, fetch_k))
+                    search_ms[q] = (time.perf_counter() - start) * 1000
+
+                for (name, weights), reranker in rerankers.items():
+                    ranked = np.full((len(questions), k), relevance.n_docs, dtype=np.int64)
+                    latency_ms = search_ms.copy()
+                    for q, hits in enumerate(candidates):
+                        top = [i for i, _ in hits]
+                        if reranker is not None and hits:
+                            start = time.perf_counter()
+                            scores = reranker.score(questions[q], [(corpus.documents[i], corpus.metadatas[i], d) for i, d in hits])
+                            # Stable, like Reranker.rerank: ties keep the vector store's order
+                            top = [top[j] for j in np.argsort(-np.asarray(scores), kind="stable")]
+                            latency_ms[q] += (time.perf_counter() - start) * 1000
+                        ranked[q, :min(k, len(top))] = top[:k]
+
+                    rows.append({
+                        "backend": backend,
+                        "metric": metric or index.metric,
+                        "hnsw": hnsw_params or None,
+                        "k": k,
+                        "fetch_k": fetch_k,
+                        "rerank": name,
+                        "hybrid_weights": list(weights) if weights else None,
+                        **{m: round(v, 4) for m, v in relevance.scores(ranked).items()},
+                        "latency_p50_ms": round(float(np.percentile(latency_ms, 50)), 3),
+                        "latency_p95_ms": round(float(np.percentile(latency_ms, 95)), 3),
+                        "index_mb": round(index.index_mb, 2),
+                        "build_rss_mb": round(rss_growth, 2),
+                        "build_seconds": round(build_seconds, 3),
+                    })
+            index.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "language": language,
+            "test_cases_file": str(test_cases_path),
+            "queries": len(questions),
+            "queries_with_expected_sources": int(relevance.valid.sum()),
+            "corpus_chunks": len(corpus.ids),
+            "embed_provider": embed_client.provider,
+            "grid": asdict(grid),
+        },
+        "results": rows,
+    }
+
+
+def print_results(results: Dict[str, Any], sort_by: str = "ndcg") -> None:
+    meta = results["metadata"]
+    rows = sorted(results["results"], key=lambda r: (-r[sort_by], r["latency_p50_ms"]))
+    print("\n" + "=" * 132)
+    print(f"RETRIEVAL SWEEP ({meta['language']}): {meta['queries']} queries "
+          f"({meta['queries_with_expected_sources']} with expected sources), {meta['corpus_chunks']} chunks, "
+          f"embeddings: {meta['embed_provider']}")
+    print("=" * 132)
+    print(f"{'backend':<8}{'metric':<8}{'M/efC/ef':<12}{'k':>3}{'fetch':>6}  {'rerank':<22}"
+          f"{'recall':>7}{'hit':>7}{'MRR':>7}{'nDCG':>7}{'P@k':>7}{'p50 ms':>9}{'p95 ms':>9}{'idx MB':>8}{'+RSS MB':>9}")
+    print("-" * 132)
+    for r in rows:
+        hnsw = "/".join(str(r["hnsw"][p]) for p in ("M", "construction_ef", "search_ef")) if r["hnsw"] else "-"
+        rerank = r["rerank"] + (":" + ":".join(f"{w:g}" for w in r["hybrid_weights"]) if r["hybrid_weights"] else "")
+        print(f"{r['backend']:<8}{r['metric']:<8}{hnsw:<12}{r['k']:>3}{r['fetch_k']:>6}  {rerank:<22}"
+              f"{r['recall']:>7.3f}{r['hit_rate']:>7.3f}{r['mrr']:>7.3f}{r['ndcg']:>7.3f}{r['precision']:>7.3f}"
+              f"{r['latency_p50_ms']:>9.2f}{r['latency_p95_ms']:>9.2f}{r['index_mb']:>8.2f}{r['build_rss_mb']:>9.2f}")
+    print("=" * 132)
+
+
+def save_results(results: Dict[str, Any], output_path: Optional[Path] = None) -> Path:
+    if output_path is None:
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        output_path = OUTPUT_DIR / f"retrieval_{results['metadata']['language']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    logger.info(f"Results saved to: {output_path}")
+    print(f"\nResults saved to: {output_path}")
+    return output_path
+
+
+def _list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v.strip()]
+
+
+def _weights(value: str) -> List[Tuple[float, float, float]]:
+    weights = []
+    for item in value.split(","):
+        parts = tuple(float(w) for w in item.split(":"))
+        if len(parts) != 3:
+            raise argparse.ArgumentTypeError(f"expected dense:lexical:header, got {item!r}")
+        weights.append(parts)
+    return weights
+
+
+def main():
+    defaults = SweepGrid()
+    parser = argparse.ArgumentParser(description="Retrieval-only evaluation and parameter sweep")
+    parser.add_argument("--language", "-l", choices=["en", "zhtw"], default="en")
+    parser.add_argument("--test-cases", "-t", type=Path, default=EVAL_DIR / "test_cases.json")
+    parser.add_argument("--output", "-o", type=Path, default=None)
+    parser.add_argument("--backend", type=_list(str), default=defaults.backends, help="live, exact, chroma")
+    parser.add_argument("--metric", type=_list(str), default=defaults.metrics, help="cosine, l2, ip (exact / chroma)")
+    parser.add_argument("--k", type=_list(int), default=defaults.ks)
+    parser.add_argument("--fetch-multiplier", type=_list(int), default=defaults.fetch_multipliers,
+                        help="Candidates fetched per final document before re-ranking")
+    parser.add_argument("--hnsw-m", type=_list(int), default=defaults.hnsw_m)
+    parser.add_argument("--hnsw-construction-ef", type=_list(int), default=defaults.hnsw_construction_ef)
+    parser.add_argument("--hnsw-ef", type=_list(int), default=defaults.hnsw_search_ef, help="Search ef")
+    parser.add_argument("--rerank", type=_list(str), default=defaults.rerankers, help="none, lexical, cross_encoder")
+    parser.add_argument("--hybrid-weights", type=_weights, default=defaults.hybrid_weights,
+                        help="dense:lexical:header weights of the lexical re-ranker, comma separated")
+    parser.add_argument("--sort", choices=["ndcg", "recall", "mrr", "hit_rate"], default="ndcg")
+    parser.add_argument("--refresh-embeddings", action="store_true", help="Re-embed the questions (after changing the embedding model)")
+    args = parser.parse_args()
+
+    grid = SweepGrid(
+        backends=args.backend,
+        metrics=args.metric,
+        ks=args.k,
+        fetch_multipliers=args.fetch_multiplier,
+        hnsw_m=args.hnsw_m,
+        hnsw_construction_ef=args.hnsw_construction_ef,
+        hnsw_search_ef=args.hnsw_ef,
+        rerankers=args.rerank,
+        hybrid_weights=args.hybrid_weights,
+    )
+    results = run_sweep(args.test_cases, args.language, grid, refresh_embeddings=args.refresh_embeddings)
+    print_results(results, sort_by=args.sort)
+    save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
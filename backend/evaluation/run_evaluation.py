@@ -9,9 +9,13 @@ Runs comprehensive evaluation using:
 2. Simple retrieval metrics (hit rate, MRR, P@K)
 3. RAGAS metrics (optional, if installed)
 
+--retrieval-only skips generation and the LLM judge and scores retrieval alone
+with the app's settings (retrieval_sweep.py sweeps other settings).
+
 Usage:
     python backend/evaluation/run_evaluation.py --language en
     python backend/evaluation/run_evaluation.py --language zhtw --use-ragas
+    python backend/evaluation/run_evaluation.py --retrieval-only
 """
 
 import sys
@@ -236,8 +240,21 @@ def main():
         default=None,
         help="Output path for results"
     )
+    parser.add_argument(
+        "--retrieval-only",
+        action="store_true",
+        help="Score retrieval only (no generation, no LLM judge)"
+    )
     args = parser.parse_args()
 
+    if args.retrieval_only:
+        from backend.evaluation.retrieval_sweep import SweepGrid, run_sweep, print_results, save_results
+
+        results = run_sweep(args.test_cases, args.language, SweepGrid())
+        print_results(results)
+        save_results(results, args.output)
+        return
+
     asyncio.run(run_evaluation(
         test_cases_path=args.test_cases,
         language=args.language,
@@ -7,6 +7,9 @@ from .base import LLM
 from .azure_module import AzureOpenaiLLM
 from .openai_module import OpenAILLM
 from .claude_module import ClaudeLLM
+from .failover_module import FailoverLLM
+from .stub_module import StubLLM
+from .cassette_module import RecordingLLM, ReplayLLM
 # from .gemini_module import GeminiLLM
 
 load_dotenv()
@@ -17,6 +20,10 @@ LLM_PROVIDERS = {
     "openai": OpenAILLM,
     "claude": ClaudeLLM,
     # "gemini": GeminiLLM,
+    "failover": FailoverLLM,  # ordered FAILOVER_PROVIDERS with circuit breakers / hedging
+    "stub": StubLLM,  # offline, synthetic answers with STUB_* latency / error models
+    "record": RecordingLLM,  # CASSETTE_PROVIDER, with every call saved to CASSETTE_PATH
+    "replay": ReplayLLM,  # answers from CASSETTE_PATH with the recorded pacing
 }
 
 # Providers that support embedding
@@ -24,6 +31,9 @@ EMBED_PROVIDERS = {
     "azure": AzureOpenaiLLM,
     "openai": OpenAILLM,
     # "gemini": GeminiLLM,
+    "stub": StubLLM,  # deterministic hash embeddings
+    "record": RecordingLLM,  # CASSETTE_EMBED_PROVIDER, recorded
+    "replay": ReplayLLM,
 }
 
 
@@ -33,7 +43,7 @@ def create_llm_client(provider: Optional[str] = None, **kwargs) -> LLM:
 
     Args:
         provider: LLM provider name. If not specified, uses LLM_PROVIDER env var.
-                  Options: azure, openai, claude, gemini
+                  Options: azure, openai, claude, gemini, failover, stub, record, replay
 
     Returns:
         LLM instance
@@ -56,7 +66,7 @@ def create_embed_client(provider: Optional[str] = None, **kwargs) -> LLM:
 
     Args:
         provider: Embedding provider name. If not specified, uses EMBED_PROVIDER env var.
-                  Options: azure, openai, gemini (claude not supported)
+                  Options: azure, openai, gemini, stub, record, replay (claude not supported)
 
     Returns:
         LLM instance with embedding support
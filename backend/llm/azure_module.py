@@ -1,7 +1,11 @@
 import sys
 sys.path.append("./")
 
+from component.base import Usage
 from .base import LLM
+from .prompt_cache import record_prompt_cache
+from .rate_limiter import estimate_chat_tokens, estimate_tokens
+from utils.app_logger import LoggerSetup
 
 from openai import AzureOpenAI, AsyncAzureOpenAI
 from typing import Optional
@@ -28,6 +32,16 @@ import time
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = LoggerSetup("AzureOpenaiLLM").logger
+
+# Ask for usage on streams (stream_options.include_usage); API versions before 2024-09-01 reject it,
+# so by default it follows AZURE_OPENAI_API_VERSION
+AZURE_OPENAI_STREAM_USAGE = (
+    os.getenv("AZURE_OPENAI_STREAM_USAGE")
+    or str(os.getenv("AZURE_OPENAI_API_VERSION", "")[:10] >= "2024-09-01")
+).lower() == "true"
+
+
 class AzureOpenaiLLM(LLM):
     def __init__(self, temperature: float = 0.7, max_tokens: Optional[int] = None, timeout: Optional[int] = None, provider: Optional[str] = None, **kwargs):
         super().__init__(temperature, max_tokens, timeout, provider, **kwargs)
@@ -43,7 +57,7 @@ class AzureOpenaiLLM(LLM):
         # Skip warmup on Streamlit Cloud - it causes event loop conflicts
         # because the client binds to one loop during warmup but uses another at runtime
         if _is_streamlit_cloud:
-            print("[AzureOpenaiLLM] Warmup skipped on Streamlit Cloud")
+            logger.info("Warmup skipped on Streamlit Cloud")
             return
 
         try:
@@ -57,7 +71,7 @@ class AzureOpenaiLLM(LLM):
                 asyncio.run(self._warmup_embed_and_chat())
             else:
                 # Skip warmup if no safe way to run it
-                print(f"[AzureOpenaiLLM] Warmup skipped: no event loop available")
+                logger.info("Warmup skipped: no event loop available")
 
     def _create_client(self) -> AzureOpenAI:
 
@@ -65,6 +79,8 @@ class AzureOpenaiLLM(LLM):
             api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
             azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE"),
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            timeout=self.request_timeout,
+            max_retries=0,  # retried in llm/resilience.py
         )
 
         return client
@@ -75,6 +91,8 @@ class AzureOpenaiLLM(LLM):
             api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
             azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE"),
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            timeout=self.request_timeout,
+            max_retries=0,  # retried in llm/resilience.py
         )
 
         return client
@@ -85,11 +103,11 @@ class AzureOpenaiLLM(LLM):
             emb_result = await self.embed(["hi"])
             # Test chat
             chat_result = await self.chat(prompt="hi")
-            print(f"[AzureOpenaiLLM] Warm-up successfully.")
+            logger.info("Warm-up successfully.")
         except Exception as e:
-            print(f"[AzureOpenaiLLM] Warm-up failed: {e}")
+            logger.warning(f"Warm-up failed: {e}")
     
-    def chat(self, prompt: str = "", system_prompt: str = "", messages: Optional[list[dict[str, str]]] = None, temperature: Optional[float] = None, engine: str="", max_tokens: Optional[int] = None) -> Optional[str]:
+    def chat(self, prompt: str = "", system_prompt: str = "", messages: Optional[list[dict[str, str]]] = None, temperature: Optional[float] = None, engine: str="", max_tokens: Optional[int] = None, stop: Optional[list[str]] = None, timeout: Optional[float] = None) -> Optional[str]:
         
         if not messages:
             messages = []
@@ -98,16 +116,28 @@ class AzureOpenaiLLM(LLM):
             if prompt:
                 messages.append({"role": "user", "content": prompt})
         
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        self._throttle("chat", estimated_tokens)
         response = self._client.chat.completions.create(
             model=engine or os.getenv("AZURE_OPENAI_LLM_ENGINE"),
             messages=messages,
             temperature=temperature or self.temperature,  # 值越低则输出文本随机性越低
             max_tokens=self.max_tokens,
+            **({"stop": stop} if stop else {}),
+            **({"timeout": timeout} if timeout else {}),
         )
+        self._settle("chat", estimated_tokens, getattr(response.usage, "total_tokens", None))
+
+        return {"content": response.choices[0].message.content, "usage": self._usage(response.usage)}
 
-        return {"content": response.choices[0].message.content, "usage": response.usage}
+    def _usage(self, sdk_usage) -> Usage:
+        usage = Usage.from_openai(sdk_usage)
+        # Azure caches long prompt prefixes automatically; nothing to send, only to count
+        if sdk_usage is not None:
+            record_prompt_cache(self.provider, usage)
+        return usage
 
-    async def stream(self, prompt: str = "", system_prompt: str = "", messages: Optional[list[dict[str, str]]] = None, temperature: Optional[float] = None, engine: str="", max_tokens: Optional[int] = None):
+    async def stream(self, prompt: str = "", system_prompt: str = "", messages: Optional[list[dict[str, str]]] = None, temperature: Optional[float] = None, engine: str="", max_tokens: Optional[int] = None, stop: Optional[list[str]] = None, usage: Optional[Usage] = None):
 
         if not messages:
             messages = []
@@ -116,7 +146,12 @@ class AzureOpenaiLLM(LLM):
             if prompt:
                 messages.append({"role": "user", "content": prompt})
 
-        print(f"[AzureOpenaiLLM.stream] Starting API call...")
+        logger.debug("Starting stream API call...")
+        response = None
+        reported = None
+        streamed_tokens = 0
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        await self._athrottle("chat", estimated_tokens)
         try:
             response = await self._aclient.chat.completions.create(
                 model=engine or os.getenv("AZURE_OPENAI_LLM_ENGINE"),
@@ -124,40 +159,55 @@ class AzureOpenaiLLM(LLM):
                 temperature=temperature or self.temperature,  # 值越低则输出文本随机性越低
                 max_tokens=self.max_tokens,
                 stream=True,
+                # The last chunk then carries usage and no choices
+                **({"stream_options": {"include_usage": True}} if AZURE_OPENAI_STREAM_USAGE else {}),
+                **({"stop": stop} if stop else {}),
             )
-            print(f"[AzureOpenaiLLM.stream] API call successful, starting to iterate chunks...")
+            logger.debug("Stream API call successful, starting to iterate chunks...")
 
             async for chunk in response:
+                if getattr(chunk, "usage", None):
+                    reported = self._report_usage(usage, self._usage(chunk.usage))
                 if not chunk.choices:
                     continue
                 content = chunk.choices[0].delta.content or ""
                 if content:
+                    streamed_tokens += estimate_tokens(content)
                     yield content
 
-            print(f"[AzureOpenaiLLM.stream] Stream completed.")
+            logger.debug("Stream completed.")
         except Exception as e:
-            print(f"[AzureOpenaiLLM.stream] Error: {e}")
+            logger.error(f"Stream error: {e}")
             raise
+        finally:
+            # Runs on normal completion and when the consumer closes the generator early
+            self._settle_stream(estimated_tokens, messages, streamed_tokens, reported)
+            if response is not None:
+                await response.close()
 
-    def embed(self, input_texts: list[str] | str, engine: str = "", dimensions: int = 1536, **kwargs) -> list[list[float]]:
+    def embed(self, input_texts: list[str] | str, engine: str = "", dimensions: int = 1536, usage: Optional[Usage] = None, **kwargs) -> list[list[float]]:
         """
         Generate embeddings for a list of input texts.
 
         Args:
             input_texts (list[str] or str): List of strings to embed.
             engine (str, optional): Embedding engine/model to use. If not provided, uses OPENAI_EMBEDDING_ENGINE env var.
+            usage (Usage, optional): Accumulator the embedding tokens are added to.
 
         Returns:
             list[list[float]]: List of embedding vectors.
         """
-        t = time.time()
+        estimated_tokens = estimate_tokens(input_texts)
+        self._throttle("embed", estimated_tokens)
         embeddings = self._embed_client.embeddings.create(
             input=input_texts,
             model=os.getenv("AZURE_OPENAI_EMBED_ENGINE") or engine,
             dimensions=dimensions,
-            timeout=kwargs.get("timeout", None)
+            **({"timeout": kwargs["timeout"]} if kwargs.get("timeout") else {}),
         )
-        print(f"\n(azure openai embedding spent {time.time()-t:.3f} sec)")
+        reported = getattr(embeddings.usage, "total_tokens", None)
+        self._settle("embed", estimated_tokens, reported)
+        self._report_usage(usage, Usage(embedding_tokens=reported or estimated_tokens))
 
         return [ele.embedding for ele in embeddings.data]
 
@@ -1,7 +1,20 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Iterator, List, Union
 
+from component.base import Usage
+from .rate_limiter import estimate_prompt_tokens, get_rate_limiter
+from .resilience import LLM_REQUEST_TIMEOUT_SECONDS, resilient
+
 class LLM(ABC):
+    # Methods wrapped with retries / deadline handling (llm/resilience.py) in every subclass
+    RESILIENT_METHODS = ("chat", "stream", "embed")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls.RESILIENT_METHODS:
+            fn = cls.__dict__.get(name)
+            if fn is not None and not getattr(fn, "_resilient", False):
+                setattr(cls, name, resilient(fn, name))
 
     def __init__(
         self,
@@ -22,6 +35,43 @@ class LLM(ABC):
     def _create_client(self):
         pass
 
+    @property
+    def request_timeout(self) -> float:
+        """Per-attempt HTTP timeout for the provider SDK clients."""
+        return self.timeout or LLM_REQUEST_TIMEOUT_SECONDS
+
+    def _throttle(self, kind: str, tokens: int) -> None:
+        """Block until this provider's RPM/TPM budget for `kind` ("chat" / "embed") allows the call."""
+        get_rate_limiter(self.provider, kind).acquire(tokens)
+
+    async def _athrottle(self, kind: str, tokens: int) -> None:
+        """Async variant of _throttle."""
+        await get_rate_limiter(self.provider, kind).aacquire(tokens)
+
+    def _settle(self, kind: str, estimated: int, actual: Optional[int]) -> None:
+        """Correct the TPM budget with the token count the provider reported."""
+        get_rate_limiter(self.provider, kind).settle(estimated, actual)
+
+    def _settle_stream(
+        self, estimated: int, messages: List[dict], streamed_tokens: int, reported: Optional[Usage]
+    ) -> None:
+        """
+        Settle a stream's chat reservation once it ends, however it ends: with the usage the
+        provider reported, or else the prompt estimate plus the tokens streamed so far.
+        """
+        if reported is not None:
+            actual = reported.prompt_tokens + reported.completion_tokens
+        else:
+            actual = estimate_prompt_tokens(messages) + streamed_tokens
+        self._settle("chat", estimated, actual)
+
+    @staticmethod
+    def _report_usage(sink: Optional[Usage], usage: Usage) -> Usage:
+        """Add one call's usage to the caller's accumulator, if it passed one."""
+        if sink is not None:
+            sink.add_usages(usage)
+        return usage
+
     @abstractmethod
     async def chat(
         self,
@@ -29,8 +79,13 @@ class LLM(ABC):
         system_prompt: str = "",
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None,
         **kwargs
-    ) -> Optional[str]:
+    ) -> Optional[dict]:
+        """
+        Generate a completion. Generation halts at any of the `stop` sequences.
+        Returns {"content": str, "usage": Usage}.
+        """
         pass
 
     @abstractmethod
@@ -40,15 +95,23 @@ class LLM(ABC):
         system_prompt: str = "",
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        usage: Optional[Usage] = None,
         **kwargs
     ) -> Iterator[str]:
+        """
+        Stream a completion. Generation halts at any of the `stop` sequences, and
+        closing the generator early (aclose) closes the upstream HTTP stream.
+        The provider-reported usage is added to `usage` once the stream completes.
+        """
         pass
 
     @abstractmethod
     async def embed(
         self,
         input_texts: Union[List[str], str],
+        usage: Optional[Usage] = None,
         **kwargs
     ) -> List[List[float]]:
-        """Generate embeddings for input texts."""
+        """Generate embeddings for input texts; their embedding tokens are added to `usage`."""
         pass
\ No newline at end of file
@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from component.base import Usage
+from .base import LLM
+from utils.app_logger import LoggerSetup
+
+logger = LoggerSetup("Cassette").logger
+
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "./cassettes/default.jsonl")
+# Replayed delays are multiplied by this: 1 = original pacing, 0 = as fast as possible
+CASSETTE_TIME_SCALE = float(os.getenv("CASSETTE_TIME_SCALE", "1.0"))
+
+# Request arguments that change the reply, and so belong in the cassette key
+_GENERATE_KEY_ARGS = ("stop", "max_tokens", "model", "engine")
+_EMBED_KEY_ARGS = ("model", "engine", "dimensions")
+
+
+class CassetteMiss(LookupError):
+    """The replayed cassette has no recording for this request."""
+
+
+def _messages(prompt: str, system_prompt: str, messages: Optional[List[dict]]) -> List[dict]:
+    if messages:
+        return messages
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    if prompt:
+        messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def cassette_key(kind: str, payload: Dict[str, Any]) -> str:
+    """
+    Key of a request: kind ("generate" / "embed") plus what was asked. chat and stream
+    share the "generate" kind, so either kind of recording can serve both.
+    """
+    blob = json.dumps({"kind": kind, **payload}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _generate_payload(prompt, system_prompt, messages, kwargs) -> Dict[str, Any]:
+    return {
+        "messages": [
+            {"role": m.get("role"), "content": m.get("content")} for m in _messages(prompt, system_prompt, messages)
+        ],
+        **{name: kwargs.get(name) for name in _GENERATE_KEY_ARGS if kwargs.get(name) is not None},
+    }
+
+
+def _embed_payload(input_texts, kwargs) -> Dict[str, Any]:
+    texts = [input_texts] if isinstance(input_texts, str) else list(input_texts)
+    return {"input": texts, **{name: kwargs.get(name) for name in _EMBED_KEY_ARGS if kwargs.get(name) is not None}}
+
+
+def _usage_from(data: Optional[Dict[str, int]]) -> Usage:
+    usage = Usage()
+    if data:
+        usage.add_usages(data)
+    return usage
+
+
+async def _call(fn, *args, **kwargs):
+    """Await an async provider method, or run a sync one off the event loop."""
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args, **kwargs)
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+class _CassetteWriter:
+    """Appends recordings to one cassette file; shared by every recorder writing to that path."""
+
+    _writers: Dict[Path, "_CassetteWriter"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path: Union[str, Path]) -> "_CassetteWriter":
+        path = Path(path)
+        with cls._lock:
+            writer = cls._writers.get(path)
+            if writer is None:
+                writer = cls._writers[path] = cls(path)
+            return writer
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class Cassette:
+    """
+    Recordings loaded from a cassette file, by key. A key recorded several times
+    is replayed in recording order, wrapping around.
+    """
+
+    _loaded: Dict[Path, "Cassette"] = {}
+    _load_lock = threading.Lock()
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        logger.info(f"Loaded {sum(map(len, self._entries.values()))} recordings from {self.path}")
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Cassette":
+        path = Path(path)
+        with cls._load_lock:
+            cassette = cls._loaded.get(path)
+            if cassette is None:
+                cassette = cls._loaded[path] = cls(path)
+            return cassette
+
+    def next(self, key: str, description: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recording in {self.path} for {description}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return entries[index % len(entries)]
+
+
+class RecordingLLM(LLM):
+    """
+    Wraps real providers and appends every successful call to a cassette file
+    (CASSETTE_PATH, JSONL): the request, the reply, usage, and its timing - total
+    time for chat / embed, and each chunk's offset from the call for streams.
+
+    The wrapped clients are `inner` when given, otherwise created on first use from
+    CASSETTE_PROVIDER (chat / stream) and CASSETTE_EMBED_PROVIDER (embed), so one
+    recorder can serve as both llm_client and embed_client.
+    """
+
+    # The wrapped providers retry on their own
+    RESILIENT_METHODS = ()
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[int] = None,
+        provider: Optional[str] = None,
+        inner: Optional[LLM] = None,
+        path: Optional[str] = None,
+        **kwargs
+    ):
+        super().__init__(temperature, max_tokens, timeout, provider, **kwargs)
+        self._inner = {"generate": inner, "embed": inner}
+        self._inner_kwargs = {"temperature": temperature, "max_tokens": max_tokens, "timeout": timeout}
+        self._inner_lock = threading.Lock()
+        self.path = path or CASSETTE_PATH
+        self._writer = _CassetteWriter.get(self.path)
+
+    def _create_client(self):
+        return None
+
+    def _wrapped(self, kind: str) -> LLM:
+        with self._inner_lock:
+            if self._inner[kind] is None:
+                from . import EMBED_PROVIDERS, LLM_PROVIDERS  # the registry imports this module
+
+                registry, env = (
+                    (EMBED_PROVIDERS, "CASSETTE_EMBED_PROVIDER") if kind == "embed" else (LLM_PROVIDERS, "CASSETTE_PROVIDER")
+                )
+                name = os.getenv(env, "azure").lower()
+                if name not in registry or registry[name] in (RecordingLLM, ReplayLLM):
+                    raise ValueError(f"Unknown provider to record: {name}")
+                self._inner[kind] = registry[name](provider=name, **self._inner_kwargs)
+            return self._inner[kind]
+
+    def _record(self, kind: str, method: str, key: str, request: Dict[str, Any], **reply) -> None:
+        try:
+            self._writer.write({
+                "key": key,
+                "kind": kind,
+                "method": method,
+                "provider": self._wrapped(kind).provider,
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "request": request,
+                **reply,
+            })
+        except (OSError, TypeError, ValueError) as e:
+            # Recording must never fail the call it records
+            logger.warning(f"Could not write cassette entry: {e}")
+
+    async def chat(self, prompt: str = "", system_prompt: str = "", messages: Optional[List[dict]] = None, **kwargs):
+        request = _generate_payload(prompt, system_prompt, messages, kwargs)
+        start = time.perf_counter()
+        response = await _call(
+            self._wrapped("generate").chat, prompt=prompt, system_prompt=system_prompt, messages=messages, **kwargs
+        )
+        usage = response.get("usage")
+        self._record(
+            "generate", "chat", cassette_key("generate", request), request,
+            content=response.get("content"),
+            elapsed=round(time.perf_counter() - start, 4),
+            usage=usage.get_usages() if isinstance(usage, Usage) else None,
+        )
+        return response
+
+    async def stream(
+        self,
+        prompt: str = "",
+        system_prompt: str = "",
+        messages: Optional[List[dict]] = None,
+        usage: Optional[Usage] = None,
+        **kwargs
+    ):
+        request = _generate_payload(prompt, system_prompt, messages, kwargs)
+        call_usage = Usage()
+        chunks: List[list] = []
+        failed = False
+        start = time.perf_counter()
+        agen = self._wrapped("generate").stream(
+            prompt=prompt, system_prompt=system_prompt, messages=messages, usage=call_usage, **kwargs
+        )
+        try:
+            async for chunk in agen:
+                chunks.append([round(time.perf_counter() - start, 4), chunk])
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            await agen.aclose()
+            # A stream the consumer closed early is kept as far as it got; replay stops there too
+            if not failed and chunks:
+                self._report_usage(usage, call_usage)
+                self._record(
+                    "generate", "stream", cassette_key("generate", request), request,
+                    chunks=chunks,
+                    elapsed=round(time.perf_counter() - start, 4),
+                    usage=call_usage.get_usages(),
+                )
+
+    async def embed(self, input_texts: Union[List[str], str], usage: Optional[Usage] = None, **kwargs) -> List[List[float]]:
+        request = _embed_payload(input_texts, kwargs)
+        call_usage = Usage()
+        start = time.perf_counter()
+        embeddings = await _call(self._wrapped("embed").embed, input_texts, usage=call_usage, **kwargs)
+        self._report_usage(usage, call_usage)
+        self._record(
+            "embed", "embed", cassette_key("embed", request), request,
+            embeddings=embeddings,
+            elapsed=round(time.perf_counter() - start, 4),
+            usage=call_usage.get_usages(),
+        )
+        return embeddings
+
+
+class ReplayLLM(LLM):
+    """
+    Serves recordings from a cassette (CASSETTE_PATH) instead of calling a provider:
+    same reply, same usage, and the recorded pacing scaled by CASSETTE_TIME_SCALE.
+    chat and stream can replay each other's recordings. A request that was never
+    recorded raises CassetteMiss.
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[int] = None,
+        provider: Optional[str] = None,
+        path: Optional[str] = None,
+        time_scale: Optional[float] = None,
+        **kwargs
+    ):
+        super().__init__(temperature, max_tokens, timeout, provider, **kwargs)
+        self.time_scale = CASSETTE_TIME_SCALE if time_scale is None else time_scale
+        self.cassette = Cassette.load(path or CASSETTE_PATH)
+
+    def _create_client(self):
+        return None
+
+    async def _wait(self, seconds: float) -> None:
+        if seconds > 0 and self.time_scale > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    def _generate_entry(self, prompt, system_prompt, messages, kwargs) -> Dict[str, Any]:
+        request = _generate_payload(prompt, system_prompt, messages, kwargs)
+        question = next((str(m["content"]) for m in reversed(request["messages"]) if m["role"] == "user"), "")
+        return self.cassette.next(cassette_key("generate", request), f"generate {question[:80]!r}")
+
+    async def chat(self, prompt: str = "", system_prompt: str = "", messages: Optional[List[dict]] = None, **kwargs):
+        entry = self._generate_entry(prompt, system_prompt, messages, kwargs)
+        await self._wait(entry.get("elapsed", 0.0))
+        content = entry["content"] if "content" in entry else "".join(text for _, text in entry["chunks"])
+        return {"content": content, "usage": _usage_from(entry.get("usage"))}
+
+    async def stream(
+        self,
+        prompt: str = "",
+        system_prompt: str = "",
+        messages: Optional[List[dict]] = None,
+        usage: Optional[Usage] = None,
+        **kwargs
+    ):
+        entry = self._generate_entry(prompt, system_prompt, messages, kwargs)
+        chunks = entry.get("chunks") or [[entry.get("elapsed", 0.0), entry.get("content") or ""]]
+        previous = 0.0
+        for offset, text in chunks:
+            await self._wait(offset - previous)
+            previous = offset
+            yield text
+        self._report_usage(usage, _usage_from(entry.get("usage")))
+
+    async def embed(self, input_texts: Union[List[str], str], usage: Optional[Usage] = None, **kwargs) -> List[List[float]]:
+        request = _embed_payload(input_texts, kwargs)
+        entry = self.cassette.next(cassette_key("embed", request), f"embed {request['input'][0][:80]!r}")
+        await self._wait(entry.get("elapsed", 0.0))
+        self._report_usage(usage, _usage_from(entry.get("usage")))
+        return entry["embeddings"]
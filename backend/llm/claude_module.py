@@ -4,7 +4,10 @@ from typing import Optional, List, Union
 from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
 
+from component.base import Usage
 from .base import LLM
+from .prompt_cache import anthropic_system, record_prompt_cache
+from .rate_limiter import estimate_chat_tokens, estimate_tokens
 
 load_dotenv()
 
@@ -24,7 +27,8 @@ class ClaudeLLM(LLM):
         self._client = self._create_client()
 
     def _create_client(self) -> AsyncAnthropic:
-        return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        # The SDK's own retries are off; llm/resilience.py retries with the request deadline in mind
+        return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), timeout=self.request_timeout, max_retries=0)
 
     async def chat(
         self,
@@ -33,6 +37,7 @@ class ClaudeLLM(LLM):
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
         model: str = "",
+        stop: Optional[List[str]] = None,
         **kwargs
     ) -> Optional[str]:
         # Claude uses a different message format - system is separate
@@ -50,21 +55,27 @@ class ClaudeLLM(LLM):
             if prompt:
                 claude_messages.append({"role": "user", "content": prompt})
 
+        estimated_tokens = estimate_chat_tokens(
+            [{"content": system}, *claude_messages], self.max_tokens or 4096
+        )
+        await self._athrottle("chat", estimated_tokens)
         response = await self._client.messages.create(
             model=model or os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514"),
             max_tokens=self.max_tokens or 4096,
-            system=system,
+            system=anthropic_system(system),
             messages=claude_messages,
             temperature=temperature or self.temperature,
+            **({"stop_sequences": stop} if stop else {}),
         )
 
-        return {
-            "content": response.content[0].text,
-            "usage": {
-                "input_tokens": response.usage.input_tokens,
-                "output_tokens": response.usage.output_tokens
-            }
-        }
+        self._settle("chat", estimated_tokens, response.usage.input_tokens + response.usage.output_tokens)
+
+        return {"content": response.content[0].text, "usage": self._usage(response.usage)}
+
+    def _usage(self, sdk_usage) -> Usage:
+        usage = Usage.from_anthropic(sdk_usage)
+        record_prompt_cache(self.provider, usage)
+        return usage
 
     async def stream(
         self,
@@ -73,6 +84,8 @@ class ClaudeLLM(LLM):
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
         model: str = "",
+        stop: Optional[List[str]] = None,
+        usage: Optional[Usage] = None,
         **kwargs
     ):
         # Claude uses a different message format - system is separate
@@ -90,15 +103,27 @@ class ClaudeLLM(LLM):
             if prompt:
                 claude_messages.append({"role": "user", "content": prompt})
 
-        async with self._client.messages.stream(
-            model=model or os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514"),
-            max_tokens=self.max_tokens or 4096,
-            system=system,
-            messages=claude_messages,
-            temperature=temperature or self.temperature,
-        ) as stream:
-            async for text in stream.text_stream:
-                yield text
+        prompt_messages = [{"content": system}, *claude_messages]
+        reported = None
+        streamed_tokens = 0
+        estimated_tokens = estimate_chat_tokens(prompt_messages, self.max_tokens or 4096)
+        await self._athrottle("chat", estimated_tokens)
+        try:
+            async with self._client.messages.stream(
+                model=model or os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514"),
+                max_tokens=self.max_tokens or 4096,
+                system=anthropic_system(system),
+                messages=claude_messages,
+                temperature=temperature or self.temperature,
+                **({"stop_sequences": stop} if stop else {}),
+            ) as stream:
+                # Leaving the context (including an early aclose by the consumer) closes the HTTP stream
+                async for text in stream.text_stream:
+                    streamed_tokens += estimate_tokens(text)
+                    yield text
+                reported = self._report_usage(usage, self._usage((await stream.get_final_message()).usage))
+        finally:
+            self._settle_stream(estimated_tokens, prompt_messages, streamed_tokens, reported)
 
     async def embed(
         self,
@@ -0,0 +1,249 @@
+import os
+import time
+import asyncio
+import inspect
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from .base import LLM
+from .resilience import CircuitBreaker, DeadlineExceeded
+from utils.app_logger import LoggerSetup
+from utils.metrics import metrics
+
+logger = LoggerSetup("FailoverLLM").logger
+
+LLM_FAILOVERS = metrics.counter(
+    "llm_failover_total", "Calls that moved on to the next provider", ["from_provider", "to_provider"]
+)
+LLM_HEDGED_STREAMS = metrics.counter(
+    "llm_hedged_streams_total", "Streams that fired a hedged request, by which provider won", ["winner"]
+)
+
+# Hedge delay until enough first-token latencies have been seen to estimate the p95
+_HEDGE_MIN_SAMPLES = 20
+
+
+class FailoverLLM(LLM):
+    """
+    Composite LLM over an ordered provider list (FAILOVER_PROVIDERS, e.g. "azure,openai,claude").
+
+    chat / stream go to the first provider whose circuit breaker is closed and move
+    on to the next one when a call fails (a stream only before its first chunk;
+    after that the answer can't switch models). With hedging on (LLM_HEDGE=true), a
+    stream whose primary provider hasn't produced a token after that provider's
+    p95 time-to-first-token also starts on the next provider, and whichever streams
+    first wins; the other is cancelled. An attempt cancelled before its first token
+    still counts its elapsed time as a (lower-bound) sample, so slow attempts keep
+    the p95 from drifting down.
+
+    Vectors from different models don't share a space, so embeddings only fail over
+    among FAILOVER_EMBED_PROVIDERS (providers serving the same embedding model, e.g.
+    "azure,openai"); by default that is just the primary. They have their own breakers.
+    """
+
+    # Members retry on their own; retrying the composite would multiply attempts
+    RESILIENT_METHODS = ()
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[int] = None,
+        provider: Optional[str] = None,
+        providers: Optional[List[str]] = None,
+        hedge: Optional[bool] = None,
+        **kwargs
+    ):
+        super().__init__(temperature, max_tokens, timeout, provider, **kwargs)
+        from . import LLM_PROVIDERS  # the registry imports this module
+
+        names = providers or [
+            p.strip().lower() for p in os.getenv("FAILOVER_PROVIDERS", "azure,openai,claude").split(",") if p.strip()
+        ]
+        self.members: List[Tuple[str, LLM]] = []
+        for name in names:
+            if name not in LLM_PROVIDERS or LLM_PROVIDERS[name] is FailoverLLM:
+                raise ValueError(f"Unknown failover provider: {name}")
+            try:
+                self.members.append((name, LLM_PROVIDERS[name](
+                    temperature=temperature, max_tokens=max_tokens, timeout=timeout, provider=name, **kwargs
+                )))
+            except Exception as e:
+                # Typically a provider without credentials in this deployment
+                logger.warning(f"Skipping failover provider {name}: {e}")
+        if not self.members:
+            raise ValueError(f"No usable providers in failover list: {names}")
+
+        self.hedge = hedge if hedge is not None else os.getenv("LLM_HEDGE", "false").lower() == "true"
+        self.hedge_delay = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "2.0"))
+        self.breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name) for name, _ in self.members}
+        embed_names = [
+            p.strip().lower() for p in os.getenv("FAILOVER_EMBED_PROVIDERS", "").split(",") if p.strip()
+        ]
+        self.embed_members = [(name, llm) for name, llm in self.members if name in embed_names] or self.members[:1]
+        self.embed_breakers: Dict[str, CircuitBreaker] = {
+            name: CircuitBreaker(f"{name}:embed") for name, _ in self.embed_members
+        }
+        self._ttft: Dict[str, Deque[float]] = {name: deque(maxlen=200) for name, _ in self.members}
+        logger.info(f"Failover order: {[name for name, _ in self.members]}, hedging: {self.hedge}")
+
+    def _create_client(self):
+        return None
+
+    def _pick(
+        self,
+        start: int,
+        members: Optional[List[Tuple[str, LLM]]] = None,
+        breakers: Optional[Dict[str, CircuitBreaker]] = None,
+    ) -> Optional[int]:
+        """Index of the first member from `start` on whose breaker lets a call through."""
+        members = self.members if members is None else members
+        breakers = self.breakers if breakers is None else breakers
+        for index in range(start, len(members)):
+            if breakers[members[index][0]].allow():
+                return index
+        return None
+
+    def _hedge_after(self, name: str) -> float:
+        samples = self._ttft[name]
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return self.hedge_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @staticmethod
+    async def _call(fn, *args, **kwargs):
+        # Azure's chat client is synchronous; keep it off the event loop
+        if inspect.iscoroutinefunction(fn):
+            return await fn(*args, **kwargs)
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def _failover(
+        self,
+        method: str,
+        members: List[Tuple[str, LLM]],
+        breakers: Dict[str, CircuitBreaker],
+        *args,
+        **kwargs
+    ) -> Any:
+        """Call `method` on the members in order, moving on when a call fails."""
+        # With every circuit open the primary still gets the call rather than failing outright
+        index = self._pick(0, members, breakers)
+        index = 0 if index is None else index
+        while True:
+            name, llm = members[index]
+            try:
+                result = await self._call(getattr(llm, method), *args, **kwargs)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                breakers[name].record_failure()
+                index = self._pick(index + 1, members, breakers)
+                if index is None:
+                    raise
+                logger.warning(f"{name} {method} failed ({type(e).__name__}: {e}), trying {members[index][0]}")
+                LLM_FAILOVERS.inc(from_provider=name, to_provider=members[index][0])
+                continue
+            breakers[name].record_success()
+            return result
+
+    async def chat(self, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        return await self._failover("chat", self.members, self.breakers, *args, **kwargs)
+
+    async def _first_chunk(self, name: str, agen: AsyncIterator[str]) -> str:
+        start = time.monotonic()
+        try:
+            chunk = await agen.__anext__()
+        except asyncio.CancelledError:
+            # Hedged away (or abandoned) before its first token: its TTFT is at least this long
+            self._ttft[name].append(time.monotonic() - start)
+            raise
+        self._ttft[name].append(time.monotonic() - start)
+        return chunk
+
+    async def _close(self, name: str, agen: AsyncIterator[str], task: asyncio.Future) -> None:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            # Neither a success nor a failure; free a half-open trial it may hold
+            self.breakers[name].release_trial()
+        await agen.aclose()
+
+    async def stream(self, *args, **kwargs):
+        contenders: List[Tuple[str, AsyncIterator[str], asyncio.Future]] = []
+        next_index = 0
+        can_hedge = self.hedge
+        last_error: Optional[BaseException] = None
+
+        def launch(index: int) -> None:
+            nonlocal next_index
+            name, llm = self.members[index]
+            next_index = index + 1
+            agen = llm.stream(*args, **kwargs)
+            contenders.append((name, agen, asyncio.ensure_future(self._first_chunk(name, agen))))
+
+        try:
+            first = self._pick(0)
+            launch(0 if first is None else first)
+            winner = None
+            hedged = False
+            while winner is None:
+                timeout = self._hedge_after(contenders[0][0]) if can_hedge and len(contenders) == 1 else None
+                done, _ = await asyncio.wait(
+                    [task for _, _, task in contenders], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Only one hedge per stream
+                    can_hedge = False
+                    index = self._pick(next_index)
+                    if index is not None:
+                        logger.info(f"No token from {contenders[0][0]} after {timeout:.2f}s, hedging to {self.members[index][0]}")
+                        hedged = True
+                        launch(index)
+                    continue
+
+                for entry in [c for c in contenders if c[2] in done]:
+                    name, agen, task = entry
+                    error = task.exception()
+                    if error is None:
+                        winner = entry
+                        break
+                    if isinstance(error, DeadlineExceeded):
+                        raise error
+                    if isinstance(error, StopAsyncIteration):
+                        error = RuntimeError(f"{name} returned an empty stream")
+                    self.breakers[name].record_failure()
+                    logger.warning(f"{name} stream failed before its first token ({type(error).__name__}: {error})")
+                    last_error = error
+                    contenders.remove(entry)
+                    await agen.aclose()
+
+                if winner is None and not contenders:
+                    index = self._pick(next_index)
+                    if index is None:
+                        raise last_error
+                    LLM_FAILOVERS.inc(from_provider=name, to_provider=self.members[index][0])
+                    launch(index)
+
+            name, agen, task = winner
+            self.breakers[name].record_success()
+            if hedged:
+                LLM_HEDGED_STREAMS.inc(winner=name)
+            # Cancel the slower request
+            for entry in contenders:
+                if entry is not winner:
+                    await self._close(*entry)
+            contenders = [winner]
+
+            yield task.result()
+            async for chunk in agen:
+                yield chunk
+        finally:
+            for entry in contenders:
+                await self._close(*entry)
+
+    async def embed(self, input_texts, **kwargs) -> List[List[float]]:
+        return await self._failover("embed", self.embed_members, self.embed_breakers, input_texts, **kwargs)
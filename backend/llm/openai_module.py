@@ -1,11 +1,13 @@
 import os
-import time
 from typing import Optional, List, Union
 
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from component.base import Usage
 from .base import LLM
+from .prompt_cache import openai_cache_key, record_prompt_cache
+from .rate_limiter import estimate_chat_tokens, estimate_tokens
 
 load_dotenv()
 
@@ -25,7 +27,8 @@ class OpenAILLM(LLM):
         self._client = self._create_client()
 
     def _create_client(self) -> AsyncOpenAI:
-        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The SDK's own retries are off; llm/resilience.py retries with the request deadline in mind
+        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=self.request_timeout, max_retries=0)
 
     async def chat(
         self,
@@ -34,6 +37,7 @@ class OpenAILLM(LLM):
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
         model: str = "",
+        stop: Optional[List[str]] = None,
         **kwargs
     ) -> Optional[str]:
         if not messages:
@@ -43,14 +47,19 @@ class OpenAILLM(LLM):
             if prompt:
                 messages.append({"role": "user", "content": prompt})
 
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        await self._athrottle("chat", estimated_tokens)
         response = await self._client.chat.completions.create(
             model=model or os.getenv("OPENAI_LLM_MODEL", "gpt-4o"),
             messages=messages,
             temperature=temperature or self.temperature,
             max_tokens=self.max_tokens,
+            **({"stop": stop} if stop else {}),
+            **self._cache_params(messages),
         )
+        self._settle("chat", estimated_tokens, getattr(response.usage, "total_tokens", None))
 
-        return {"content": response.choices[0].message.content, "usage": response.usage}
+        return {"content": response.choices[0].message.content, "usage": self._usage(response.usage)}
 
     async def stream(
         self,
@@ -59,6 +68,8 @@ class OpenAILLM(LLM):
         messages: Optional[List[dict]] = None,
         temperature: Optional[float] = None,
         model: str = "",
+        stop: Optional[List[str]] = None,
+        usage: Optional[Usage] = None,
         **kwargs
     ):
         if not messages:
@@ -68,34 +79,67 @@ class OpenAILLM(LLM):
             if prompt:
                 messages.append({"role": "user", "content": prompt})
 
-        response = await self._client.chat.completions.create(
-            model=model or os.getenv("OPENAI_LLM_MODEL", "gpt-4o"),
-            messages=messages,
-            temperature=temperature or self.temperature,
-            max_tokens=self.max_tokens,
-            stream=True,
-        )
+        response = None
+        reported = None
+        streamed_tokens = 0
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        await self._athrottle("chat", estimated_tokens)
+        try:
+            response = await self._client.chat.completions.create(
+                model=model or os.getenv("OPENAI_LLM_MODEL", "gpt-4o"),
+                messages=messages,
+                temperature=temperature or self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True,
+                # The last chunk then carries usage (including cached prompt tokens) and no choices
+                stream_options={"include_usage": True},
+                **({"stop": stop} if stop else {}),
+                **self._cache_params(messages),
+            )
+            async for chunk in response:
+                if getattr(chunk, "usage", None):
+                    reported = self._report_usage(usage, self._usage(chunk.usage))
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content or ""
+                if content:
+                    streamed_tokens += estimate_tokens(content)
+                    yield content
+        finally:
+            # Runs on normal completion and when the consumer closes the generator early
+            self._settle_stream(estimated_tokens, messages, streamed_tokens, reported)
+            if response is not None:
+                await response.close()
+
+    @staticmethod
+    def _cache_params(messages: List[dict]) -> dict:
+        # Sent as extra_body so SDK versions without the prompt_cache_key argument still work
+        key = openai_cache_key(messages)
+        return {"extra_body": {"prompt_cache_key": key}} if key else {}
 
-        async for chunk in response:
-            if not chunk.choices:
-                continue
-            content = chunk.choices[0].delta.content or ""
-            if content:
-                yield content
+    def _usage(self, sdk_usage) -> Usage:
+        usage = Usage.from_openai(sdk_usage)
+        if sdk_usage is not None:
+            record_prompt_cache(self.provider, usage)
+        return usage
 
     async def embed(
         self,
         input_texts: Union[List[str], str],
         model: str = "",
         dimensions: int = 1536,
+        usage: Optional[Usage] = None,
         **kwargs
     ) -> List[List[float]]:
-        t = time.time()
+        estimated_tokens = estimate_tokens(input_texts)
+        await self._athrottle("embed", estimated_tokens)
         embeddings = await self._client.embeddings.create(
             input=input_texts,
             model=model or os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"),
             dimensions=dimensions,
         )
-        print(f"\n(openai embedding spent {time.time()-t:.3f} sec)")
+        reported = getattr(embeddings.usage, "total_tokens", None)
+        self._settle("embed", estimated_tokens, reported)
+        self._report_usage(usage, Usage(embedding_tokens=reported or estimated_tokens))
 
         return [ele.embedding for ele in embeddings.data]
@@ -0,0 +1,60 @@
+"""
+Provider prompt caching.
+
+ChatService builds every request as [static system prompt, per-request user
+turn], so the persona prompt and instructions form an identical prefix across
+requests. Providers can then serve that prefix from their prompt cache, which
+cuts time-to-first-token and input cost:
+
+* Anthropic caches up to an explicit breakpoint: the system prompt is sent as
+  a text block with cache_control (see anthropic_system);
+* OpenAI / Azure cache prompts of 1024+ tokens by prefix automatically;
+  prompt_cache_key routes requests with the same prefix to the same cache.
+
+Cached prompt tokens are counted per provider (llm_prompt_tokens_total /
+llm_cached_prompt_tokens_total), so the hit rate can be read off /metrics.
+PROMPT_CACHE_ENABLED=false sends plain requests.
+"""
+
+import os
+import hashlib
+from typing import Any, Dict, List, Optional, Union
+
+from component.base import Usage
+from utils.metrics import metrics
+
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
+LLM_PROMPT_TOKENS = metrics.counter(
+    "llm_prompt_tokens_total", "Prompt tokens sent to the provider", ["provider"]
+)
+LLM_CACHED_PROMPT_TOKENS = metrics.counter(
+    "llm_cached_prompt_tokens_total", "Prompt tokens the provider served from its prompt cache", ["provider"]
+)
+
+
+def anthropic_system(system: str) -> Union[str, List[Dict[str, Any]]]:
+    """The `system` parameter for messages.create, with a cache breakpoint after it."""
+    if not PROMPT_CACHE_ENABLED or not system:
+        return system
+    return [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+
+def openai_cache_key(messages: List[dict]) -> Optional[str]:
+    """prompt_cache_key for a request: a hash of its leading system message(s), the part that repeats."""
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    prefix = []
+    for message in messages:
+        if message.get("role") != "system":
+            break
+        prefix.append(str(message.get("content") or ""))
+    if not prefix:
+        return None
+    return hashlib.sha256("\n".join(prefix).encode("utf-8")).hexdigest()[:32]
+
+
+def record_prompt_cache(provider: Optional[str], usage: Usage) -> None:
+    labels = {"provider": provider or "default"}
+    LLM_PROMPT_TOKENS.inc(usage.prompt_tokens, **labels)
+    LLM_CACHED_PROMPT_TOKENS.inc(usage.cached_prompt_tokens, **labels)
@@ -0,0 +1,178 @@
+"""
+Client-side RPM/TPM rate limiting for provider calls.
+
+Providers enforce requests-per-minute and tokens-per-minute quotas and answer
+429 once they are exceeded. Instead of firing requests and retrying, every
+call first reserves its estimated cost from a pair of token buckets and waits
+until the budget allows it. Reservations are handed out in arrival order and
+may drive a bucket into debt, which turns a burst into an evenly spaced
+schedule and keeps throughput just under the quota.
+
+Limits come from the environment, per provider and kind ("chat" or "embed",
+which are usually separate deployments with separate quotas):
+
+    RATE_LIMIT_<PROVIDER>_<KIND>_RPM
+    RATE_LIMIT_<PROVIDER>_<KIND>_TPM
+
+e.g. RATE_LIMIT_AZURE_CHAT_TPM=80000. Unset or 0 means unlimited.
+"""
+
+import os
+import re
+import time
+import asyncio
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from utils.async_bridge import on_event_loop
+from utils.metrics import metrics
+
+# Completion tokens assumed when a request does not set max_tokens
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "512"))
+
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram(
+    "llm_rate_limit_wait_seconds", "Time provider calls waited for RPM/TPM budget", ["provider", "kind"]
+)
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+
+def estimate_tokens(texts: Union[str, Iterable[str]]) -> int:
+    """
+    Cheap tokenizer-free estimate: ~4 characters per token for Latin text and
+    about one token per CJK character.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    total = 0
+    for text in texts:
+        if not text:
+            continue
+        cjk = len(_CJK_RE.findall(text))
+        total += cjk + (len(text) - cjk + 3) // 4
+    return total
+
+
+def estimate_prompt_tokens(messages: List[dict]) -> int:
+    """Prompt estimate of a chat request, with a few tokens of per-message overhead."""
+    return sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in messages)
+
+
+def estimate_chat_tokens(messages: List[dict], max_tokens: Optional[int] = None) -> int:
+    """Prompt estimate plus the completion budget (what quota-based providers count up front)."""
+    return estimate_prompt_tokens(messages) + (max_tokens or RATE_LIMIT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """
+    Bucket of `per_minute` units refilled continuously. reserve() always succeeds
+    and returns how long the caller must wait before using what it took.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._level -= amount
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, if negative, additionally take) units after the real cost is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimitWouldBlock(RuntimeError):
+    """A sync call ran out of RPM/TPM budget on an event loop thread, where waiting would stall the loop."""
+    status_code = 429
+
+
+class RateLimiter:
+    """RPM and TPM buckets for one (provider, kind); None for a limit that isn't configured."""
+
+    def __init__(self, provider: str, kind: str, rpm: float = 0, tpm: float = 0):
+        self.provider = provider
+        self.kind = kind
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def _reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = self._requests.reserve(1)
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.reserve(tokens))
+        RATE_LIMIT_WAIT_SECONDS.observe(wait, provider=self.provider, kind=self.kind)
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Blocking variant for the synchronous clients. Async code runs those with
+        asyncio.to_thread; called on the loop itself it fails rather than sleep.
+        """
+        if self.enabled:
+            wait = self._reserve(tokens)
+            if wait > 0:
+                if on_event_loop():
+                    self._release(tokens)
+                    raise RateLimitWouldBlock(
+                        f"{self.provider} {self.kind} budget needs a {wait:.2f}s wait on the event loop thread"
+                    )
+                time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        if self.enabled:
+            wait = self._reserve(tokens)
+            if wait > 0:
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:
+                    # Never sent: hand the reservation back to the requests behind us
+                    self._release(tokens)
+                    raise
+
+    def _release(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.refund(1)
+        if self._tokens is not None:
+            self._tokens.refund(tokens)
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the TPM bucket once the provider reported the real token count."""
+        if self._tokens is not None and actual is not None:
+            self._tokens.refund(estimated - actual)
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: Optional[str], kind: str) -> RateLimiter:
+    """Process-wide limiter for (provider, kind), so every client of a deployment shares one budget."""
+    key = ((provider or "default").lower(), kind)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            prefix = f"RATE_LIMIT_{key[0].upper()}_{kind.upper()}"
+            limiter = _limiters[key] = RateLimiter(
+                *key,
+                rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+                tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+            )
+        return limiter
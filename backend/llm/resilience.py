@@ -0,0 +1,321 @@
+"""
+Timeouts, retries and request deadlines for provider calls.
+
+LLM subclasses get their chat / stream / embed methods wrapped automatically
+(see LLM.__init_subclass__):
+
+* transient failures - timeouts, connection errors, 408/409/429/5xx - are
+  retried with capped exponential backoff and full jitter, honouring a
+  Retry-After header when the provider sends one. Streams are only retried
+  before their first chunk, so nothing is ever emitted twice;
+* sync calls never back off on an event loop thread (they fail instead of
+  stalling the loop); async code runs them with asyncio.to_thread;
+* a `deadline=` keyword (a Deadline) bounds the whole call including retries.
+  Async calls still pending when it passes are cancelled; sync calls get the
+  remaining time as their HTTP timeout.
+
+A Deadline is created once per user request and passed through embed ->
+retrieve -> generate, so the stages share one budget instead of each having
+its own timeout.
+"""
+
+import os
+import time
+import random
+import asyncio
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from utils.app_logger import LoggerSetup
+from utils.async_bridge import on_event_loop
+from utils.metrics import metrics
+
+logger = LoggerSetup("LLM_Resilience").logger
+
+# Per-attempt HTTP timeout for provider clients (the SDK's own retries are turned off)
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+_RETRYABLE_NAMES = ("Timeout", "Connection", "RemoteProtocolError", "ReadError", "Overloaded")
+
+LLM_RETRIES = metrics.counter(
+    "llm_retries_total", "Provider calls retried after a transient error", ["provider", "method"]
+)
+LLM_CALL_SECONDS = metrics.histogram(
+    "llm_call_seconds", "Provider call wall time including retries (whole stream for stream)", ["provider", "method"]
+)
+LLM_ERRORS = metrics.counter(
+    "llm_errors_total", "Provider calls that failed after retries, by exception type", ["provider", "method", "error"]
+)
+CIRCUIT_OPEN = metrics.gauge("llm_circuit_open", "1 while a provider's circuit breaker is open", ["provider"])
+LLM_DEADLINE_EXCEEDED = metrics.counter(
+    "llm_deadline_exceeded_total", "Provider calls abandoned because the request deadline passed", ["provider", "method"]
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of its end-to-end time budget."""
+
+
+class Deadline:
+    """An absolute point in time (monotonic clock) a request must finish by; None seconds = no limit."""
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage: str = "") -> None:
+        """Raise DeadlineExceeded if the budget is used up (before starting `stage`)."""
+        if self.expired:
+            raise DeadlineExceeded(f"Request deadline exceeded{' before ' + stage if stage else ''}")
+
+    def cap(self, timeout: Optional[float]) -> Optional[float]:
+        """The smaller of `timeout` and the remaining budget."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(error).__name__ for name in _RETRYABLE_NAMES)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: BaseException, deadline: Optional[Deadline]) -> Optional[float]:
+    """
+    Seconds to wait before retry number `attempt` (0-based), or None to give up:
+    non-retryable error, retries exhausted, or the wait would overrun the deadline.
+    """
+    if attempt >= LLM_MAX_RETRIES or not is_retryable(error):
+        return None
+    delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    server_hint = _retry_after(error)
+    if server_hint is not None:
+        delay = max(delay, min(server_hint, LLM_RETRY_MAX_SECONDS))
+    if deadline is not None and deadline.remaining() is not None and delay >= deadline.remaining():
+        return None
+    return delay
+
+
+def _log_retry(llm, method: str, attempt: int, error: BaseException, delay: float) -> None:
+    LLM_RETRIES.inc(provider=llm.provider, method=method)
+    logger.warning(
+        f"{llm.provider} {method} failed ({type(error).__name__}: {error}); "
+        f"retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s"
+    )
+
+
+def _deadline_exceeded(llm, method: str) -> DeadlineExceeded:
+    LLM_DEADLINE_EXCEEDED.inc(provider=llm.provider, method=method)
+    return DeadlineExceeded(f"Request deadline exceeded during {llm.provider} {method}")
+
+
+@contextmanager
+def _call_metrics(llm, method: str):
+    """Wall time (retries included) and final failures of one provider call."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        LLM_ERRORS.inc(provider=llm.provider, method=method, error=type(e).__name__)
+        raise
+    finally:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, provider=llm.provider, method=method)
+
+
+def resilient(fn, method: str):
+    """Wrap an LLM method (sync, async or async generator) with retries and deadline handling."""
+    accepts_timeout = any(
+        p.name == "timeout" or p.kind is inspect.Parameter.VAR_KEYWORD
+        for p in inspect.signature(fn).parameters.values()
+    )
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def stream_wrapper(self, *args, deadline: Optional[Deadline] = None, **kwargs):
+            with _call_metrics(self, method):
+                for attempt in range(LLM_MAX_RETRIES + 1):
+                    if deadline is not None:
+                        deadline.check(method)
+                    agen = fn(self, *args, **kwargs)
+                    started = False
+                    try:
+                        while True:
+                            remaining = deadline.remaining() if deadline is not None else None
+                            try:
+                                if remaining is None:
+                                    chunk = await agen.__anext__()
+                                else:
+                                    chunk = await asyncio.wait_for(agen.__anext__(), remaining)
+                            except StopAsyncIteration:
+                                return
+                            except asyncio.TimeoutError:
+                                raise _deadline_exceeded(self, method)
+                            started = True
+                            yield chunk
+                    except Exception as e:
+                        # Once text went out a retry would duplicate it
+                        delay = None if started else backoff_delay(attempt, e, deadline)
+                        if delay is None:
+                            raise
+                        _log_retry(self, method, attempt, e, delay)
+                    finally:
+                        await agen.aclose()
+                    await asyncio.sleep(delay)
+
+        stream_wrapper._resilient = True
+        return stream_wrapper
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, deadline: Optional[Deadline] = None, **kwargs):
+            with _call_metrics(self, method):
+                attempt = 0
+                while True:
+                    if deadline is not None:
+                        deadline.check(method)
+                    try:
+                        if deadline is None or deadline.remaining() is None:
+                            return await fn(self, *args, **kwargs)
+                        try:
+                            return await asyncio.wait_for(fn(self, *args, **kwargs), deadline.remaining())
+                        except asyncio.TimeoutError:
+                            raise _deadline_exceeded(self, method)
+                    except Exception as e:
+                        delay = backoff_delay(attempt, e, deadline)
+                        if delay is None:
+                            raise
+                        _log_retry(self, method, attempt, e, delay)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+        async_wrapper._resilient = True
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(self, *args, deadline: Optional[Deadline] = None, **kwargs):
+        with _call_metrics(self, method):
+            attempt = 0
+            while True:
+                if deadline is not None:
+                    deadline.check(method)
+                    if accepts_timeout:
+                        # A blocking call can't be cancelled; bound its HTTP timeout instead
+                        kwargs["timeout"] = deadline.cap(kwargs.get("timeout"))
+                try:
+                    return fn(self, *args, **kwargs)
+                except Exception as e:
+                    delay = backoff_delay(attempt, e, deadline)
+                    if delay is None:
+                        if deadline is not None and deadline.expired and is_retryable(e):
+                            raise _deadline_exceeded(self, method) from e
+                        raise
+                    if on_event_loop():
+                        # Sleeping here would freeze every stream on the loop; callers
+                        # there must run sync clients with asyncio.to_thread
+                        logger.warning(
+                            f"{self.provider}.{method} called on the event loop thread; "
+                            f"not retrying {type(e).__name__} with a blocking backoff"
+                        )
+                        raise
+                    _log_retry(self, method, attempt, e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    sync_wrapper._resilient = True
+    return sync_wrapper
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker: opens after `failure_threshold` consecutive failures,
+    rejects calls for `reset_seconds`, then lets a single trial call through
+    (half-open). The trial's outcome closes or re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")),
+        reset_seconds: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def allow(self) -> bool:
+        """Whether a call may go to this provider now (claims the half-open trial if due)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        CIRCUIT_OPEN.set(0, provider=self.name)
+
+    def release_trial(self) -> None:
+        """The trial call was abandoned without an outcome; let the next call try."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight or self._failures >= self.failure_threshold
+            self._trial_in_flight = False
+            if not reopen:
+                return
+            self._opened_at = time.monotonic()
+        logger.warning(f"Circuit for {self.name} open for {self.reset_seconds:.0f}s")
+        CIRCUIT_OPEN.set(1, provider=self.name)
@@ -0,0 +1,224 @@
+import os
+import re
+import math
+import random
+import asyncio
+import hashlib
+from typing import List, Optional, Union
+
+from component.base import Usage
+from .base import LLM
+from .rate_limiter import estimate_chat_tokens, estimate_tokens
+
+# Characters per streamed chunk, about one token (see estimate_tokens)
+_CHUNK_CHARS = 4
+
+_WORD_RE = re.compile(r"[㐀-鿿]|[^\W_]+", re.UNICODE)
+
+# Filler the synthetic answers are built from, mixed with words of the question
+_VOCABULARY = (
+    "the candidate worked on backend services and data pipelines with a focus on reliability "
+    "latency and cost designed retrieval systems led migrations mentored engineers shipped "
+    "features measured results improved throughput reduced errors collaborated with product "
+    "teams owned incidents wrote tests reviewed code automated deployments scaled the platform"
+).split()
+
+
+class StubProviderError(Exception):
+    """Injected provider failure; carries an HTTP status so llm/resilience.py treats it like a real one."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Stub provider error (HTTP {status_code})")
+        self.status_code = status_code
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class StubLLM(LLM):
+    """
+    Offline provider for benchmarks and load tests: no network, no credentials.
+
+    * embed: deterministic feature-hashing vectors - every word (or CJK character)
+      adds to a few hashed dimensions - so equal texts give equal vectors and texts
+      sharing words are close. Index documents with EMBED_PROVIDER=stub too.
+    * chat / stream: a CoT-shaped "<thinking>...</thinking><answer>...</answer>" reply
+      whose words are seeded by the messages, streamed in ~1-token chunks (tags may
+      split across chunks, as with real providers). Stop sequences and max_tokens apply.
+
+    Latency and failures are drawn per call (seeded with STUB_SEED):
+    time to first token is log-normal around STUB_TTFT_SECONDS (spread STUB_TTFT_SIGMA),
+    throughput is normal around STUB_TOKENS_PER_SECOND (relative spread STUB_TPS_JITTER,
+    0 = no pacing), and STUB_ERROR_RATE of the calls fail with HTTP STUB_ERROR_STATUS
+    before producing anything.
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[int] = None,
+        provider: Optional[str] = None,
+        **kwargs
+    ):
+        super().__init__(temperature, max_tokens, timeout, provider, **kwargs)
+        self.ttft_seconds = _env_float("STUB_TTFT_SECONDS", 0.4)
+        self.ttft_sigma = _env_float("STUB_TTFT_SIGMA", 0.3)
+        self.tokens_per_second = _env_float("STUB_TOKENS_PER_SECOND", 50)
+        self.tps_jitter = _env_float("STUB_TPS_JITTER", 0.2)
+        self.error_rate = _env_float("STUB_ERROR_RATE", 0.0)
+        self.error_status = int(os.getenv("STUB_ERROR_STATUS", "503"))
+        self.thinking_tokens = int(os.getenv("STUB_THINKING_TOKENS", "60"))
+        self.answer_tokens = int(os.getenv("STUB_ANSWER_TOKENS", "120"))
+        self.embed_dim = int(os.getenv("STUB_EMBED_DIM", "1536"))
+        self.embed_seconds = _env_float("STUB_EMBED_SECONDS", 0.02)
+        self._rng = random.Random(int(os.getenv("STUB_SEED", "0")))
+        self._client = self._create_client()
+
+    def _create_client(self):
+        return None
+
+    # ----- latency / failure model -----
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate > 0 and self._rng.random() < self.error_rate:
+            raise StubProviderError(self.error_status)
+
+    def _ttft(self) -> float:
+        if self.ttft_seconds <= 0:
+            return 0.0
+        return self._rng.lognormvariate(math.log(self.ttft_seconds), self.ttft_sigma)
+
+    def _chunk_interval(self) -> float:
+        """Seconds between chunks for one call, 0 when pacing is off."""
+        if self.tokens_per_second <= 0:
+            return 0.0
+        tps = self._rng.gauss(self.tokens_per_second, self.tokens_per_second * self.tps_jitter)
+        return 1.0 / max(tps, 1.0)
+
+    # ----- content -----
+
+    @staticmethod
+    def _messages(prompt: str, system_prompt: str, messages: Optional[List[dict]]) -> List[dict]:
+        if messages:
+            return messages
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        if prompt:
+            messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _completion(self, messages: List[dict], stop: Optional[List[str]], max_tokens: Optional[int]) -> str:
+        """The reply for these messages: same messages, same text."""
+        digest = hashlib.sha256(
+            "\x1f".join(f"{m.get('role')}:{m.get('content')}" for m in messages).encode("utf-8")
+        ).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        question = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+        vocabulary = _VOCABULARY + _WORD_RE.findall(question.lower())[-50:]
+
+        def sentence(tokens: int) -> str:
+            return " ".join(rng.choice(vocabulary) for _ in range(max(1, tokens * _CHUNK_CHARS // 6)))
+
+        text = (
+            f"<thinking>\n{sentence(self.thinking_tokens)}\n</thinking>\n"
+            f"<answer>\n{sentence(self.answer_tokens)}.\n</answer>"
+        )
+        for sequence in stop or []:
+            index = text.find(sequence)
+            if index != -1:
+                text = text[:index]
+        limit = max_tokens or self.max_tokens
+        if limit:
+            text = text[:limit * _CHUNK_CHARS]
+        return text
+
+    @staticmethod
+    def _usage(messages: List[dict], completion: str) -> Usage:
+        return Usage(
+            prompt_tokens=estimate_tokens([str(m.get("content") or "") for m in messages]),
+            completion_tokens=math.ceil(len(completion) / _CHUNK_CHARS),
+        )
+
+    # ----- LLM interface -----
+
+    async def chat(
+        self,
+        prompt: str = "",
+        system_prompt: str = "",
+        messages: Optional[List[dict]] = None,
+        temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> Optional[dict]:
+        messages = self._messages(prompt, system_prompt, messages)
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        await self._athrottle("chat", estimated_tokens)
+        self._maybe_fail()
+        completion = self._completion(messages, stop, max_tokens)
+        chunks = math.ceil(len(completion) / _CHUNK_CHARS)
+        await asyncio.sleep(self._ttft() + chunks * self._chunk_interval())
+        usage = self._usage(messages, completion)
+        self._settle("chat", estimated_tokens, usage.prompt_tokens + usage.completion_tokens)
+        return {"content": completion, "usage": usage}
+
+    async def stream(
+        self,
+        prompt: str = "",
+        system_prompt: str = "",
+        messages: Optional[List[dict]] = None,
+        temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        usage: Optional[Usage] = None,
+        **kwargs
+    ):
+        messages = self._messages(prompt, system_prompt, messages)
+        reported = None
+        streamed_tokens = 0
+        estimated_tokens = estimate_chat_tokens(messages, self.max_tokens)
+        await self._athrottle("chat", estimated_tokens)
+        try:
+            self._maybe_fail()
+            completion = self._completion(messages, stop, max_tokens)
+            interval = self._chunk_interval()
+            await asyncio.sleep(self._ttft())
+            for start in range(0, len(completion), _CHUNK_CHARS):
+                if start and interval:
+                    await asyncio.sleep(interval)
+                chunk = completion[start:start + _CHUNK_CHARS]
+                streamed_tokens += estimate_tokens(chunk)
+                yield chunk
+            reported = self._report_usage(usage, self._usage(messages, completion))
+        finally:
+            self._settle_stream(estimated_tokens, messages, streamed_tokens, reported)
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.embed_dim
+        features = _WORD_RE.findall(text.lower()) or [text]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=16).digest()
+            # Four signed slots per feature keep unrelated words from colliding completely
+            for i in range(0, 16, 4):
+                slot = int.from_bytes(digest[i:i + 4], "big")
+                vector[slot % self.embed_dim] += 1.0 if slot & 0x80000000 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    async def embed(
+        self,
+        input_texts: Union[List[str], str],
+        usage: Optional[Usage] = None,
+        **kwargs
+    ) -> List[List[float]]:
+        texts = [input_texts] if isinstance(input_texts, str) else list(input_texts)
+        tokens = estimate_tokens(texts)
+        await self._athrottle("embed", tokens)
+        self._maybe_fail()
+        if self.embed_seconds > 0:
+            await asyncio.sleep(self.embed_seconds)
+        self._report_usage(usage, Usage(embedding_tokens=tokens))
+        return [self._vector(text) for text in texts]
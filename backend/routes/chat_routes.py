@@ -5,16 +5,36 @@ import sys
 sys.path.append("./")
 sys.path.append("../")
 
+import time
+from typing import Iterator, Optional
+
 from flask import Blueprint, request, jsonify, Response, stream_with_context
+from llm.resilience import DeadlineExceeded
 from services import chat_service
-from services.chat_serv import chroma_usage_en, chroma_usage_zhtw
+from services.admission import AdmissionRejected, admission
+from services.chat_metrics import RequestMetrics
+from services.stream_registry import StreamGapError, parse_last_event_id
 from utils.app_logger import LoggerSetup
+from utils.metrics import metrics
+from utils.sse import SSE_HEARTBEAT, format_sse, set_write_timeout
 
 logger = LoggerSetup("Chat_Rte").logger
 
+STREAM_DISCONNECTS = metrics.counter(
+    "chat_stream_disconnects_total", "Streams closed because the client went away"
+)
+
 chat_bp = Blueprint("chat", __name__)
 
 
+def _admission_rejected(e: AdmissionRejected):
+    """429 (queue full) / 503 (queue timeout) with a Retry-After hint."""
+    return jsonify({
+        "status": "failed",
+        "error": str(e)
+    }), e.status_code, {"Retry-After": str(e.retry_after)}
+
+
 @chat_bp.post("/")
 def chat():
     """
@@ -27,7 +47,8 @@ def chat():
         "character": "hr" | "engineer" (optional, interviewer character),
         "session_id": "optional session id",
         "conversation_history": [optional list of messages],
-        "k": 5 (optional, number of docs to retrieve),
+        "k": null (optional, number of docs to retrieve; default 5, or RERANK_TOP_N when re-ranking),
+        "fetch_k": null (optional, candidates to re-rank down to k),
         "temperature": 0.7 (optional),
         "max_tokens": null (optional),
         "system_prompt": null (optional, overrides character),
@@ -62,7 +83,8 @@ def chat():
         character = data.get("character")
         session_id = data.get("session_id")
         conversation_history = data.get("conversation_history")
-        k = data.get("k", 5)
+        k = data.get("k")
+        fetch_k = data.get("fetch_k")
         temperature = data.get("temperature", 0.7)
         max_tokens = data.get("max_tokens")
         system_prompt = data.get("system_prompt")
@@ -80,19 +102,21 @@ def chat():
         
         logger.info(f"Chat request - lang: {lang}, character: {character}, query: {query[:50]}..., session_id: {session_id}")
         
-        # Call chat service
-        response = chat_service.chat(
-            lang=lang,
-            query=query,
-            conversation_history=conversation_history,
-            session_id=session_id,
-            k=k,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            system_prompt=system_prompt,
-            character=character,
-            model=model
-        )
+        # Call chat service (waits for a free provider slot, or fails fast when overloaded)
+        with admission.acquire(chat_service.llm.provider, "chat"):
+            response = chat_service.chat(
+                lang=lang,
+                query=query,
+                conversation_history=conversation_history,
+                session_id=session_id,
+                k=k,
+                fetch_k=fetch_k,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                system_prompt=system_prompt,
+                character=character,
+                model=model
+            )
         
         return jsonify({
             "status": "success",
@@ -104,6 +128,14 @@ def chat():
             "context_used": response.get("context_used", False)
         }), 200
         
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except DeadlineExceeded as e:
+        logger.warning(f"Chat request timed out: {e}")
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), 504
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         return jsonify({
@@ -124,7 +156,8 @@ def stream_chat():
         "character": "hr" | "engineer" (optional, interviewer character),
         "session_id": "optional session id",
         "conversation_history": [optional list of messages],
-        "k": 5 (optional),
+        "k": null (optional),
+        "fetch_k": null (optional),
         "temperature": 0.7 (optional),
         "max_tokens": null (optional),
         "system_prompt": null (optional, overrides character),
@@ -132,6 +165,13 @@ def stream_chat():
     }
     
     Returns: Server-Sent Events (SSE) stream
+        data: [SESSION_ID] <id>
+        event: sources   {"sources": [...], "timings": {...}}   before any answer text
+        data: <answer text chunk>                               repeated
+        event: usage     {"usage": ..., "route": ..., "timings": {...}}
+        data: [DONE]
+    plus ": keep-alive" comment frames while nothing else is being sent. Every event
+    carries an id "<stream_id>:<seq>"; reconnect with GET /chat/stream/<stream_id>.
     """
     try:
         data = request.get_json()
@@ -161,7 +201,8 @@ def stream_chat():
         character = data.get("character")
         session_id = data.get("session_id")
         conversation_history = data.get("conversation_history")
-        k = data.get("k", 5)
+        k = data.get("k")
+        fetch_k = data.get("fetch_k")
         temperature = data.get("temperature", 0.7)
         max_tokens = data.get("max_tokens")
         system_prompt = data.get("system_prompt")
@@ -179,45 +220,34 @@ def stream_chat():
         
         logger.info(f"Stream chat request - lang: {lang}, character: {character}, query: {query[:50]}..., session_id: {session_id}")
         
-        def generate():
-            try:
-                # Send session_id as first message
-                yield f"data: [SESSION_ID] {session_id}\n\n"
-                
-                # Set the vectorstore based on lang parameter
-                # (stream_chat doesn't currently support lang parameter)
-                if lang == "zhtw":
-                    chat_service.vectorstore = chroma_usage_zhtw
-                elif lang == "en":
-                    chat_service.vectorstore = chroma_usage_en
-                
-                for chunk in chat_service.stream_chat(
-                    query=query,
-                    conversation_history=conversation_history,
-                    session_id=session_id,
-                    k=k,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    system_prompt=system_prompt,
-                    character=character,
-                    model=model
-                ):
-                    yield f"data: {chunk}\n\n"
-                
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                logger.error(f"Error in stream generation: {e}", exc_info=True)
-                yield f"data: [ERROR] {str(e)}\n\n"
-        
-        return Response(
-            stream_with_context(generate()),
-            mimetype="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "X-Accel-Buffering": "no"
-            }
+        # The slot is held until the generation ends, not just while this client is connected
+        slot = admission.acquire(chat_service.llm.provider, "stream")
+        try:
+            stream_id = chat_service.start_stream(
+                on_done=slot.release,
+                lang=lang,
+                query=query,
+                conversation_history=conversation_history,
+                session_id=session_id,
+                k=k,
+                fetch_k=fetch_k,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                system_prompt=system_prompt,
+                character=character,
+                model=model
+            )
+        except Exception:
+            slot.release()
+            raise
+        
+        return _event_stream_response(
+            stream_id, after_seq=0, session_id=session_id,
+            stats=RequestMetrics(lang, character, chat_service.llm.provider),
         )
         
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
     except Exception as e:
         logger.error(f"Error in stream chat endpoint: {e}", exc_info=True)
         return jsonify({
@@ -226,6 +256,140 @@ def stream_chat():
         }), 500
 
 
+@chat_bp.get("/stream/<stream_id>")
+def resume_stream(stream_id: str):
+    """
+    Resume a dropped /chat/stream connection without a new retrieval or LLM call.
+    
+    The position comes from the Last-Event-ID header (sent automatically by
+    EventSource on reconnect) or the last_event_id query parameter; every frame's
+    id is "<stream_id>:<seq>". Without either, the stream is replayed from the start.
+    
+    Returns: the same SSE stream as /chat/stream, from the next event on
+    """
+    try:
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        id_stream, after_seq = parse_last_event_id(last_event_id)
+        if id_stream is not None and id_stream != stream_id:
+            return jsonify({
+                "status": "failed",
+                "error": "Last-Event-ID belongs to a different stream"
+            }), 400
+        
+        logger.info(f"Resume stream request - stream_id: {stream_id}, after_seq: {after_seq}")
+        return _event_stream_response(stream_id, after_seq=after_seq)
+        
+    except StreamGapError as e:
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), 410
+    except LookupError as e:
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), 404
+    except Exception as e:
+        logger.error(f"Error in resume stream endpoint: {e}", exc_info=True)
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), 500
+
+
+def _timed_frames(frames: Iterator[str], stats: RequestMetrics) -> Iterator[str]:
+    """
+    Pass SSE frames through, recording how long the server took to write each one:
+    the WSGI server writes a yielded chunk before asking for the next.
+    """
+    try:
+        for frame in frames:
+            start = time.perf_counter()
+            yield frame
+            stats.observe("sse_write", time.perf_counter() - start)
+    finally:
+        frames.close()
+
+
+def _event_stream_response(
+    stream_id: str,
+    after_seq: int = 0,
+    session_id: Optional[str] = None,
+    stats: Optional[RequestMetrics] = None,
+) -> Response:
+    """SSE response reading a started stream from after_seq (raises LookupError if it is gone)."""
+    events = chat_service.stream_events(stream_id, after_seq)
+    # A resumed stream doesn't know the original request's lang / character
+    stats = stats or RequestMetrics("unknown", "unknown", chat_service.llm.provider)
+    # Bound how long a client that stopped reading can block this worker
+    set_write_timeout(request.environ)
+    
+    def generate():
+        try:
+            if session_id:
+                # Send session_id as first message
+                yield f"data: [SESSION_ID] {session_id}\n\n"
+            
+            for event in events:
+                event_type = event.pop("type")
+                event_id = f"{stream_id}:{event.pop('seq')}" if "seq" in event else None
+                if event_type == "token":
+                    yield format_sse(event["content"], event_id=event_id)
+                elif event_type == "heartbeat":
+                    yield SSE_HEARTBEAT
+                elif event_type == "error":
+                    yield format_sse(f"[ERROR] {event['message']}", event_id=event_id)
+                    return
+                else:
+                    # "sources" (before the first token) and "usage" (after the last one)
+                    yield format_sse(event, event=event_type, event_id=event_id)
+            
+            yield "data: [DONE]\n\n"
+        except GeneratorExit:
+            # The server closes the response when a write to the client fails. The
+            # generation keeps going for a while so the client can resume, unless
+            # the replay buffer no longer covers where it left off.
+            STREAM_DISCONNECTS.inc()
+            logger.info(f"Client disconnected from stream {stream_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Error in stream generation: {e}", exc_info=True)
+            yield format_sse(f"[ERROR] {e}")
+        finally:
+            events.close()
+    
+    return Response(
+        stream_with_context(_timed_frames(generate(), stats)),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Stream-ID": stream_id
+        }
+    )
+
+
+@chat_bp.get("/usage")
+def usage():
+    """
+    Token usage (prompt, cached prompt, completion, embedding) since the process started,
+    and of one session when ?session_id= is given.
+    """
+    try:
+        session_id = request.args.get("session_id")
+        return jsonify({
+            "status": "success",
+            **chat_service.usage_summary(session_id),
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error in usage endpoint: {e}", exc_info=True)
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), 500
+
+
 @chat_bp.post("/clear")
 def clear_history():
     """
@@ -7,7 +7,9 @@ sys.path.append("../")
 
 from pathlib import Path
 from flask import Blueprint, request, jsonify
+from llm import embed_client
 from services import DocProcessor
+from services.admission import AdmissionRejected, admission
 from db.chroma_vectordb import ChromaUsage
 from utils.app_logger import LoggerSetup
 
@@ -54,10 +56,17 @@ def process_file():
         }), 400
 
     try:
-        for lang_code, files in lang_files.items():
-            logger.info(f'Processing files in {lang_code}')
-            doc_processor = DocProcessor(lang=lang_code)
-            nodes = doc_processor.run(files)
+        # Bulk embedding shares the provider with chat; cap how many ingestions run at once
+        with admission.acquire(embed_client.provider, "embed"):
+            for lang_code, files in lang_files.items():
+                logger.info(f'Processing files in {lang_code}')
+                doc_processor = DocProcessor(lang=lang_code)
+                nodes = doc_processor.run(files)
+    except AdmissionRejected as e:
+        return jsonify({
+            "status": "failed",
+            "error": str(e)
+        }), e.status_code, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logger.error(str(e), exc_info=True)
         return jsonify({
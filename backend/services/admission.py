@@ -0,0 +1,199 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Admission control for LLM-bound requests.
+
+Every (provider, kind) pair - kind being "chat", "stream" or "embed" - gets a
+lane with a concurrency cap and a bounded FIFO wait queue: a released slot
+goes to the longest-waiting request. A request either
+gets a slot, waits in the queue for at most ADMISSION_QUEUE_TIMEOUT_SECONDS, or
+is turned away at once with 429 (queue full) / 503 (waited too long) and a
+Retry-After estimate. Under a spike the provider sees a steady number of
+concurrent calls instead of a burst of 429s, and admitted requests keep their
+normal latency.
+
+Limits (env):
+    ADMISSION_<KIND>_CONCURRENCY            default cap per provider
+    ADMISSION_<PROVIDER>_<KIND>_CONCURRENCY  override for one provider
+    ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_SECONDS
+A cap of 0 disables admission control for that lane.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from utils.app_logger import LoggerSetup
+from utils.metrics import metrics
+
+logger = LoggerSetup("Admission").logger
+
+KINDS = ("chat", "stream", "embed")
+_DEFAULT_CONCURRENCY = {"chat": 8, "stream": 16, "embed": 4}
+
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+
+ADMISSION_QUEUE_SECONDS = metrics.histogram(
+    "admission_queue_seconds", "Time admitted requests waited for a slot", ["provider", "kind"]
+)
+ADMISSION_REJECTED = metrics.counter(
+    "admission_rejected_total", "Requests turned away by admission control", ["provider", "kind", "reason"]
+)
+ADMISSION_IN_FLIGHT = metrics.gauge(
+    "admission_in_flight", "Requests holding a slot", ["provider", "kind"]
+)
+ADMISSION_QUEUED = metrics.gauge(
+    "admission_queued", "Requests waiting for a slot", ["provider", "kind"]
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def concurrency_limit(provider: str, kind: str) -> int:
+    default = os.getenv(f"ADMISSION_{kind.upper()}_CONCURRENCY", str(_DEFAULT_CONCURRENCY[kind]))
+    return int(os.getenv(f"ADMISSION_{provider.upper()}_{kind.upper()}_CONCURRENCY", default))
+
+
+class Slot:
+    """A granted slot. Release exactly once - directly or as a context manager."""
+
+    def __init__(self, lane: Optional["_Lane"]):
+        self._lane = lane
+        self._acquired_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if self._lane is not None:
+            self._lane.release(time.monotonic() - self._acquired_at)
+
+    def __enter__(self) -> "Slot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class _Lane:
+    """
+    Slots are handed out in arrival order: each waiter queues an Event, and a
+    release passes its slot straight to the oldest waiter instead of freeing it
+    for whoever grabs it first.
+    """
+
+    def __init__(self, provider: str, kind: str, limit: int, max_queue: int, queue_timeout: float):
+        self.provider = provider
+        self.kind = kind
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[threading.Event] = deque()
+        self._avg_hold = 1.0  # EWMA of slot hold time, for Retry-After
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _labels(self) -> Dict[str, str]:
+        return {"provider": self.provider, "kind": self.kind}
+
+    def retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a request joining the queue now."""
+        return max(1, math.ceil(self._avg_hold * (self.waiting + 1) / self.limit))
+
+    def _reject(self, reason: str, status_code: int, message: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(reason=reason, **self._labels())
+        retry_after = self.retry_after()
+        logger.warning(f"Rejected {self.kind} request for {self.provider} ({reason}), retry after {retry_after}s")
+        return AdmissionRejected(message, status_code, retry_after)
+
+    def acquire(self) -> Slot:
+        start = time.monotonic()
+        with self._lock:
+            # The fast path only applies when nobody is waiting
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                ADMISSION_IN_FLIGHT.inc(**self._labels())
+                ADMISSION_QUEUE_SECONDS.observe(0.0, **self._labels())
+                return Slot(self)
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject("queue_full", 429, f"Too many concurrent {self.kind} requests")
+            granted = threading.Event()
+            self._waiters.append(granted)
+            ADMISSION_QUEUED.inc(**self._labels())
+
+        if not granted.wait(self.queue_timeout):
+            with self._lock:
+                # A release may have handed over the slot right after the wait timed out
+                if not granted.is_set():
+                    self._waiters.remove(granted)
+                    ADMISSION_QUEUED.dec(**self._labels())
+                    raise self._reject("queue_timeout", 503, f"Timed out waiting for a {self.kind} slot")
+        ADMISSION_QUEUE_SECONDS.observe(time.monotonic() - start, **self._labels())
+        return Slot(self)
+
+    def release(self, held_seconds: float) -> None:
+        with self._lock:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_seconds
+            if self._waiters:
+                # The slot stays taken: active and the in-flight gauge are unchanged
+                self._waiters.popleft().set()
+                ADMISSION_QUEUED.dec(**self._labels())
+                return
+            self.active -= 1
+        ADMISSION_IN_FLIGHT.dec(**self._labels())
+
+
+class AdmissionController:
+    """Process-wide lanes, created on first use per (provider, kind)."""
+
+    def __init__(
+        self,
+        max_queue: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._lanes: Dict[Tuple[str, str], Optional[_Lane]] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, provider: str, kind: str) -> Optional[_Lane]:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown admission kind: {kind}. Options: {', '.join(KINDS)}")
+        key = (provider or "default", kind)
+        with self._lock:
+            if key not in self._lanes:
+                limit = concurrency_limit(*key)
+                self._lanes[key] = _Lane(*key, limit, self._max_queue, self._queue_timeout) if limit > 0 else None
+            return self._lanes[key]
+
+    def acquire(self, provider: str, kind: str) -> Slot:
+        """
+        Block until a slot is free (within the queue timeout) and return it.
+
+        Raises:
+            AdmissionRejected: 429 when the wait queue is full, 503 when the wait timed out
+        """
+        lane = self._lane(provider, kind)
+        return lane.acquire() if lane is not None else Slot(None)
+
+
+admission = AdmissionController()
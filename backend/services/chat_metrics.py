@@ -0,0 +1,169 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Per-request stage latencies and counters for ChatService.
+
+One RequestMetrics is created per chat request and passed down the pipeline
+like the Deadline, so every stage is recorded with the same lang / character /
+provider labels:
+
+    compose_query   building the texts to embed and fusing turn embeddings
+    embed           embedding call (labelled with the embedding provider)
+    vector_query    vector-store search, including re-ranking
+    rerank          re-ranking alone
+    format_context  context string and prompt messages
+    ttft            LLM call to first answer text (streams)
+    generation      LLM call until the answer is complete
+    sse_write       handing one frame to the WSGI server (recorded by the route)
+
+All of it is exposed on /metrics; compare the chat_stage_seconds quantiles
+per stage to see which one drives the tail.
+
+The same object collects what it records and finish() writes it as one
+request trace line (utils/request_trace.py):
+
+    {"ts", "request_id", "session_id", "mode", "lang", "character", "provider",
+     "embed_provider", "status", "error_stage", "query", "total_ms", "route", "error",
+     "stages_ms": {stage: ms}, "tokens": {kind: n}, "cache": {cache: "hit"|"miss"},
+     "docs": [{"doc_id", "distance"}]}
+"""
+
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from component.base import Usage
+from utils.metrics import metrics
+from utils.request_trace import write_trace
+
+# Queries are kept in traces only this long, enough to recognise them
+TRACE_QUERY_CHARS = 200
+
+_LABELS = ("stage", "lang", "character", "provider")
+
+# chat_tokens_total kind -> Usage field
+_TOKEN_KINDS = {
+    "prompt": "prompt_tokens",
+    "cached_prompt": "cached_prompt_tokens",
+    "completion": "completion_tokens",
+    "embedding": "embedding_tokens",
+}
+
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "chat_stage_seconds", "Wall time of each chat pipeline stage", _LABELS
+)
+CHAT_TOKENS = metrics.counter(
+    "chat_tokens_total",
+    "Tokens per kind (prompt, completion, cached_prompt, embedding); provider-reported where available, estimated otherwise",
+    ("kind", "lang", "character", "provider"),
+)
+CHAT_CACHE_LOOKUPS = metrics.counter(
+    "chat_cache_lookups_total", "Cache lookups in the chat pipeline by cache and result (hit/miss)",
+    ("cache", "result", "lang", "character", "provider"),
+)
+CHAT_ERRORS = metrics.counter(
+    "chat_errors_total", "Chat requests that failed, by the stage they failed in", _LABELS
+)
+
+
+class RequestMetrics:
+    """Label set of one request, helpers to record into the chat_* metrics, and its trace record."""
+
+    def __init__(
+        self,
+        lang: Optional[str],
+        character: Optional[str],
+        provider: Optional[str],
+        embed_provider: Optional[str] = None,
+        session_id: Optional[str] = None,
+        mode: str = "",
+    ):
+        self.lang = lang or "en"
+        self.character = (character or "default").lower()
+        self.provider = provider or "default"
+        self.embed_provider = embed_provider or self.provider
+        self.session_id = session_id
+        self.mode = mode
+        self.request_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.stage_seconds: Dict[str, float] = {}
+        self.usage = Usage()
+        self.cache_results: Dict[str, str] = {}
+        self.docs: List[Dict[str, Any]] = []
+        self.error_stage: Optional[str] = None
+        self._finished = False
+
+    def _labels(self, provider: Optional[str] = None) -> dict:
+        return {"lang": self.lang, "character": self.character, "provider": provider or self.provider}
+
+    def observe(self, stage: str, seconds: float, provider: Optional[str] = None) -> None:
+        CHAT_STAGE_SECONDS.observe(seconds, stage=stage, **self._labels(provider))
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str, provider: Optional[str] = None):
+        """Time the enclosed block as `stage`; an exception escaping it is counted as an error of that stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage, provider)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, provider)
+
+    def add_usage(self, usage: Usage, provider: Optional[str] = None) -> None:
+        """Add one LLM / embedding call's usage to this request and to chat_tokens_total."""
+        self.usage.add_usages(usage)
+        for kind, field in _TOKEN_KINDS.items():
+            count = getattr(usage, field)
+            if count:
+                CHAT_TOKENS.inc(count, kind=kind, **self._labels(provider))
+
+    def cache(self, cache: str, hit: bool) -> None:
+        result = "hit" if hit else "miss"
+        CHAT_CACHE_LOOKUPS.inc(cache=cache, result=result, **self._labels())
+        self.cache_results[cache] = result
+
+    def error(self, stage: str, provider: Optional[str] = None) -> None:
+        CHAT_ERRORS.inc(stage=stage, **self._labels(provider))
+        self.error_stage = self.error_stage or stage
+
+    def retrieved(self, retrieved_docs: List[tuple]) -> None:
+        """Remember which documents (id and distance) the answer was grounded on."""
+        self.docs = [
+            {
+                "doc_id": (metadata or {}).get("doc_id") or (metadata or {}).get("filename"),
+                "distance": round(float(distance), 4) if distance is not None else None,
+            }
+            for _, metadata, distance in retrieved_docs
+        ]
+
+    def finish(self, status: str = "ok", query: Optional[str] = None, **fields) -> bool:
+        """Write this request's trace record. Only the first call counts (and returns True)."""
+        if self._finished:
+            return False
+        self._finished = True
+        write_trace({
+            "ts": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "request_id": self.request_id,
+            "session_id": self.session_id,
+            "mode": self.mode,
+            "lang": self.lang,
+            "character": self.character,
+            "provider": self.provider,
+            "embed_provider": self.embed_provider,
+            "status": status,
+            "error_stage": self.error_stage,
+            "query": (query or "")[:TRACE_QUERY_CHARS],
+            "total_ms": round((time.time() - self.started_at) * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_seconds.items()},
+            "tokens": {kind: getattr(self.usage, field) for kind, field in _TOKEN_KINDS.items() if getattr(self.usage, field)},
+            "cache": self.cache_results,
+            "docs": self.docs,
+            **fields,
+        })
+        return True
@@ -5,21 +5,92 @@ import sys
 sys.path.append("./")
 sys.path.append("../")
 
-from typing import List, Dict, Optional, Any, Tuple
+from typing import List, Dict, Optional, Any, Tuple, Callable
+from dataclasses import replace
+import os
 import re
 import time
 import threading
 import uuid
 import asyncio
+import inspect
 from llm import llm_client, embed_client
+from llm.rate_limiter import estimate_tokens
+from llm.resilience import Deadline, DeadlineExceeded
+from component.base import Usage
 from db.chroma_vectordb import ChromaUsage
+from services.reranker import LexicalReranker, create_reranker
+from services.query_router import QueryRouter, ROUTE_COT, ROUTE_DIRECT
+from services.stream_registry import StreamRegistry
+from services.chat_metrics import RequestMetrics
+from services.singleflight import SINGLEFLIGHT_ENABLED, Flight, StreamFlights, flight_key
+from services.retrieval_cache import (
+    RETRIEVAL_REUSE_THRESHOLD,
+    RetrievalRecord,
+    cosine_similarity,
+    fuse_embeddings,
+    is_anaphoric_followup,
+    merge_docs,
+)
 from utils.app_logger import LoggerSetup
+from utils.answer_extractor import AnswerExtractor, extract_answer
+from utils.async_bridge import get_async_bridge
+from utils.sse import coalesce_tokens
+from utils.metrics import metrics, TOKEN_BUCKETS
 from config import prompts
 
 logger = LoggerSetup("ChatService").logger
 
+
+def _resolve(result):
+    """Provider clients are sync (Azure) or async (OpenAI, Claude, failover); sync callers run the latter on the shared loop."""
+    return get_async_bridge().run(result) if inspect.isawaitable(result) else result
+
+
+async def _acall(fn, *args, **kwargs):
+    """
+    Async counterpart of _resolve. A sync provider call (Azure) runs in a worker thread:
+    on the shared loop it would stall every other stream until it returned.
+    """
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args, **kwargs)
+    result = await asyncio.to_thread(fn, *args, **kwargs)
+    return await result if inspect.isawaitable(result) else result
+
 chroma_usage_en = ChromaUsage(collection_name="chat_cv_en")
 chroma_usage_zhtw = ChromaUsage(collection_name="chat_cv_zhtw")
+
+# How many vector-store candidates to fetch per final document when re-ranking
+RERANK_CANDIDATE_MULTIPLIER = int(os.getenv("RERANK_CANDIDATE_MULTIPLIER", "4"))
+
+# Documents passed to the LLM when a request doesn't set k. Re-ranked results are
+# better ordered, so fewer of them are needed (see benchmarks/bench_rerank.py).
+DEFAULT_K = 5
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+
+# End-to-end time budget of one chat request (embed -> retrieve -> generate), seconds
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+
+# First per-request slot of a prompt template, e.g. "<history_dialogue>{history}"
+_TEMPLATE_SLOT_RE = re.compile(r"<\w+>\{\w+\}")
+
+# The answer block is the last thing we need from the model; stop generating right after it
+ANSWER_STOP_SEQUENCES = ["</answer>"]
+
+ROUTE_REQUESTS = metrics.counter(
+    "chat_route_requests_total", "Chat requests per generation route", ("route", "mode")
+)
+ROUTE_GENERATION_SECONDS = metrics.histogram(
+    "chat_route_generation_seconds", "LLM generation wall time per route", ("route", "mode")
+)
+ROUTE_TTFT_SECONDS = metrics.histogram(
+    "chat_route_ttft_seconds", "Time from LLM call to first streamed answer text per route", ("route",)
+)
+ROUTE_OUTPUT_TOKENS = metrics.histogram(
+    "chat_route_output_tokens", "Completion tokens per request and route (estimated when usage is unavailable)",
+    ("route", "mode"), buckets=TOKEN_BUCKETS
+)
+
 class ChatService:
     """Service for handling chat interactions with RAG (Retrieval Augmented Generation)."""
     
@@ -27,7 +98,15 @@ class ChatService:
         self.llm = llm_client
         self.embed_client = embed_client
         self.vectorstore = chroma_usage_en
+        self.reranker = create_reranker()
+        self._check_rerank_metric()
+        self.router = QueryRouter()
         self._conversation_store = _ConversationStore()
+        self._streams = StreamRegistry()
+        self._flights = StreamFlights()
+        # Token usage of every request since start (sessions keep their own in the store)
+        self._usage = Usage()
+        self._usage_lock = threading.Lock()
 
     def clear_history(self, session_id: str) -> bool:
         """Manually clear a single session's history. Returns True if removed."""
@@ -55,6 +134,65 @@ class ChatService:
         else:
             return prompts.HR_cot_system_prompt
 
+    def get_direct_prompt(self, character: Optional[str] = None) -> str:
+        """
+        Get the direct-answer (non-CoT) prompt template for the interviewer character.
+        """
+        if character == "engineer":
+            return prompts.EM_prompt
+        return prompts.HR_prompt
+
+    def _route(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> str:
+        """
+        Pick the generation route. A caller-supplied system prompt always takes the CoT path.
+        """
+        if system_prompt:
+            return ROUTE_COT
+        route = self.router.route(query, conversation_history)
+        logger.info(f"Query routed to {route}: {query[:50]}...")
+        return route
+
+    @staticmethod
+    def _generation_usage(usage: Optional[Usage], messages: List[dict], output_chars: int) -> Usage:
+        """
+        The provider-reported usage of a generation, with prompt / completion tokens
+        estimated from the messages and the output length where it reported none
+        (e.g. a stream closed before its final usage chunk).
+        """
+        usage = usage or Usage()
+        if not usage.prompt_tokens:
+            usage.prompt_tokens = estimate_tokens([str(m.get("content") or "") for m in messages])
+        if not usage.completion_tokens:
+            usage.completion_tokens = max(1, output_chars // 4)
+        return usage
+
+    def _finish(self, stats: RequestMetrics, status: str = "ok", query: Optional[str] = None, **fields) -> None:
+        """Write the request's trace and add its usage to its session's and the process totals, once."""
+        if not stats.finish(status, query=query, **fields):
+            return
+        with self._usage_lock:
+            self._usage.add_usages(stats.usage)
+        if stats.session_id:
+            self._conversation_store.add_usage(stats.session_id, stats.usage)
+
+    def usage_summary(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Token usage since the process started and, if given, of one session."""
+        with self._usage_lock:
+            summary = {"process": self._usage.get_usages()}
+        if session_id:
+            summary["session"] = self._conversation_store.get_usage(session_id)
+        return summary
+
+    def _record_route_metrics(self, route: str, mode: str, generation_seconds: float, completion_tokens: int) -> None:
+        ROUTE_REQUESTS.inc(route=route, mode=mode)
+        ROUTE_GENERATION_SECONDS.observe(generation_seconds, route=route, mode=mode)
+        ROUTE_OUTPUT_TOKENS.observe(completion_tokens, route=route, mode=mode)
+
     def get_or_create_session_id(self, session_id: Optional[str] = None, timeout_seconds: int = 180) -> str:
         """
         Get or create a session_id based on the timeout rule.
@@ -83,43 +221,293 @@ class ChatService:
         else:
             return last_session_id
     
-    def _retrieve_context(self, query: str, k: int = 5) -> List[tuple]:
+    def _final_k(self, k: Optional[int] = None) -> int:
+        """
+        Number of documents to keep: the request's k, else RERANK_TOP_N when re-ranking.
+        """
+        if k is not None:
+            return k
+        return DEFAULT_K if self.reranker is None else RERANK_TOP_N
+
+    def _check_rerank_metric(self) -> None:
+        """
+        The lexical re-ranker reads distances as cosine distances; warn when a collection uses another metric.
+        """
+        if not isinstance(self.reranker, LexicalReranker):
+            return
+        for store in (chroma_usage_en, chroma_usage_zhtw):
+            if store.collection is None:
+                continue
+            # Chroma's default space is l2
+            metric = (store.collection.metadata or {}).get("hnsw:space", "l2")
+            if metric != self.reranker.metric:
+                logger.warning(
+                    f'Collection "{store.collection_name}" uses {metric} distance but the lexical re-ranker '
+                    f"assumes {self.reranker.metric}; re-ranking scores will be skewed"
+                )
+
+    def _candidate_k(self, k: int, fetch_k: Optional[int] = None) -> int:
         """
-        Asynchronously retrieve relevant context from the vectorstore using hybrid search.
+        Number of candidates to pull from the vectorstore before re-ranking down to k.
         """
+        if self.reranker is None:
+            return k
+        return max(k, fetch_k or k * RERANK_CANDIDATE_MULTIPLIER)
+
+    def _rerank(
+        self, query: str, candidates: List[tuple], k: int, stats: Optional[RequestMetrics] = None
+    ) -> List[tuple]:
+        """
+        Re-score the candidate set with the configured re-ranker and keep the top k.
+        """
+        if self.reranker is None or len(candidates) <= 1:
+            return candidates[:k]
+
+        t = time.time()
+        if stats is not None:
+            with stats.stage("rerank"):
+                results = self.reranker.rerank(query, candidates, top_n=k)
+        else:
+            results = self.reranker.rerank(query, candidates, top_n=k)
+        logger.info(f"Re-ranked {len(candidates)} -> {len(results)} documents with {self.reranker.name} ({time.time()-t:.3f} sec)")
+        return results
+
+    def _get_vectorstore(self, lang: Optional[str]) -> ChromaUsage:
+        """
+        The collection for a request's language. Resolved per request rather than stored on
+        the shared service so concurrent requests in different languages don't interfere.
+        """
+        return chroma_usage_zhtw if lang == "zhtw" else chroma_usage_en
+
+    def _cached_retrieval(self, session_id: Optional[str], vectorstore: ChromaUsage) -> Optional[RetrievalRecord]:
+        """
+        The session's last retrieval, if it was made against the current collection.
+        """
+        if not session_id:
+            return None
+        record = self._conversation_store.get_last_retrieval(session_id)
+        if record is None or record.collection != vectorstore.collection_name:
+            return None
+        return record
+
+    def _search(
+        self,
+        vectorstore: ChromaUsage,
+        query_embedding: List[List[float]],
+        k: int,
+        query: str,
+        fetch_k: Optional[int] = None,
+        stats: Optional[RequestMetrics] = None,
+    ) -> List[tuple]:
+        """
+        Query the vectorstore and re-rank the candidates down to k.
+        """
+        candidates = vectorstore.query_collection(
+            query_embedding=query_embedding,
+            k=self._candidate_k(k, fetch_k)
+        )
+        return self._rerank(query, candidates, k, stats)
+
+    def _reuse_retrieval(
+        self,
+        vectorstore: ChromaUsage,
+        record: RetrievalRecord,
+        k: int,
+        query: str,
+        fetch_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+        stats: Optional[RequestMetrics] = None,
+    ) -> List[tuple]:
+        """
+        Serve the session's cached context, topping it up with a search on the cached
+        vector only when it holds fewer than k documents.
+        """
+        docs = record.docs[:k]
+        if len(docs) < k:
+            fresh = self._search(vectorstore, [record.embedding], k + len(docs), query, fetch_k, stats)
+            docs = merge_docs(docs, fresh, k)
+            if session_id:
+                self._conversation_store.set_last_retrieval(
+                    session_id, replace(record, docs=docs, created_at=time.time())
+                )
+        return docs
+
+    def _search_or_reuse(
+        self,
+        vectorstore: ChromaUsage,
+        query: str,
+        query_embedding: List[List[float]],
+        k: int,
+        fetch_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+        record: Optional[RetrievalRecord] = None,
+        stats: Optional[RequestMetrics] = None,
+    ) -> List[tuple]:
+        """
+        Reuse the previous retrieval when the new vector is close enough to it,
+        otherwise search and remember the result for the session.
+        """
+        if record is not None:
+            similarity = cosine_similarity(query_embedding[0], record.embedding)
+            if similarity >= RETRIEVAL_REUSE_THRESHOLD:
+                logger.info(f"Reusing previous retrieval (similarity {similarity:.3f})")
+                if stats is not None:
+                    stats.cache("retrieval", hit=True)
+                return self._reuse_retrieval(vectorstore, record, k, query, fetch_k, session_id, stats)
+
+        if stats is not None:
+            stats.cache("retrieval", hit=False)
+        results = self._search(vectorstore, query_embedding, k, query, fetch_k, stats)
+        if session_id and results:
+            self._conversation_store.set_last_retrieval(session_id, RetrievalRecord(
+                collection=vectorstore.collection_name,
+                query=query,
+                embedding=list(query_embedding[0]),
+                docs=results,
+            ))
+        return results
+
+    def _embedding_inputs(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict[str, str]]],
+        turn_embeddings: List[Optional[List[float]]],
+    ) -> List[str]:
+        """
+        Texts to embed for this turn. Only the new user message is embedded when the session
+        has cached turn embeddings to fuse with; history supplied without cached embeddings
+        falls back to also embedding the history-composed query (in the same call).
+        """
+        if not conversation_history or any(e is not None for e in turn_embeddings):
+            return [query]
+        return [query, self._compose_retrieval_query(query, conversation_history)]
+
+    def _retrieval_vector(
+        self,
+        embeddings: List[List[float]],
+        turn_embeddings: List[Optional[List[float]]],
+    ) -> List[float]:
+        """
+        The vector to search with: the composed-query embedding in the fallback case,
+        otherwise the recency-weighted fusion of this turn with the cached turn embeddings.
+        """
+        if len(embeddings) > 1:
+            return embeddings[1]
+        return fuse_embeddings(embeddings[0], turn_embeddings)
+
+    def _retrieve_context(
+        self,
+        vectorstore: ChromaUsage,
+        query: str,
+        k: int = 5,
+        fetch_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        deadline: Optional[Deadline] = None,
+        stats: Optional[RequestMetrics] = None,
+        lang: str = "en",
+    ) -> Tuple[List[tuple], Optional[List[float]]]:
+        """
+        Retrieve relevant context from the vectorstore, re-ranking a larger candidate set down to k.
+        Short anaphoric follow-ups and near-duplicate queries reuse the session's previous retrieval.
+
+        `lang` only labels the metrics recorded when no `stats` is passed.
+
+        Returns:
+            (retrieved docs, embedding of this turn's user message or None if it wasn't embedded)
+        """
+        stats = stats or RequestMetrics(lang, None, self.llm.provider, self.embed_client.provider)
         try:
-            # Get embedding for the query
-            query_embedding = self.embed_client.embed(query)
-            
-            # Query the vectorstore
-            results = self.vectorstore.query_collection(
-                query_embedding=query_embedding,
-                k=k
-            )
+            record = self._cached_retrieval(session_id, vectorstore)
+            if record is not None and is_anaphoric_followup(query):
+                logger.info(f"Reusing previous retrieval for follow-up: {query[:50]}...")
+                stats.cache("retrieval", hit=True)
+                with stats.stage("vector_query"):
+                    return self._reuse_retrieval(vectorstore, record, k, query, fetch_k, session_id, stats), None
+
+            # Query composition happens on both sides of the embedding call; recorded as one stage
+            compose_start = time.perf_counter()
+            turn_embeddings = self._conversation_store.get_turn_embeddings(session_id) if session_id else []
+            inputs = self._embedding_inputs(query, conversation_history, turn_embeddings)
+            compose_seconds = time.perf_counter() - compose_start
+            embed_usage = Usage()
+            with stats.stage("embed", provider=stats.embed_provider):
+                embeddings = _resolve(self.embed_client.embed(inputs, deadline=deadline, usage=embed_usage))
+            stats.add_usage(embed_usage, provider=stats.embed_provider)
+            compose_start = time.perf_counter()
+            retrieval_vector = self._retrieval_vector(embeddings, turn_embeddings)
+            stats.observe("compose_query", compose_seconds + time.perf_counter() - compose_start)
+            if deadline is not None:
+                deadline.check("retrieval")
+
+            with stats.stage("vector_query"):
+                results = self._search_or_reuse(
+                    vectorstore, query, [retrieval_vector], k, fetch_k, session_id, record, stats
+                )
             logger.info(f"Retrieved {len(results)} documents for query: {query[:50]}...")
-            return results
+            return results, embeddings[0]
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving context: {e}", exc_info=True)
-            return []
+            return [], None
 
-    async def _aretrieve_context(self, query: str, k: int = 5) -> List[tuple]:
+    async def _aretrieve_context(
+        self,
+        vectorstore: ChromaUsage,
+        query: str,
+        k: int = 5,
+        fetch_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        deadline: Optional[Deadline] = None,
+        stats: Optional[RequestMetrics] = None,
+        lang: str = "en",
+    ) -> Tuple[List[tuple], Optional[List[float]]]:
         """
-        Asynchronously retrieve relevant context from the vectorstore using hybrid search.
+        Asynchronously retrieve relevant context from the vectorstore, re-ranking a larger candidate set down to k.
+        Short anaphoric follow-ups and near-duplicate queries reuse the session's previous retrieval.
+
+        `lang` only labels the metrics recorded when no `stats` is passed.
+
+        Returns:
+            (retrieved docs, embedding of this turn's user message or None if it wasn't embedded)
         """
+        stats = stats or RequestMetrics(lang, None, self.llm.provider, self.embed_client.provider)
         try:
-            # Get embedding for the query
-            query_embedding = await self.embed_client.embed(query)
-            
-            # Query the vectorstore
-            results = self.vectorstore.query_collection(
-                query_embedding=query_embedding,
-                k=k
-            )
+            record = self._cached_retrieval(session_id, vectorstore)
+            if record is not None and is_anaphoric_followup(query):
+                logger.info(f"Reusing previous retrieval for follow-up: {query[:50]}...")
+                stats.cache("retrieval", hit=True)
+                with stats.stage("vector_query"):
+                    return self._reuse_retrieval(vectorstore, record, k, query, fetch_k, session_id, stats), None
+
+            # Query composition happens on both sides of the embedding call; recorded as one stage
+            compose_start = time.perf_counter()
+            turn_embeddings = self._conversation_store.get_turn_embeddings(session_id) if session_id else []
+            inputs = self._embedding_inputs(query, conversation_history, turn_embeddings)
+            compose_seconds = time.perf_counter() - compose_start
+            embed_usage = Usage()
+            with stats.stage("embed", provider=stats.embed_provider):
+                embeddings = await _acall(self.embed_client.embed, inputs, deadline=deadline, usage=embed_usage)
+            stats.add_usage(embed_usage, provider=stats.embed_provider)
+            compose_start = time.perf_counter()
+            retrieval_vector = self._retrieval_vector(embeddings, turn_embeddings)
+            stats.observe("compose_query", compose_seconds + time.perf_counter() - compose_start)
+            if deadline is not None:
+                deadline.check("retrieval")
+
+            with stats.stage("vector_query"):
+                results = self._search_or_reuse(
+                    vectorstore, query, [retrieval_vector], k, fetch_k, session_id, record, stats
+                )
             logger.info(f"Retrieved {len(results)} documents for query: {query[:50]}...")
-            return results
+            return results, embeddings[0]
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving context: {e}", exc_info=True)
-            return []
+            return [], None
     
     def _compose_retrieval_query(
         self,
@@ -166,24 +554,72 @@ class ChatService:
         context_parts = [f"[Source: {metadata.get('filename', 'unknown')}]\n{doc}" for doc, metadata, distance in retrieved_docs]
         return "\n\n---\n\n".join(context_parts)
     
+    @staticmethod
+    def _language_instruction(lang: Optional[str]) -> str:
+        """
+        Explicit response-language instruction for the lang parameter.
+        """
+        if lang == "zhtw":
+            return "<language_instruction>你必須使用繁體中文回答。</language_instruction>"
+        if lang == "en":
+            return "<language_instruction>You must respond in English.</language_instruction>"
+        return ""
+
+    @staticmethod
+    def _split_prompt_template(template: str) -> Tuple[str, str]:
+        """
+        Split a single-template prompt at its first slot (e.g. "<history_dialogue>{history}")
+        into the static instructions and the part to be formatted per request.
+        """
+        match = _TEMPLATE_SLOT_RE.search(template)
+        if match is None:
+            return template, ""
+        return template[:match.start()].rstrip(), template[match.start():]
+
     def _build_messages(
         self,
         user_query: str,
         context: str,
         conversation_history: Optional[List[Dict[str, str]]] = None,
         system_prompt: Optional[str] = None,
-        lang: Optional[str] = None
+        lang: Optional[str] = None,
+        route: str = ROUTE_COT,
+        character: Optional[str] = None,
     ) -> List[Dict[str, str]]:
         """
         Build messages for the LLM.
-        """
-        system_prompt = system_prompt or self.get_system_prompt()
 
+        The CoT route uses the persona CoT system prompt plus cot_user_prompt; the direct
+        route uses the single-template HR_prompt / EM_prompt, which already ends at <answer>.
+
+        Either way the system message holds only static text (persona, rules, language),
+        so it is a byte-identical prefix the providers can serve from their prompt cache
+        (see llm/prompt_cache.py). Everything per-request - history, then retrieved
+        context, then the question - goes into the user message.
+        """
         conversation_history_str = ""
         if conversation_history:
             for msg in conversation_history:
                 conversation_history_str += f"{msg.get('role')}: {msg.get('content')}\n"
 
+        language_instruction = self._language_instruction(lang)
+
+        if route == ROUTE_DIRECT:
+            instructions, slots = self._split_prompt_template(self.get_direct_prompt(character))
+            user_prompt = slots.format(
+                context_str=context,
+                history=conversation_history_str,
+                query_str=user_query
+            )
+            if language_instruction:
+                instructions += f"\n\n{language_instruction}"
+            return [
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": user_prompt}
+            ]
+
+        system_prompt = system_prompt or self.get_system_prompt()
+
         user_prompt = prompts.cot_user_prompt.format(
             context_str=context,
             history=conversation_history_str,
@@ -191,10 +627,8 @@ class ChatService:
         )
 
         # Add explicit language instruction based on lang parameter
-        if lang == "zhtw":
-            user_prompt += "\n\n<language_instruction>你必須使用繁體中文回答。</language_instruction>"
-        elif lang == "en":
-            user_prompt += "\n\n<language_instruction>You must respond in English.</language_instruction>"
+        if language_instruction:
+            user_prompt += f"\n\n{language_instruction}"
 
         return [
             {"role": "system", "content": system_prompt},
@@ -205,11 +639,14 @@ class ChatService:
         """
         Process a chat query with RAG asynchronously.
         """
-        self.lang = kwargs.get("lang", "en")
-        if self.lang == "zhtw":
-            self.vectorstore = chroma_usage_zhtw
-        else:
-            self.vectorstore = chroma_usage_en
+        lang = kwargs.get("lang", "en")
+        vectorstore = self._get_vectorstore(lang)
+        # One time budget for embed -> retrieve -> generate
+        deadline = Deadline(kwargs.get("timeout") or REQUEST_DEADLINE_SECONDS)
+        stats = RequestMetrics(
+            lang, kwargs.get("character"), self.llm.provider, self.embed_client.provider,
+            session_id=kwargs.get("session_id"), mode="chat",
+        )
 
         try:
             self._conversation_store.cleanup_expired()
@@ -220,60 +657,83 @@ class ChatService:
                 conversation_history = self._conversation_store.get_history(session_id)
 
             query = kwargs["query"]
-            retrieval_query = self._compose_retrieval_query(query, conversation_history)
-            retrieved_docs = self._retrieve_context(retrieval_query, k=kwargs.get("k", 5))
-            context = self._format_context(retrieved_docs)
+            retrieved_docs, query_embedding = self._retrieve_context(
+                vectorstore,
+                query,
+                k=self._final_k(kwargs.get("k")),
+                fetch_k=kwargs.get("fetch_k"),
+                session_id=session_id,
+                conversation_history=conversation_history,
+                deadline=deadline,
+                stats=stats,
+            )
+            stats.retrieved(retrieved_docs)
             
-            if not context:
-                return {"content": None, "usage": None, "retrieved_docs_count": 0, "context_used": False}
+            if not retrieved_docs:
+                self._finish(stats, "no_context", query=query)
+                return {"content": None, "usage": stats.usage.get_usages(), "retrieved_docs_count": 0, "context_used": False}
 
             system_prompt = kwargs.get("system_prompt") or self.get_system_prompt(kwargs.get("character"))
+            route = self._route(query, conversation_history, system_prompt=kwargs.get("system_prompt"))
             
-            messages = self._build_messages(
-                user_query=query,
-                context=context,
-                conversation_history=conversation_history,
-                system_prompt=system_prompt,
-                lang=self.lang
-            )
+            with stats.stage("format_context"):
+                context = self._format_context(retrieved_docs)
+                messages = self._build_messages(
+                    user_query=query,
+                    context=context,
+                    conversation_history=conversation_history,
+                    system_prompt=system_prompt,
+                    lang=lang,
+                    route=route,
+                    character=kwargs.get("character"),
+                )
 
             # Only pass relevant kwargs to llm.chat()
             llm_kwargs = {
                 k: v for k, v in kwargs.items()
                 if k in ("temperature", "max_tokens", "engine")
             }
-            response = self.llm.chat(messages=messages, **llm_kwargs)
+            generation_start = time.time()
+            with stats.stage("generation"):
+                deadline.check("generation")
+                response = _resolve(
+                    self.llm.chat(messages=messages, stop=ANSWER_STOP_SEQUENCES, deadline=deadline, **llm_kwargs)
+                )
             response_content = response.get("content", "")
-            logger.info(f"LLM Raw Response Content: {response_content}")
+            logger.debug(f"LLM Raw Response Content: {response_content}")
+            usage = self._generation_usage(response.get("usage"), messages, len(response_content or ""))
+            stats.add_usage(usage)
+            self._record_route_metrics(route, "chat", time.time() - generation_start, usage.completion_tokens)
 
-            content_after_answer = re.search(r'<answer>(.*)', response_content, re.DOTALL)
-            response_content = content_after_answer.group(1).strip() if content_after_answer else response_content
-
-            content_before_answer = re.search(r'(.*)</answer>', response_content, re.DOTALL)
-            final_answer = content_before_answer.group(1).strip() if content_before_answer else response_content
+            final_answer = extract_answer(response_content)
             
             if session_id and final_answer:
-                self._conversation_store.append(session_id, query, final_answer)
+                self._conversation_store.append(session_id, query, final_answer, user_embedding=query_embedding)
 
+            self._finish(stats, query=query, route=route)
             return {
                 "content": final_answer,
-                "usage": response.get("usage", {}),
+                "usage": stats.usage.get_usages(),
                 "retrieved_docs_count": len(retrieved_docs),
                 "context_used": bool(context)
             }
         except Exception as e:
             logger.error(f"Error in async chat service: {e}", exc_info=True)
+            self._finish(stats, "error", query=kwargs.get("query"), error=type(e).__name__)
             raise
         
     async def achat(self, **kwargs) -> Dict[str, Any]:
         """
         Process a chat query with RAG asynchronously.
         """
-        self.lang = kwargs.get("lang", "en")
-        if self.lang == "zhtw":
-            self.vectorstore = chroma_usage_zhtw
-        else:
-            self.vectorstore = chroma_usage_en
+        lang = kwargs.get("lang", "en")
+        vectorstore = self._get_vectorstore(lang)
+        # One time budget for embed -> retrieve -> generate
+        deadline = Deadline(kwargs.get("timeout") or REQUEST_DEADLINE_SECONDS)
+        stats = RequestMetrics(
+            lang, kwargs.get("character"), self.llm.provider, self.embed_client.provider,
+            session_id=kwargs.get("session_id"), mode="chat",
+        )
 
         try:
             self._conversation_store.cleanup_expired()
@@ -284,62 +744,113 @@ class ChatService:
                 conversation_history = self._conversation_store.get_history(session_id)
 
             query = kwargs["query"]
-            retrieval_query = self._compose_retrieval_query(query, conversation_history)
-            retrieved_docs = await self._aretrieve_context(retrieval_query, k=kwargs.get("k", 5))
-            context = self._format_context(retrieved_docs)
+            retrieved_docs, query_embedding = await self._aretrieve_context(
+                vectorstore,
+                query,
+                k=self._final_k(kwargs.get("k")),
+                fetch_k=kwargs.get("fetch_k"),
+                session_id=session_id,
+                conversation_history=conversation_history,
+                deadline=deadline,
+                stats=stats,
+            )
+            stats.retrieved(retrieved_docs)
             
-            if not context:
-                return {"content": None, "usage": None, "retrieved_docs_count": 0, "context_used": False}
+            if not retrieved_docs:
+                self._finish(stats, "no_context", query=query)
+                return {"content": None, "usage": stats.usage.get_usages(), "retrieved_docs_count": 0, "context_used": False}
 
             system_prompt = kwargs.get("system_prompt") or self.get_system_prompt(kwargs.get("character"))
+            route = self._route(query, conversation_history, system_prompt=kwargs.get("system_prompt"))
             
-            messages = self._build_messages(
-                user_query=query,
-                context=context,
-                conversation_history=conversation_history,
-                system_prompt=system_prompt,
-                lang=self.lang
-            )
+            with stats.stage("format_context"):
+                context = self._format_context(retrieved_docs)
+                messages = self._build_messages(
+                    user_query=query,
+                    context=context,
+                    conversation_history=conversation_history,
+                    system_prompt=system_prompt,
+                    lang=lang,
+                    route=route,
+                    character=kwargs.get("character"),
+                )
 
             # Only pass relevant kwargs to llm.chat()
             llm_kwargs = {
                 k: v for k, v in kwargs.items()
                 if k in ("temperature", "max_tokens", "engine")
             }
-            response = await self.llm.chat(messages=messages, **llm_kwargs)
+            generation_start = time.time()
+            with stats.stage("generation"):
+                deadline.check("generation")
+                response = await _acall(
+                    self.llm.chat, messages=messages, stop=ANSWER_STOP_SEQUENCES, deadline=deadline, **llm_kwargs
+                )
             response_content = response.get("content", "")
-            logger.info(f"LLM Raw Response Content: {response_content}")
-
-            content_after_answer = re.search(r'<answer>(.*)', response_content, re.DOTALL)
-            response_content = content_after_answer.group(1).strip() if content_after_answer else response_content
+            logger.debug(f"LLM Raw Response Content: {response_content}")
+            usage = self._generation_usage(response.get("usage"), messages, len(response_content or ""))
+            stats.add_usage(usage)
+            self._record_route_metrics(route, "chat", time.time() - generation_start, usage.completion_tokens)
 
-            content_before_answer = re.search(r'(.*)</answer>', response_content, re.DOTALL)
-            final_answer = content_before_answer.group(1).strip() if content_before_answer else response_content
+            final_answer = extract_answer(response_content)
             
             if session_id and final_answer:
-                self._conversation_store.append(session_id, query, final_answer)
+                self._conversation_store.append(session_id, query, final_answer, user_embedding=query_embedding)
 
+            self._finish(stats, query=query, route=route)
             return {
                 "content": final_answer,
-                "usage": response.get("usage", {}),
+                "usage": stats.usage.get_usages(),
                 "retrieved_docs_count": len(retrieved_docs),
                 "context_used": bool(context)
             }
         except Exception as e:
             logger.error(f"Error in async chat service: {e}", exc_info=True)
+            self._finish(stats, "error", query=kwargs.get("query"), error=type(e).__name__)
             raise
     
-    async def astream_chat(self, **kwargs):
+    @staticmethod
+    def _format_sources(retrieved_docs: List[tuple]) -> List[Dict[str, Any]]:
         """
-        Process a chat query with RAG and stream the response asynchronously.
+        Client-facing summary of the retrieved chunks: file, section path and distance.
         """
-        self.lang = kwargs.get("lang", "en")
-        if self.lang == "zhtw":
-            self.vectorstore = chroma_usage_zhtw
-        else:
-            self.vectorstore = chroma_usage_en
+        sources = []
+        for _, metadata, distance in retrieved_docs:
+            metadata = metadata or {}
+            headers = [
+                str(metadata[key]) for key in sorted(metadata)
+                if key.startswith("Header_") and metadata[key]
+            ]
+            sources.append({
+                "filename": metadata.get("filename", "unknown"),
+                "section": " > ".join(headers),
+                "distance": round(float(distance), 4) if distance is not None else None,
+                "doc_id": metadata.get("doc_id"),
+            })
+        return sources
+
+    async def astream_events(self, **kwargs):
+        """
+        Process a chat query with RAG and stream typed events asynchronously:
+
+            {"type": "sources", "sources": [...], "timings": {...}}   once, right after retrieval
+            {"type": "token", "content": "..."}                        answer text as it arrives
+            {"type": "usage", "usage": ..., "route": ..., "timings": {...}}   once, at the end
+
+        The sources event goes out before generation starts, so clients can render
+        citations while the model is still thinking.
+        """
+        lang = kwargs.get("lang", "en")
+        vectorstore = self._get_vectorstore(lang)
+        # One time budget for embed -> retrieve -> generate
+        deadline = Deadline(kwargs.get("timeout") or REQUEST_DEADLINE_SECONDS)
+        stats = RequestMetrics(
+            lang, kwargs.get("character"), self.llm.provider, self.embed_client.provider,
+            session_id=kwargs.get("session_id"), mode="stream",
+        )
 
         try:
+            request_start = time.time()
             self._conversation_store.cleanup_expired()
             session_id = kwargs.get("session_id")
             conversation_history = kwargs.get("conversation_history")
@@ -348,80 +859,205 @@ class ChatService:
                 conversation_history = self._conversation_store.get_history(session_id)
             
             query = kwargs["query"]
-            retrieval_query = self._compose_retrieval_query(query, conversation_history)
-            retrieved_docs = await self._aretrieve_context(retrieval_query, k=kwargs.get("k", 5))
-            context = self._format_context(retrieved_docs)
+            retrieved_docs, query_embedding = await self._aretrieve_context(
+                vectorstore,
+                query,
+                k=self._final_k(kwargs.get("k")),
+                fetch_k=kwargs.get("fetch_k"),
+                session_id=session_id,
+                conversation_history=conversation_history,
+                deadline=deadline,
+                stats=stats,
+            )
+            stats.retrieved(retrieved_docs)
+            retrieval_ms = (time.time() - request_start) * 1000
+            yield {
+                "type": "sources",
+                "sources": self._format_sources(retrieved_docs),
+                "timings": {"retrieval_ms": round(retrieval_ms, 1)},
+            }
             
             system_prompt = kwargs.get("system_prompt") or self.get_system_prompt(kwargs.get("character"))
+            route = self._route(query, conversation_history, system_prompt=kwargs.get("system_prompt"))
             
-            messages = self._build_messages(
-                user_query=query,
-                context=context,
-                conversation_history=conversation_history,
-                system_prompt=system_prompt,
-                lang=self.lang
-            )
+            with stats.stage("format_context"):
+                context = self._format_context(retrieved_docs)
+                messages = self._build_messages(
+                    user_query=query,
+                    context=context,
+                    conversation_history=conversation_history,
+                    system_prompt=system_prompt,
+                    lang=lang,
+                    route=route,
+                    character=kwargs.get("character"),
+                )
 
-            buffer = ""
-            final_answer = ""
-            start_tag_checked = False  # Whether we've determined if <answer> exists
-            is_answer_ended = False
+            extractor = AnswerExtractor()
 
             logger.info("Starting LLM stream...")
             chunk_count = 0
-            async for chunk in self.llm.stream(messages=messages):
-                chunk_count += 1
-                if chunk_count <= 3:
-                    logger.info(f"Received chunk {chunk_count}: {chunk[:50] if chunk else 'empty'}...")
-                if is_answer_ended:
-                    continue
-
-                buffer += chunk
-
-                # Phase 1: Determine if <answer> tag exists
-                if not start_tag_checked:
-                    print(buffer)
-                    start_match = re.search(r'<answer>', buffer)
-                    if start_match:
-                        start_tag_checked = True
-                        # Skip <answer> tag, discard content before it
-                        buffer = buffer[start_match.end():]
-                    elif len(buffer) > 8:
-                        # No <answer> tag found after sufficient content, output directly
-                        start_tag_checked = True
-                    else:
-                        # Not enough content to determine yet
-                        continue
-
-                # Phase 2: Output content while checking for </answer>
-                end_match = re.search(r'</answer>', buffer)
-                if end_match:
-                    content = buffer[:end_match.start()]
+            output_chars = 0
+            generation_start = time.time()
+            first_token_at = None
+            generation_usage = Usage()
+            llm_stream = self.llm.stream(
+                messages=messages, stop=ANSWER_STOP_SEQUENCES, deadline=deadline, usage=generation_usage
+            )
+            try:
+                deadline.check("generation")
+                async for chunk in llm_stream:
+                    chunk_count += 1
+                    output_chars += len(chunk)
+                    if chunk_count <= 3:
+                        logger.debug(f"Received chunk {chunk_count}: {chunk[:50] if chunk else 'empty'}...")
+
+                    content = extractor.feed(chunk)
                     if content:
-                        yield content
-                        final_answer += content
-                    is_answer_ended = True
-                else:
-                    # Keep last 9 chars for potential incomplete '</answer>'
-                    safe_length = len(buffer) - 9
-                    if safe_length > 0:
-                        content = buffer[:safe_length]
-                        yield content
-                        final_answer += content
-                        buffer = buffer[safe_length:]
-
-            # Output remaining buffer if no </answer> was found
-            if not is_answer_ended and buffer:
-                yield buffer
-                final_answer += buffer
+                        if first_token_at is None:
+                            first_token_at = time.time()
+                            ROUTE_TTFT_SECONDS.observe(first_token_at - generation_start, route=route)
+                            stats.observe("ttft", first_token_at - generation_start)
+                        yield {"type": "token", "content": content}
+                    if extractor.ended:
+                        # Nothing after </answer> is used; stop paying for it
+                        break
+            except Exception:
+                stats.error("generation")
+                raise
+            finally:
+                # Close the provider stream (and its HTTP connection) as soon as we stop reading
+                await llm_stream.aclose()
+
+            # Flush held-back characters, or the whole output if no <answer> block was found
+            content = extractor.finish()
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    ROUTE_TTFT_SECONDS.observe(first_token_at - generation_start, route=route)
+                    stats.observe("ttft", first_token_at - generation_start)
+                yield {"type": "token", "content": content}
+            final_answer = extractor.answer
+            finished_at = time.time()
+            usage = self._generation_usage(generation_usage, messages, output_chars)
+            stats.add_usage(usage)
+            self._record_route_metrics(route, "stream", finished_at - generation_start, usage.completion_tokens)
+            stats.observe("generation", finished_at - generation_start)
 
             logger.info(f"LLM stream completed. Total chunks: {chunk_count}, final_answer length: {len(final_answer)}")
 
             if session_id and final_answer:
-                self._conversation_store.append(session_id, query, final_answer)
+                self._conversation_store.append(session_id, query, final_answer, user_embedding=query_embedding)
+
+            self._finish(stats, query=query, route=route)
+            yield {
+                "type": "usage",
+                "usage": stats.usage.get_usages(),
+                "route": route,
+                "timings": {
+                    "retrieval_ms": round(retrieval_ms, 1),
+                    "ttft_ms": round((first_token_at - generation_start) * 1000, 1) if first_token_at else None,
+                    "generation_ms": round((finished_at - generation_start) * 1000, 1),
+                    "total_ms": round((finished_at - request_start) * 1000, 1),
+                },
+            }
         except Exception as e:
             logger.error(f"Error in async stream chat service: {e}", exc_info=True)
+            self._finish(stats, "error", query=kwargs.get("query"), error=type(e).__name__)
             raise
+        finally:
+            # Closed or cancelled before the answer was complete (no-op after finish above)
+            self._finish(stats, "cancelled", query=kwargs.get("query"))
+
+    async def astream_chat(self, **kwargs):
+        """
+        Process a chat query with RAG and stream the answer text asynchronously.
+        """
+        events = self.astream_events(**kwargs)
+        try:
+            async for event in events:
+                if event["type"] == "token":
+                    yield event["content"]
+        finally:
+            await events.aclose()
+
+    def start_stream(self, on_done: Optional[Callable[[], None]] = None, **kwargs) -> str:
+        """
+        Start a streamed answer in the background and return its stream id.
+
+        Generation is decoupled from the HTTP connection: events go into a replay
+        buffer that stream_events reads from, so a dropped client can resume with
+        the same id instead of asking again. Token events are coalesced (see
+        utils.sse.coalesce_tokens) so fast models don't produce one frame per chunk.
+        `on_done` is called when the generation ends, e.g. to release an admission slot.
+
+        Identical first-turn requests arriving while a generation is running join
+        it (see services.singleflight) and get the same stream id; their `on_done`
+        is called right away since they start no upstream work.
+        """
+        key = self._singleflight_key(**kwargs)
+        if key is None:
+            stream = self._streams.start(coalesce_tokens(self.astream_events(**kwargs)), on_done=on_done)
+            return stream.stream_id
+
+        def start(flight: Flight):
+            events = self._record_for_followers(self.astream_events(**kwargs), flight, kwargs["query"])
+            return self._streams.start(coalesce_tokens(events), on_done=on_done)
+
+        flight, joined = self._flights.join_or_start(key, kwargs.get("session_id"), start)
+        if joined and on_done is not None:
+            # No upstream call of our own to wait for
+            on_done()
+        return flight.stream.stream_id
+
+    def _singleflight_key(self, **kwargs) -> Optional[str]:
+        """
+        Singleflight key of a first-turn stream request, or None when it must run on its own
+        (coalescing disabled, or the session already has history).
+        """
+        if not SINGLEFLIGHT_ENABLED or kwargs.get("conversation_history"):
+            return None
+        session_id = kwargs.get("session_id")
+        if session_id and self._conversation_store.get_history(session_id):
+            return None
+        options = {
+            name: kwargs.get(name)
+            for name in ("k", "fetch_k", "temperature", "max_tokens", "system_prompt", "model", "engine")
+        }
+        return flight_key(kwargs["query"], kwargs.get("lang", "en"), kwargs.get("character"), options)
+
+    async def _record_for_followers(self, events, flight: Flight, query: str):
+        """
+        Pass a leader's events through; once the answer is complete, close the flight
+        and add the same turn to every follower's session history.
+        """
+        answer = []
+        try:
+            async for event in events:
+                if event["type"] == "token":
+                    answer.append(event["content"])
+                elif event["type"] == "usage":
+                    # Close before the last event goes out so nobody joins without getting a history entry
+                    final_answer = "".join(answer)
+                    for session_id in self._flights.close(flight):
+                        if final_answer:
+                            self._conversation_store.append(session_id, query, final_answer)
+                yield event
+        finally:
+            self._flights.close(flight)
+            await events.aclose()
+
+    def stream_events(self, stream_id: str, after_seq: int = 0):
+        """
+        Synchronous view of a started stream for WSGI handlers: the events after
+        `after_seq` (each carrying its "seq"), then the live ones until the answer is
+        done. {"type": "heartbeat"} events fill silent stretches (retrieval, thinking)
+        so a disconnected client is noticed on the next write.
+
+        Raises:
+            LookupError: unknown or expired stream id
+            StreamGapError: after_seq is older than the replay buffer
+        """
+        return self._streams.iterate(stream_id, after_seq)
 
 class _ConversationStore:
     """In-memory session conversation store with idle expiry."""
@@ -439,7 +1075,13 @@ class _ConversationStore:
             session["last_activity"] = time.time()
             return list(session["messages"])
 
-    def append(self, session_id: str, user_message: str, assistant_message: str) -> None:
+    def append(
+        self,
+        session_id: str,
+        user_message: str,
+        assistant_message: str,
+        user_embedding: Optional[List[float]] = None,
+    ) -> None:
         with self._lock:
             now = time.time()
             session = self._sessions.setdefault(session_id, {"messages": [], "last_activity": now})
@@ -447,8 +1089,44 @@ class _ConversationStore:
                 {"role": "user", "content": user_message},
                 {"role": "assistant", "content": assistant_message}
             ])
+            session.setdefault("turn_embeddings", []).append(user_embedding)
             session["last_activity"] = now
 
+    def get_turn_embeddings(self, session_id: str) -> List[Optional[List[float]]]:
+        """Embeddings of the session's previous user messages, oldest first (None where not embedded)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return []
+            return list(session.get("turn_embeddings", []))
+
+    def get_last_retrieval(self, session_id: str) -> Optional[RetrievalRecord]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return None
+            return session.get("last_retrieval")
+
+    def set_last_retrieval(self, session_id: str, record: RetrievalRecord) -> None:
+        with self._lock:
+            now = time.time()
+            session = self._sessions.setdefault(session_id, {"messages": [], "last_activity": now})
+            session["last_retrieval"] = record
+
+    def add_usage(self, session_id: str, usage: Usage) -> None:
+        with self._lock:
+            now = time.time()
+            session = self._sessions.setdefault(session_id, {"messages": [], "last_activity": now})
+            session.setdefault("usage", Usage()).add_usages(usage)
+
+    def get_usage(self, session_id: str) -> Optional[Dict[str, int]]:
+        """Token usage of the session's requests so far, None for an unknown or expired session."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return None
+            return session.get("usage", Usage()).get_usages()
+
     def cleanup_expired(self) -> None:
         with self._lock:
             now = time.time()
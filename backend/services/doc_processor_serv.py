@@ -6,16 +6,22 @@ sys.path.append("./")
 sys.path.append("../")
 
 from pathlib import Path
-import asyncio
+import os
+import inspect
 
 from component.base import Node
-from llm import azure_client
+from llm import embed_client
 from db.chroma_vectordb import ChromaUsage
 from parsers import MarkdownReader
 from utils.app_logger import LoggerSetup
+from utils.async_bridge import get_async_bridge
 
 logger = LoggerSetup("DocProcessor").logger
 
+# Texts per embedding request during ingestion; each batch is scheduled by the
+# embed provider's rate limiter (see llm/rate_limiter.py) instead of one huge burst
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
 class DocProcessor:
 
     def __init__(self, lang: str) -> None:
@@ -24,13 +30,25 @@ class DocProcessor:
     
     def parse_doc(self, file_path: Path):
         return MarkdownReader().load_data(file=file_path)
+
+    @staticmethod
+    def embed_texts(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> list[list[float]]:
+        """Embed in rate-limited batches; works with both sync and async embed clients."""
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            result = embed_client.embed(texts[start:start + batch_size])
+            if inspect.isawaitable(result):
+                # One long-lived loop: async SDK clients keep their pooled connections bound to it
+                result = get_async_bridge().run(result)
+            embeddings.extend(result)
+        return embeddings
     
     def store_doc(self, nodes: list[Node], file_path: Path):
 
         # Example texts, metadatas, embeddings
         texts = [n.text for n in nodes]
         metadatas = [n.metadata for n in nodes]
-        dense_embeddings = asyncio.run(azure_client.embed(texts))
+        dense_embeddings = self.embed_texts(texts)
 
         # Ensuring or creating a collection
         node_cnt_before = len(self.chroma_usage.get_existing_ids())
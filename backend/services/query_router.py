@@ -0,0 +1,104 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Query routing between the direct-answer prompts and the chain-of-thought prompts.
+
+Simple factual questions ("Where did you study?") don't need a reasoning section
+before <answer>; routing them to HR_prompt / EM_prompt saves time-to-first-token
+and output tokens. Anything open-ended or ambiguous stays on the CoT prompts.
+Short elliptical follow-ups ("And at Acme?") carry no cue of their own and
+take the route of the previous user question.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+ROUTE_DIRECT = "direct"
+ROUTE_COT = "cot"
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+_COMPLEX_EN = re.compile(
+    r"\b(why|how (did|do|does|would|could|can|was|were)|explain|compare|comparison|design|"
+    r"architect\w*|trade-?offs?|challeng\w*|approach\w*|walk (me )?through|describe|"
+    r"difference|decid\w*|improv\w*|optimi[sz]\w*|lessons?|impact|biggest|hardest|"
+    r"strengths?|weakness\w*|tell me about|elaborate|in detail)\b",
+    re.IGNORECASE,
+)
+_FACTUAL_EN = re.compile(
+    r"\b(what is|what's|what are|where|when|which|who|how (many|long|old|much)|"
+    r"do (you|they) (have|know|speak)|does (she|he) (have|know|speak)|"
+    r"email|phone|linkedin|contact|school|university|degree|major|title|current(ly)?|"
+    r"languages?|location|based|years?)\b",
+    re.IGNORECASE,
+)
+_COMPLEX_ZH = re.compile(r"(為什麼|為何|如何|怎麼|說明|解釋|比較|設計|架構|挑戰|困難|介紹一下|詳細|差異|優化|改善|影響|學到)")
+_FACTUAL_ZH = re.compile(r"(哪裡|哪裏|哪間|哪家|什麼時候|何時|多久|幾年|多少|是誰|聯絡|電話|信箱|學校|學歷|科系|職稱|現在|目前|會不會|有沒有|語言)")
+
+# Longer questions than this always take the CoT route
+_DIRECT_MAX_WORDS = int(os.getenv("ROUTING_DIRECT_MAX_WORDS", "14"))
+_DIRECT_MAX_CJK_CHARS = int(os.getenv("ROUTING_DIRECT_MAX_CJK_CHARS", "24"))
+# Cue-less queries up to this long are follow-ups routed like the previous question
+_FOLLOWUP_MAX_WORDS = 5
+_FOLLOWUP_MAX_CJK_CHARS = 8
+
+
+class QueryRouter:
+    """
+    Cheap local classifier: routes a query to ROUTE_DIRECT or ROUTE_COT.
+
+    Modes (QUERY_ROUTING env var):
+        auto   - heuristic routing (default)
+        cot    - always chain-of-thought (previous behaviour)
+        direct - always direct answer
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = (mode or os.getenv("QUERY_ROUTING", "auto")).lower()
+        if self.mode not in ("auto", ROUTE_COT, ROUTE_DIRECT):
+            raise ValueError(f"Unknown query routing mode: {self.mode}. Options: auto, cot, direct")
+
+    def route(self, query: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> str:
+        if self.mode != "auto":
+            return self.mode
+        if conversation_history and self.is_elliptical_followup(query):
+            previous = next(
+                (m.get("content") or "" for m in reversed(conversation_history) if m.get("role") == "user"), ""
+            )
+            if previous:
+                query = previous
+        return ROUTE_DIRECT if self.is_simple_factual(query) else ROUTE_COT
+
+    @staticmethod
+    def is_elliptical_followup(query: str) -> bool:
+        """Very short queries with neither a factual nor an open-ended cue, e.g. "And at Acme?"."""
+        query = (query or "").strip()
+        if not query:
+            return False
+        cjk_chars = len(_CJK_RE.findall(query))
+        if cjk_chars:
+            if cjk_chars > _FOLLOWUP_MAX_CJK_CHARS:
+                return False
+            return not (_COMPLEX_ZH.search(query) or _FACTUAL_ZH.search(query))
+        if len(query.split()) > _FOLLOWUP_MAX_WORDS:
+            return False
+        return not (_COMPLEX_EN.search(query) or _FACTUAL_EN.search(query))
+
+    @staticmethod
+    def is_simple_factual(query: str) -> bool:
+        """Short, single questions with a factual cue and no open-ended / reasoning cue."""
+        query = (query or "").strip()
+        if not query or query.count("?") + query.count("？") > 1:
+            return False
+
+        cjk_chars = len(_CJK_RE.findall(query))
+        if cjk_chars:
+            if cjk_chars > _DIRECT_MAX_CJK_CHARS or _COMPLEX_ZH.search(query):
+                return False
+            return bool(_FACTUAL_ZH.search(query))
+
+        if len(query.split()) > _DIRECT_MAX_WORDS or _COMPLEX_EN.search(query):
+            return False
+        return bool(_FACTUAL_EN.search(query))
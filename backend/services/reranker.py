@@ -0,0 +1,222 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Re-rankers for the retrieval pipeline.
+
+The vector store returns a larger candidate set ordered by raw distance; a
+re-ranker re-scores those candidates against the user query and keeps a
+smaller, better top-n for the LLM prompt.
+"""
+
+import sys
+sys.path.append("./")
+sys.path.append("../")
+
+import os
+import re
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional, Set
+
+from utils.app_logger import LoggerSetup
+
+logger = LoggerSetup("Reranker").logger
+
+_LATIN_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.\-]*")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "did", "do", "does",
+    "for", "from", "has", "have", "her", "his", "how", "i", "in", "is", "it",
+    "me", "my", "of", "on", "or", "she", "tell", "that", "the", "their", "this",
+    "to", "was", "what", "when", "where", "which", "who", "why", "with", "you",
+    "your", "about", "any", "some", "more",
+}
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    Split text into a set of lexical terms.
+
+    Latin text is split into lowercase words (stopwords removed); CJK runs are
+    split into character bigrams so Traditional Chinese queries still overlap.
+    """
+    if not text:
+        return set()
+    text = text.lower()
+    terms = {t.strip(".-") for t in _LATIN_TOKEN_RE.findall(text)}
+    terms = {t for t in terms if t and t not in _STOPWORDS}
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def dense_similarity(distance: Optional[float], metric: str = "cosine") -> float:
+    """
+    Similarity in [-1, 1] from a Chroma distance, assuming normalised embeddings:
+    cosine and ip distances are 1 - cos, l2 is the squared distance 2 - 2 * cos.
+    """
+    if distance is None:
+        return 0.0
+    if metric == "l2":
+        return 1.0 - float(distance) / 2.0
+    return 1.0 - float(distance)
+
+
+def _header_text(metadata: Optional[dict]) -> str:
+    if not metadata:
+        return ""
+    return " ".join(str(v) for k, v in metadata.items() if k.startswith("Header_") and v)
+
+
+class Reranker(ABC):
+    """Base class: re-score (document, metadata, distance) candidates for a query."""
+
+    name: str = "base"
+
+    @abstractmethod
+    def score(self, query: str, candidates: List[tuple]) -> List[float]:
+        """Return one relevance score per candidate (higher is better)."""
+        pass
+
+    def rerank(self, query: str, candidates: List[tuple], top_n: int = 5) -> List[tuple]:
+        """
+        Re-order candidates by relevance and keep the best top_n.
+
+        Candidates keep their original (document, metadata, distance) shape so
+        downstream formatting is unaffected.
+        """
+        if not candidates:
+            return []
+        scores = self.score(query, candidates)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_n]]
+
+
+class LexicalReranker(Reranker):
+    """
+    CPU-only re-ranker that needs no model and no network.
+
+    Combines the dense similarity from the vector store with idf-weighted
+    query-term overlap on the chunk text and on its markdown header path.
+    `metric` is the collection's distance function ("hnsw:space"); the app's
+    collections use cosine.
+    """
+
+    name = "lexical"
+
+    def __init__(
+        self,
+        dense_weight: float = 0.5,
+        lexical_weight: float = 0.35,
+        header_weight: float = 0.15,
+        metric: str = "cosine",
+    ):
+        self.dense_weight = dense_weight
+        self.lexical_weight = lexical_weight
+        self.header_weight = header_weight
+        self.metric = metric
+
+    def score(self, query: str, candidates: List[tuple]) -> List[float]:
+        query_terms = tokenize(query)
+        doc_terms = [tokenize(doc) for doc, _, _ in candidates]
+        header_terms = [tokenize(_header_text(meta)) for _, meta, _ in candidates]
+
+        # idf over the candidate set: terms that appear in every candidate carry no signal
+        n = len(candidates)
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for terms in doc_terms if term in terms)
+            idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        total_idf = sum(idf.values()) or 1.0
+
+        scores = []
+        for (_, _, distance), terms, headers in zip(candidates, doc_terms, header_terms):
+            dense = dense_similarity(distance, self.metric)
+            lexical = sum(idf[t] for t in query_terms & terms) / total_idf
+            header = sum(idf[t] for t in query_terms & headers) / total_idf
+            scores.append(
+                self.dense_weight * dense
+                + self.lexical_weight * lexical
+                + self.header_weight * header
+            )
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local cross-encoder re-ranker (FlagEmbedding's FlagReranker) run on CPU.
+
+    Falls back to LexicalReranker if FlagEmbedding or the model is unavailable;
+    a failed load is not retried, so later requests go straight to the fallback.
+    """
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: Optional[str] = None, max_length: int = 512):
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+        self.max_length = max_length
+        self._model = None
+        self._load_error: Optional[Exception] = None
+        self._load_lock = threading.Lock()
+        self._fallback = LexicalReranker()
+
+    def _load_model(self):
+        with self._load_lock:
+            if self._model is None and self._load_error is None:
+                try:
+                    from FlagEmbedding import FlagReranker
+                    self._model = FlagReranker(self.model_name, use_fp16=False)
+                    logger.info(f"Cross-encoder re-ranker loaded: {self.model_name}")
+                except Exception as e:
+                    self._load_error = e
+                    logger.warning(f"Cross-encoder unavailable ({e}), using lexical re-ranker from now on")
+            return self._model
+
+    def score(self, query: str, candidates: List[tuple]) -> List[float]:
+        model = self._model or self._load_model()
+        if model is None:
+            return self._fallback.score(query, candidates)
+
+        pairs = [[query, doc] for doc, _, _ in candidates]
+        scores = model.compute_score(pairs, max_length=self.max_length)
+        if not isinstance(scores, list):
+            scores = [scores]
+        return [float(s) for s in scores]
+
+
+# Re-ranker mapping
+RERANKERS = {
+    "lexical": LexicalReranker,
+    "cross_encoder": CrossEncoderReranker,
+}
+
+
+def create_reranker(name: Optional[str] = None, **kwargs) -> Optional[Reranker]:
+    """
+    Create a re-ranker by name.
+
+    Args:
+        name: Re-ranker name. If not specified, uses RERANKER env var.
+              Options: lexical, cross_encoder, none
+
+    Returns:
+        Reranker instance, or None when re-ranking is disabled
+    """
+    name = (name or os.getenv("RERANKER", "lexical")).lower()
+
+    if name in ("none", "off", ""):
+        return None
+
+    if name not in RERANKERS:
+        raise ValueError(
+            f"Unknown reranker: {name}. "
+            f"Available rerankers: {list(RERANKERS.keys()) + ['none']}"
+        )
+
+    return RERANKERS[name](**kwargs)
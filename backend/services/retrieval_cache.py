@@ -0,0 +1,147 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Per-session retrieval memory used to skip redundant searches on follow-up turns.
+"""
+
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+# Cosine similarity between the new and the previous retrieval vector above which
+# the previous context is reused instead of searching again
+RETRIEVAL_REUSE_THRESHOLD = float(os.getenv("RETRIEVAL_REUSE_THRESHOLD", "0.92"))
+
+# Weight of previous user turns in the retrieval vector: decay**1 for the last turn,
+# decay**2 for the one before, ... over at most HISTORY_FUSION_TURNS turns
+HISTORY_FUSION_DECAY = float(os.getenv("HISTORY_FUSION_DECAY", "0.5"))
+HISTORY_FUSION_TURNS = int(os.getenv("HISTORY_FUSION_TURNS", "4"))
+
+_FOLLOWUP_MAX_WORDS = 8
+_FOLLOWUP_MAX_CJK_CHARS = 12
+
+# A follow-up must contain one of these markers ...
+_FOLLOWUP_PATTERNS_EN = re.compile(
+    r"\b(more|that|this|those|these|it|its|elaborate|detail|details|example|examples|"
+    r"continue|go on|why|how so|what else|anything else|and then)\b",
+    re.IGNORECASE,
+)
+_FOLLOWUP_PATTERNS_ZH = re.compile(r"(這個|那個|這些|那些|更多|詳細|繼續|為什麼|舉例|多說|再說|然後呢|還有呢)")
+# ... and nothing else but anaphora, follow-up verbs and function words: any other
+# (content) word makes it a new question, which is embedded and compared by similarity
+_FOLLOWUP_WORDS_EN = {
+    "more", "that", "this", "those", "these", "it", "its", "elaborate", "detail", "details",
+    "detailed", "example", "examples", "continue", "go", "on", "why", "how", "so", "what",
+    "else", "anything", "and", "then", "tell", "me", "about", "can", "could", "would", "you",
+    "please", "give", "explain", "expand", "further", "again", "an", "a", "the", "some",
+    "bit", "little", "is", "was", "do", "does", "did", "mean", "say", "said", "upon", "of",
+    "in", "to", "with", "for", "that's", "what's", "ok", "okay", "really", "yes", "sure",
+}
+_FOLLOWUP_FILLER_ZH = re.compile(r"[你妳您我他她它的是嗎呢吧啊呀了能可以請再多說一下點些個講解釋明清楚舉例子關於還有麼什]")
+_EN_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+@dataclass
+class RetrievalRecord:
+    """The last retrieval of a session: the vector searched with and what came back."""
+    collection: str
+    query: str
+    embedding: List[float]
+    docs: List[tuple]
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return [doc_key(doc, meta) for doc, meta, _ in self.docs]
+
+    @property
+    def scores(self) -> List[float]:
+        return [dist for _, _, dist in self.docs]
+
+
+def doc_key(doc: str, metadata: Optional[dict]) -> str:
+    """Stable identifier for a retrieved chunk (vector-store id when available)."""
+    metadata = metadata or {}
+    return metadata.get("doc_id") or f"{metadata.get('filename', 'unknown')}:{hash(doc)}"
+
+
+def is_anaphoric_followup(query: str) -> bool:
+    """
+    Heuristic for short follow-ups ("tell me more about that", "為什麼？") that refer
+    back to the previous answer and don't introduce a new topic: a follow-up marker
+    and no content words ("Why did you leave your last job?" is a new question).
+    """
+    query = (query or "").strip()
+    if not query:
+        return False
+
+    cjk_chars = len(_CJK_RE.findall(query))
+    if cjk_chars:
+        if cjk_chars > _FOLLOWUP_MAX_CJK_CHARS or not _FOLLOWUP_PATTERNS_ZH.search(query):
+            return False
+        rest = _FOLLOWUP_FILLER_ZH.sub("", _FOLLOWUP_PATTERNS_ZH.sub("", query))
+        return not _CJK_RE.search(rest)
+
+    words = _EN_WORD_RE.findall(query.lower())
+    if len(words) > _FOLLOWUP_MAX_WORDS or not _FOLLOWUP_PATTERNS_EN.search(query):
+        return False
+    return all(word in _FOLLOWUP_WORDS_EN for word in words)
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if denom == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0.0 else vector
+
+
+def fuse_embeddings(
+    current: List[float],
+    history: List[Optional[List[float]]],
+    decay: float = HISTORY_FUSION_DECAY,
+    max_turns: int = HISTORY_FUSION_TURNS,
+) -> List[float]:
+    """
+    Recency-weighted combination of the current query embedding and the cached
+    embeddings of previous user turns (oldest first, None entries skipped).
+    """
+    recent = [e for e in history if e is not None][-max_turns:] if max_turns > 0 else []
+    if not recent:
+        return list(current)
+
+    vectors = [_unit(current)]
+    weights = [1.0]
+    for age, embedding in enumerate(reversed(recent), start=1):
+        vectors.append(_unit(embedding))
+        weights.append(decay ** age)
+
+    fused = np.average(np.stack(vectors), axis=0, weights=weights)
+    return _unit(fused).tolist()
+
+
+def merge_docs(cached: List[tuple], fresh: List[tuple], k: int) -> List[tuple]:
+    """Top up cached docs with fresh results not already present, keeping cached order first."""
+    seen = {doc_key(doc, meta) for doc, meta, _ in cached}
+    merged = list(cached)
+    for doc, meta, dist in fresh:
+        if len(merged) >= k:
+            break
+        key = doc_key(doc, meta)
+        if key not in seen:
+            seen.add(key)
+            merged.append((doc, meta, dist))
+    return merged[:k]
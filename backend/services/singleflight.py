@@ -0,0 +1,115 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Singleflight for streamed first-turn questions.
+
+When a link to the CV is shared, many visitors open with the same question
+within seconds. Instead of one embed + retrieval + generation each, the first
+request (the leader) starts the stream and identical requests that arrive
+while it is still running (followers) subscribe to the same ReplayStream,
+which already fans its events out to any number of readers and replays what
+a late subscriber missed.
+
+Only first-turn requests take part: with a conversation history the prompt,
+the retrieval query and therefore the answer differ per session. Requests are
+identical when the normalized query, lang, character and generation options
+match (see flight_key).
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.stream_registry import ReplayStream
+from utils.app_logger import LoggerSetup
+from utils.metrics import metrics
+
+logger = LoggerSetup("SingleFlight").logger
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+SINGLEFLIGHT_REQUESTS = metrics.counter(
+    "chat_singleflight_requests_total", "Coalescable stream requests by role (leader starts, follower joins)", ["role"]
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = "?!.？！。 "
+
+
+def normalize_query(query: str) -> str:
+    """Case, width and whitespace folded; trailing ?!. (ASCII or full-width) dropped."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return _WHITESPACE_RE.sub(" ", query).strip().rstrip(_TRAILING_PUNCT)
+
+
+def flight_key(query: str, lang: Optional[str], character: Optional[str], options: Dict[str, Any]) -> str:
+    """Identity of a first-turn request; equal keys are served by one generation."""
+    payload = json.dumps(
+        [normalize_query(query), lang or "en", (character or "").lower(), options],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """One in-flight generation and the sessions of the followers attached to it."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.stream: Optional[ReplayStream] = None
+        self.followers: List[str] = []
+        self.closed = False
+
+    def joinable(self) -> bool:
+        # A follower needs the whole answer, so the replay buffer must still start at event 1
+        return not self.closed and self.stream is not None and not self.stream.done and self.stream.can_resume(0)
+
+
+class StreamFlights:
+    """Thread-safe key -> Flight map of generations still running."""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join_or_start(
+        self,
+        key: str,
+        session_id: Optional[str],
+        start: Callable[[Flight], ReplayStream],
+    ) -> Tuple[Flight, bool]:
+        """
+        Attach to the running flight for `key`, or call `start(flight)` to become its leader.
+
+        `start` runs under the lock, so a concurrent duplicate can never see a
+        flight whose stream isn't registered yet. Returns (flight, joined).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.joinable():
+                if session_id:
+                    flight.followers.append(session_id)
+                SINGLEFLIGHT_REQUESTS.inc(role="follower")
+                logger.info(f"Joined in-flight stream {flight.stream.stream_id} ({len(flight.followers)} followers)")
+                return flight, True
+
+            flight = Flight(key)
+            flight.stream = start(flight)
+            self._flights[key] = flight
+            SINGLEFLIGHT_REQUESTS.inc(role="leader")
+            return flight, False
+
+    def close(self, flight: Flight) -> List[str]:
+        """Stop accepting followers and return the ones that joined. Idempotent."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if flight.closed:
+                return []
+            flight.closed = True
+            return list(flight.followers)
@@ -0,0 +1,251 @@
+#!/usr/bin/env/python
+# -*- coding:utf-8 -*-
+
+"""
+Resumable answer streams.
+
+Each /chat/stream request gets a ReplayStream: the generation runs as a task on
+the shared event loop and appends its events, with sequence numbers, to a
+bounded replay buffer. SSE connections only read from that buffer, so a client
+that drops and reconnects with Last-Event-ID picks up after the last event it
+saw while the same generation carries on. No reconnect triggers a second
+retrieval or LLM call.
+
+A stream nobody is reading for STREAM_ORPHAN_TIMEOUT_SECONDS is cancelled (the
+client is not coming back; stop paying for tokens), and so is one whose buffer
+no longer holds the events its departed reader would resume from. Buffers are dropped
+STREAM_REPLAY_TTL_SECONDS after their last activity.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from utils.app_logger import LoggerSetup
+from utils.async_bridge import get_async_bridge
+from utils.sse import with_heartbeat
+
+logger = LoggerSetup("StreamRegistry").logger
+
+STREAM_REPLAY_TTL_SECONDS = float(os.getenv("STREAM_REPLAY_TTL_SECONDS", "120"))
+STREAM_REPLAY_MAX_BYTES = int(os.getenv("STREAM_REPLAY_MAX_BYTES", str(256 * 1024)))
+STREAM_ORPHAN_TIMEOUT_SECONDS = float(os.getenv("STREAM_ORPHAN_TIMEOUT_SECONDS", "30"))
+
+
+class StreamGapError(LookupError):
+    """The requested position is older than what the replay buffer still holds."""
+
+
+def _event_size(event: Dict[str, Any]) -> int:
+    if event.get("type") == "token":
+        return len(event["content"]) + 32
+    return len(json.dumps(event, ensure_ascii=False, default=str))
+
+
+class ReplayStream:
+    """
+    One generation and its replay buffer. Mutated only on the event loop thread.
+
+    Events are numbered from 1; subscribe(after_seq=n) yields everything after n.
+    """
+
+    def __init__(self, stream_id: str, max_bytes: int = STREAM_REPLAY_MAX_BYTES):
+        self.stream_id = stream_id
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+        self.done = False
+        self._max_bytes = max_bytes
+        self._events: Deque[Tuple[int, Dict[str, Any], int]] = deque()
+        self._bytes = 0
+        self._first_seq = 1     # oldest seq still buffered
+        self._next_seq = 1
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+        self._on_done: Optional[Callable[[], None]] = None
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+        # Lowest position a departed reader reached: a resume needs the events after it
+        self._resume_after: Optional[int] = None
+        self._cancel_requested = False
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def can_resume(self, after_seq: int) -> bool:
+        return after_seq >= self._first_seq - 1
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        size = _event_size(event)
+        self._events.append((self._next_seq, event, size))
+        self._next_seq += 1
+        self._bytes += size
+        while self._bytes > self._max_bytes and len(self._events) > 1:
+            _, _, dropped = self._events.popleft()
+            self._bytes -= dropped
+            self._first_seq += 1
+        self.last_activity = time.time()
+        self._notify()
+        self._cancel_if_unresumable()
+
+    async def _produce(self, events: AsyncIterator[Dict[str, Any]]) -> None:
+        try:
+            async for event in events:
+                self._append(event)
+        except asyncio.CancelledError:
+            logger.info(f"Stream {self.stream_id} cancelled after {self.last_seq} events")
+            self._append({"type": "error", "message": "stream cancelled"})
+        except Exception as e:
+            logger.error(f"Error in stream {self.stream_id}: {e}", exc_info=True)
+            self._append({"type": "error", "message": str(e)})
+        finally:
+            # Closes the LLM stream if we stopped early
+            await events.aclose()
+            self.done = True
+            self.last_activity = time.time()
+            self._notify()
+            if self._on_done is not None:
+                self._on_done()
+
+    def start(self, events: AsyncIterator[Dict[str, Any]], on_done: Optional[Callable[[], None]] = None) -> None:
+        self._on_done = on_done
+        self._task = asyncio.get_running_loop().create_task(self._produce(events))
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done() and not self._cancel_requested:
+            self._cancel_requested = True
+            self._task.cancel()
+
+    def _cancel_if_unresumable(self) -> None:
+        if (
+            self._subscribers == 0 and not self.done and self._resume_after is not None
+            and not self.can_resume(self._resume_after)
+        ):
+            logger.info(f"Stream {self.stream_id} can no longer be resumed; cancelling generation")
+            self.cancel()
+
+    def _cancel_if_orphaned(self) -> None:
+        self._orphan_timer = None
+        if self._subscribers == 0 and not self.done:
+            logger.info(f"No reader reconnected to stream {self.stream_id}; cancelling generation")
+            self.cancel()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Replay the buffered events after `after_seq`, then follow the live stream
+        until it is done. Each event is yielded as a copy carrying its "seq".
+        """
+        self._subscribers += 1
+        self._resume_after = None
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+        try:
+            seq = after_seq
+            while True:
+                changed = self._changed
+                while seq < self.last_seq:
+                    index = seq + 1 - self._first_seq
+                    if index < 0:
+                        # This reader fell further behind than the buffer holds
+                        yield {"type": "error", "message": "replay window exceeded"}
+                        return
+                    next_seq, event, _ = self._events[index]
+                    yield {**event, "seq": next_seq}
+                    seq = next_seq
+                if self.done:
+                    return
+                await changed.wait()
+        finally:
+            self._subscribers -= 1
+            self.last_activity = time.time()
+            if not self.done:
+                self._resume_after = seq if self._resume_after is None else min(self._resume_after, seq)
+            if self._subscribers == 0 and not self.done:
+                self._cancel_if_unresumable()
+                if STREAM_ORPHAN_TIMEOUT_SECONDS > 0 and not self._cancel_requested:
+                    self._orphan_timer = asyncio.get_running_loop().call_later(
+                        STREAM_ORPHAN_TIMEOUT_SECONDS, self._cancel_if_orphaned
+                    )
+
+
+class StreamRegistry:
+    """Thread-safe stream_id -> ReplayStream map; streams run on the shared event loop."""
+
+    def __init__(self, ttl_seconds: float = STREAM_REPLAY_TTL_SECONDS):
+        self._ttl = ttl_seconds
+        self._streams: Dict[str, ReplayStream] = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        events: AsyncIterator[Dict[str, Any]],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> ReplayStream:
+        """
+        Start consuming `events` in the background and return its stream.
+        `on_done` is called (on the event loop) once the generation has finished or was cancelled.
+        """
+        self.cleanup_expired()
+        stream = ReplayStream(uuid.uuid4().hex)
+
+        async def _start():
+            stream.start(events, on_done)
+
+        get_async_bridge().run(_start())
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ReplayStream]:
+        self.cleanup_expired()
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def iterate(self, stream_id: str, after_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Synchronous subscription for WSGI handlers, with heartbeat events while idle.
+
+        Raises:
+            LookupError: unknown or expired stream id
+            StreamGapError: after_seq is older than the replay buffer
+        """
+        stream = self.get(stream_id)
+        if stream is None:
+            raise LookupError(f"Unknown or expired stream: {stream_id}")
+        if not stream.can_resume(after_seq):
+            raise StreamGapError(f"Stream {stream_id} no longer holds events after {after_seq}")
+        return get_async_bridge().iterate(with_heartbeat(stream.subscribe(after_seq)))
+
+    def cleanup_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, s in self._streams.items() if now - s.last_activity > self._ttl]
+            for sid in expired:
+                stream = self._streams.pop(sid)
+                if not stream.done:
+                    get_async_bridge().loop.call_soon_threadsafe(stream.cancel)
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """
+    Split a Last-Event-ID of the form "<stream_id>:<seq>" (or a bare "<seq>").
+
+    Returns (stream_id or None, seq); a missing or malformed value means "from the start".
+    """
+    if not value:
+        return None, 0
+    stream_id, _, seq = value.strip().rpartition(":")
+    try:
+        return stream_id or None, max(0, int(seq))
+    except ValueError:
+        return None, 0
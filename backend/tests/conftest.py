@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# The app reads its configuration at import: offline providers, no pacing, and a
+# throwaway index / trace directory, set before any test imports it
+_WORK_DIR = tempfile.mkdtemp(prefix="chatmycv_tests_")
+os.environ.update({
+    "LLM_PROVIDER": "stub",
+    "EMBED_PROVIDER": "stub",
+    "STUB_TTFT_SECONDS": "0",
+    "STUB_TOKENS_PER_SECOND": "0",
+    "STUB_EMBED_SECONDS": "0",
+    "STUB_EMBED_DIM": "256",
+    "CHROMA_DIR": os.path.join(_WORK_DIR, "chroma"),
+    "REQUEST_TRACE_DIR": os.path.join(_WORK_DIR, "traces"),
+    "LOG_LEVEL": "WARNING",
+})
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected, _Lane
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_released_slots_go_to_waiters_in_arrival_order():
+    lane = _Lane("test", "chat", limit=1, max_queue=10, queue_timeout=5)
+    first = lane.acquire()
+    order = []
+
+    def request(name):
+        with lane.acquire():
+            order.append(name)
+
+    threads = []
+    for name in range(5):
+        thread = threading.Thread(target=request, args=(name,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: lane.waiting == name + 1)
+
+    first.release()
+    # A newcomer arriving while others wait queues behind them instead of taking the slot
+    latecomer = threading.Thread(target=request, args=("late",))
+    latecomer.start()
+    for thread in threads + [latecomer]:
+        thread.join(5)
+
+    assert order == [0, 1, 2, 3, 4, "late"]
+    assert lane.active == 0 and lane.waiting == 0
+
+
+def test_full_queue_is_rejected_with_429():
+    lane = _Lane("test", "chat", limit=1, max_queue=1, queue_timeout=5)
+    held = lane.acquire()
+    waiter = threading.Thread(target=lambda: lane.acquire().release())
+    waiter.start()
+    _wait_for(lambda: lane.waiting == 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        lane.acquire()
+
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after >= 1
+    held.release()
+    waiter.join(5)
+
+
+def test_queue_timeout_is_rejected_with_503():
+    lane = _Lane("test", "chat", limit=1, max_queue=5, queue_timeout=0.05)
+    held = lane.acquire()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        lane.acquire()
+
+    assert rejected.value.status_code == 503
+    assert lane.waiting == 0
+    held.release()
+    assert lane.active == 0
+
+
+def test_slot_release_is_idempotent():
+    lane = _Lane("test", "chat", limit=2, max_queue=5, queue_timeout=1)
+    slot = lane.acquire()
+    slot.release()
+    slot.release()
+
+    assert lane.active == 0
+
+
+def test_controller_lanes_and_disabled_lanes(monkeypatch):
+    monkeypatch.setenv("ADMISSION_STUBX_CHAT_CONCURRENCY", "0")
+    controller = AdmissionController(max_queue=1, queue_timeout=0.05)
+
+    # A cap of 0 turns admission control off for that lane
+    slots = [controller.acquire("stubx", "chat") for _ in range(10)]
+    assert controller._lane("stubx", "chat") is None
+    for slot in slots:
+        slot.release()
+
+    with pytest.raises(ValueError):
+        controller.acquire("stubx", "bogus")
+
+    monkeypatch.setenv("ADMISSION_STUBX_EMBED_CONCURRENCY", "1")
+    with controller.acquire("stubx", "embed"):
+        with pytest.raises(AdmissionRejected):
+            controller.acquire("stubx", "embed")
+    controller.acquire("stubx", "embed").release()
@@ -0,0 +1,71 @@
+import pytest
+
+from utils.answer_extractor import AnswerExtractor, extract_answer
+
+COT = "<thinking>\nLooking at the work history.\n</thinking>\n<answer>\nShe leads the retrieval team.\n</answer>"
+
+
+def _stream(text, size):
+    extractor = AnswerExtractor()
+    emitted = [extractor.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    emitted.append(extractor.finish())
+    return extractor, emitted
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 8, 9, 1000])
+def test_tags_split_across_chunks(size):
+    extractor, emitted = _stream(COT, size)
+
+    assert "".join(emitted) == "\nShe leads the retrieval team.\n"
+    assert extractor.answer == "".join(emitted)
+    assert extractor.ended
+
+
+def test_thinking_is_held_back_until_the_answer_starts():
+    extractor = AnswerExtractor()
+
+    assert extractor.feed("<thinking>\nsome reasoning") == ""
+    assert extractor.feed(" more</thinking><ans") == ""
+    assert extractor.feed("wer>Hello") == "Hello"
+
+
+def test_end_tag_prefix_is_held_until_resolved():
+    extractor = AnswerExtractor()
+    extractor.feed("<answer>Python </")
+
+    # "</" could start </answer>: nothing after "Python " is released yet
+    assert extractor.answer == "Python "
+    assert extractor.feed("b>") == "</b>"
+    assert extractor.feed(" and Go</answer> ignored") == " and Go"
+    assert extractor.feed("more") == ""
+    assert extractor.answer == "Python </b> and Go"
+
+
+def test_output_without_tags_is_passed_through():
+    extractor = AnswerExtractor(probe_chars=8)
+
+    assert extractor.feed("  She ") == ""
+    assert extractor.feed("studied at NTU") == "  She studied at NTU"
+    assert extractor.feed(".") == "."
+    assert extractor.finish() == ""
+
+
+def test_unterminated_answer_is_flushed_on_finish():
+    extractor = AnswerExtractor()
+    extractor.feed("<answer>Cut off </ans")
+
+    assert extractor.finish() == "</ans"
+    assert extractor.answer == "Cut off </ans"
+
+
+def test_short_output_without_answer_is_returned_on_finish():
+    extractor = AnswerExtractor()
+
+    assert extractor.feed("<thinking>only") == ""
+    assert extractor.finish() == "<thinking>only"
+
+
+def test_extract_answer():
+    assert extract_answer(COT) == "She leads the retrieval team."
+    assert extract_answer("Plain reply") == "Plain reply"
+    assert extract_answer("") == ""
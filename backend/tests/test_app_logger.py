@@ -0,0 +1,22 @@
+import logging
+
+from utils import app_logger
+from utils.app_logger import LoggerSetup
+
+
+def test_default_level_is_info(monkeypatch):
+    monkeypatch.delenv("LOG_LEVEL", raising=False)
+    monkeypatch.setattr(app_logger, "LOG_LEVEL", "INFO")
+
+    assert LoggerSetup._resolve_level("Anything", None) == logging.INFO
+    assert LoggerSetup._resolve_level("Anything", logging.DEBUG) == logging.DEBUG
+
+
+def test_env_overrides_level(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "DEBUG")
+    monkeypatch.setattr(app_logger, "LOG_LEVEL", "DEBUG")
+    monkeypatch.setattr(app_logger, "LOG_LEVELS", {"Quiet": "WARNING"})
+
+    assert LoggerSetup._resolve_level("Anything", None) == logging.DEBUG
+    assert LoggerSetup._resolve_level("Anything", logging.ERROR) == logging.DEBUG
+    assert LoggerSetup._resolve_level("Quiet", None) == logging.WARNING
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.async_bridge import get_async_bridge, on_event_loop
+
+
+def test_run_uses_one_long_lived_loop():
+    bridge = get_async_bridge()
+
+    async def current():
+        return asyncio.get_running_loop(), threading.current_thread()
+
+    first = bridge.run(current())
+    assert bridge.run(current()) == first
+    assert first[0] is bridge.loop
+    assert first[1] is not threading.current_thread()
+    assert get_async_bridge() is bridge
+
+
+def test_run_propagates_errors():
+    async def fail():
+        raise KeyError("boom")
+
+    with pytest.raises(KeyError):
+        get_async_bridge().run(fail())
+
+
+def test_iterate_yields_every_item():
+    async def numbers():
+        for n in range(3):
+            await asyncio.sleep(0)
+            yield n
+
+    assert list(get_async_bridge().iterate(numbers())) == [0, 1, 2]
+
+
+def test_closing_iteration_closes_the_async_generator():
+    closed = threading.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield "tick"
+        finally:
+            closed.set()
+
+    iterator = get_async_bridge().iterate(endless())
+    assert next(iterator) == "tick"
+    iterator.close()
+
+    assert closed.is_set()
+
+
+def test_on_event_loop():
+    assert not on_event_loop()
+
+    async def check():
+        return on_event_loop()
+
+    assert get_async_bridge().run(check())
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from component.base import Usage
+from llm.cassette_module import CassetteMiss, RecordingLLM, ReplayLLM, _generate_payload, cassette_key
+from llm.stub_module import StubLLM
+
+
+def _stream(llm, **kwargs):
+    async def run():
+        usage = Usage()
+        chunks = [chunk async for chunk in llm.stream(usage=usage, **kwargs)]
+        return chunks, usage.get_usages()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    return str(tmp_path / "session.jsonl")
+
+
+def test_replay_serves_recorded_replies_and_usage(cassette):
+    recorder = RecordingLLM(inner=StubLLM(provider="stub"), path=cassette)
+    response = asyncio.run(recorder.chat(prompt="What is RAG?", system_prompt="Be brief"))
+    chunks, usage = _stream(recorder, prompt="Explain chunking")
+    embeddings = asyncio.run(recorder.embed(["alpha", "beta"]))
+
+    entries = [json.loads(line) for line in open(cassette, encoding="utf-8")]
+    assert [entry["method"] for entry in entries] == ["chat", "stream", "embed"]
+
+    replay = ReplayLLM(path=cassette, time_scale=0)
+    replayed = asyncio.run(replay.chat(prompt="What is RAG?", system_prompt="Be brief"))
+    assert replayed["content"] == response["content"]
+    assert replayed["usage"].get_usages() == response["usage"].get_usages()
+    assert _stream(replay, prompt="Explain chunking") == (chunks, usage)
+    assert asyncio.run(replay.embed(["alpha", "beta"])) == embeddings
+
+
+def test_chat_and_stream_replay_each_other(cassette):
+    recorder = RecordingLLM(inner=StubLLM(provider="stub"), path=cassette)
+    chunks, _ = _stream(recorder, prompt="Explain chunking")
+
+    replay = ReplayLLM(path=cassette, time_scale=0)
+    assert asyncio.run(replay.chat(prompt="Explain chunking"))["content"] == "".join(chunks)
+
+
+def test_request_arguments_are_part_of_the_key(cassette):
+    recorder = RecordingLLM(inner=StubLLM(provider="stub"), path=cassette)
+    asyncio.run(recorder.chat(prompt="What is RAG?", max_tokens=50))
+
+    replay = ReplayLLM(path=cassette, time_scale=0)
+    with pytest.raises(CassetteMiss):
+        asyncio.run(replay.chat(prompt="What is RAG?", max_tokens=80))
+    with pytest.raises(CassetteMiss):
+        asyncio.run(replay.chat(prompt="Something never asked", max_tokens=50))
+    assert asyncio.run(replay.chat(prompt="What is RAG?", max_tokens=50))["content"]
+
+
+def test_replay_keeps_recorded_pacing_scaled(cassette, monkeypatch):
+    key = cassette_key("generate", _generate_payload("hi", "", None, {}))
+    entry = {"key": key, "kind": "generate", "method": "stream", "chunks": [[0.1, "a"], [0.2, "b"]]}
+    with open(cassette, "w", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(round(seconds, 4))
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    chunks, _ = _stream(ReplayLLM(path=cassette, time_scale=0.5), prompt="hi")
+
+    assert chunks == ["a", "b"]
+    assert slept == [0.05, 0.05]
@@ -0,0 +1,17 @@
+from app import app
+from services import chat_service
+
+
+def test_error_frame_without_a_sequence_has_no_id(monkeypatch):
+    class Events:
+        def __iter__(self):
+            yield {"type": "error", "message": "boom"}
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(chat_service, "stream_events", lambda stream_id, after_seq=0: iter(Events()))
+
+    body = app.test_client().get("/chat/stream/abc").get_data(as_text=True)
+
+    assert body == "data: [ERROR] boom\n\n"
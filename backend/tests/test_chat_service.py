@@ -0,0 +1,199 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from llm import embed_client
+from services import chat_service
+from services.chat_serv import DEFAULT_K, RERANK_TOP_N, chroma_usage_en
+from utils.async_bridge import get_async_bridge
+
+CV_SECTIONS = {
+    "Work Experience": "Senior backend engineer at Acme since 2021, leading the retrieval platform team.",
+    "Skills": "Python, Go, SQL, Kubernetes, PyTorch and vector databases.",
+    "Education": "Master of Computer Science, National Taiwan University.",
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def indexed_cv():
+    texts = [f"{section}\n{body}" for section, body in CV_SECTIONS.items()]
+    metadatas = [{"filename": "cv.md", "Header_1": section} for section in CV_SECTIONS]
+    embeddings = get_async_bridge().run(embed_client.embed(texts))
+    chroma_usage_en.add_data_to_collection(texts, embeddings, metadatas, node_id_prefix="test")
+
+
+def _request(query, **kwargs):
+    return {"query": query, "lang": "en", "session_id": f"test-{uuid.uuid4().hex}", **kwargs}
+
+
+def test_chat_answers_from_context():
+    response = chat_service.chat(**_request("What is the candidate's current role?"))
+
+    assert response["content"]
+    assert response["context_used"]
+    assert response["usage"]["completion_tokens"] > 0
+
+
+def test_achat_with_custom_system_prompt():
+    response = asyncio.run(chat_service.achat(**_request("Which languages do you use?", system_prompt="Answer briefly.")))
+
+    assert response["content"]
+    assert response["retrieved_docs_count"] > 0
+
+
+def test_astream_events_order():
+    async def collect():
+        return [event async for event in chat_service.astream_events(**_request("Where did you study?"))]
+
+    events = asyncio.run(collect())
+    types = [event["type"] for event in events]
+
+    assert types[0] == "sources"
+    assert "token" in types
+    assert types[-1] == "usage"
+    assert "".join(e["content"] for e in events if e["type"] == "token")
+
+
+def test_sync_embed_client_does_not_block_the_loop(monkeypatch):
+    class SlowSyncEmbedder:
+        provider = "stub"
+
+        def embed(self, input_texts, **kwargs):
+            time.sleep(0.3)
+            return [embed_client._vector(text) for text in input_texts]
+
+    monkeypatch.setattr(chat_service, "embed_client", SlowSyncEmbedder())
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await chat_service.achat(**_request("What is the candidate's current role?"))
+        task.cancel()
+        return ticks
+
+    # Other coroutines keep running while the sync call is in flight
+    assert asyncio.run(run()) >= 10
+
+
+def test_default_k_is_lower_when_re_ranking(monkeypatch):
+    assert chat_service.reranker is not None
+    assert chat_service._final_k() == RERANK_TOP_N
+    assert chat_service._final_k(7) == 7
+
+    monkeypatch.setattr(chat_service, "reranker", None)
+    assert chat_service._final_k() == DEFAULT_K
+
+
+def test_retrieve_context_without_stats():
+    docs, embedding = chat_service._retrieve_context(chroma_usage_en, "What is the candidate's current role?", k=2)
+
+    assert docs
+    assert embedding is not None
+
+
+def test_aretrieve_context_without_stats():
+    docs, _ = asyncio.run(chat_service._aretrieve_context(chroma_usage_en, "Which languages do you use?", k=2, lang="en"))
+
+    assert docs
+
+
+def test_concurrent_requests_keep_their_language(monkeypatch):
+    built = {}
+    build_messages = chat_service._build_messages
+
+    def record_lang(**kwargs):
+        built[kwargs["user_query"]] = kwargs["lang"]
+        return build_messages(**kwargs)
+
+    class PausingEmbedder:
+        provider = embed_client.provider
+
+        async def embed(self, input_texts, **kwargs):
+            # Hold the English request so the Chinese one runs in between
+            if any("English" in text for text in input_texts):
+                await asyncio.sleep(0.05)
+            return await embed_client.embed(input_texts)
+
+    monkeypatch.setattr(chat_service, "_build_messages", record_lang)
+    monkeypatch.setattr(chat_service, "embed_client", PausingEmbedder())
+
+    async def run():
+        async def consume(query, lang):
+            return [event async for event in chat_service.astream_events(**_request(query, lang=lang))]
+
+        await asyncio.gather(consume("English: what is the current role?", "en"), consume("目前的職位是什麼？", "zhtw"))
+
+    asyncio.run(run())
+
+    assert built["English: what is the current role?"] == "en"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    counts = {"embed": 0, "search": 0}
+    query_collection = chroma_usage_en.query_collection
+
+    class CountingEmbedder:
+        provider = embed_client.provider
+
+        async def embed(self, input_texts, **kwargs):
+            counts["embed"] += 1
+            return await embed_client.embed(input_texts)
+
+    def counting_query(**kwargs):
+        counts["search"] += 1
+        return query_collection(**kwargs)
+
+    monkeypatch.setattr(chat_service, "embed_client", CountingEmbedder())
+    monkeypatch.setattr(chroma_usage_en, "query_collection", counting_query)
+    return counts
+
+
+def test_followup_reuses_the_sessions_last_retrieval(calls):
+    session_id = f"test-{uuid.uuid4().hex}"
+    docs, _ = chat_service._retrieve_context(chroma_usage_en, "Which languages do you use?", k=2, session_id=session_id)
+    assert calls == {"embed": 1, "search": 1}
+
+    reused, embedding = chat_service._retrieve_context(chroma_usage_en, "Tell me more about that", k=2, session_id=session_id)
+
+    assert reused == docs
+    assert embedding is None
+    assert calls == {"embed": 1, "search": 1}
+
+
+def test_near_duplicate_query_skips_the_search(calls):
+    session_id = f"test-{uuid.uuid4().hex}"
+    docs, _ = chat_service._retrieve_context(chroma_usage_en, "Which languages do you use?", k=2, session_id=session_id)
+    reused, _ = chat_service._retrieve_context(chroma_usage_en, "Which languages do you use?", k=2, session_id=session_id)
+
+    assert reused == docs
+    assert calls == {"embed": 2, "search": 1}
+
+
+def test_reuse_is_per_session(calls):
+    chat_service._retrieve_context(chroma_usage_en, "Which languages do you use?", k=2, session_id=f"test-{uuid.uuid4().hex}")
+    docs, _ = chat_service._retrieve_context(chroma_usage_en, "Tell me more about that", k=2, session_id=f"test-{uuid.uuid4().hex}")
+
+    assert calls == {"embed": 2, "search": 2}
+    assert docs
+
+
+def test_reused_context_is_topped_up_to_k(calls):
+    session_id = f"test-{uuid.uuid4().hex}"
+    docs, _ = chat_service._retrieve_context(chroma_usage_en, "Which languages do you use?", k=1, session_id=session_id)
+    topped_up, _ = chat_service._retrieve_context(chroma_usage_en, "Tell me more about that", k=3, session_id=session_id)
+
+    # Cached documents keep their place; only the missing ones are searched for, on the cached vector
+    assert topped_up[:1] == docs
+    assert len(topped_up) == 3
+    assert len({doc for doc, _, _ in topped_up}) == 3
+    assert calls == {"embed": 1, "search": 2}
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+import llm
+from llm.base import LLM
+from llm.failover_module import LLM_HEDGED_STREAMS, FailoverLLM
+
+
+class Rejected(Exception):
+    # Not retryable: the member gives up at once and the failover moves on
+    status_code = 400
+
+
+class FakeLLM(LLM):
+    ttft = 0.0
+    fail = False
+    calls = 0
+
+    def _create_client(self):
+        return None
+
+    async def chat(self, *args, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise Rejected(f"{self.provider} down")
+        return {"content": self.provider}
+
+    async def stream(self, *args, **kwargs):
+        if self.fail:
+            raise Rejected(f"{self.provider} down")
+        await asyncio.sleep(self.ttft)
+        for chunk in (self.provider, " done"):
+            yield chunk
+
+    async def embed(self, input_texts, **kwargs):
+        if self.fail:
+            raise Rejected(f"{self.provider} down")
+        return [[float(len(self.provider))] for _ in input_texts]
+
+
+class PrimaryLLM(FakeLLM):
+    pass
+
+
+class SecondaryLLM(FakeLLM):
+    pass
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setitem(llm.LLM_PROVIDERS, "primary", PrimaryLLM)
+    monkeypatch.setitem(llm.LLM_PROVIDERS, "secondary", SecondaryLLM)
+    return ["primary", "secondary"]
+
+
+def _collect(failover):
+    async def run():
+        return "".join([chunk async for chunk in failover.stream(prompt="hi")])
+    return asyncio.run(run())
+
+
+def test_chat_fails_over_to_the_next_provider(providers):
+    failover = FailoverLLM(providers=providers)
+    primary = failover.members[0][1]
+    primary.fail = True
+
+    assert asyncio.run(failover.chat(prompt="hi")) == {"content": "secondary"}
+    assert failover.breakers["primary"]._failures == 1
+    assert failover.breakers["secondary"]._failures == 0
+
+
+def test_open_breaker_skips_the_failing_provider(providers):
+    failover = FailoverLLM(providers=providers)
+    primary = failover.members[0][1]
+    primary.fail = True
+
+    for _ in range(failover.breakers["primary"].failure_threshold):
+        asyncio.run(failover.chat(prompt="hi"))
+    assert failover.breakers["primary"].is_open
+
+    calls = primary.calls
+    assert asyncio.run(failover.chat(prompt="hi")) == {"content": "secondary"}
+    assert primary.calls == calls
+
+
+def test_last_provider_error_is_raised_when_all_fail(providers):
+    failover = FailoverLLM(providers=providers)
+    for _, member in failover.members:
+        member.fail = True
+
+    with pytest.raises(Rejected, match="secondary down"):
+        asyncio.run(failover.chat(prompt="hi"))
+
+
+def test_stream_fails_over_before_the_first_chunk(providers):
+    failover = FailoverLLM(providers=providers)
+    failover.members[0][1].fail = True
+
+    assert _collect(failover) == "secondary done"
+    assert failover.breakers["primary"]._failures == 1
+
+
+def test_hedged_stream_takes_the_faster_provider(providers):
+    failover = FailoverLLM(providers=providers, hedge=True)
+    failover.hedge_delay = 0.05
+    failover.members[0][1].ttft = 1.0
+    before = LLM_HEDGED_STREAMS.value(winner="secondary")
+
+    assert _collect(failover) == "secondary done"
+    assert LLM_HEDGED_STREAMS.value(winner="secondary") - before == 1
+    # Losing a hedge race is not a failure
+    assert failover.breakers["primary"]._failures == 0
+
+
+def test_fast_primary_is_not_hedged(providers):
+    failover = FailoverLLM(providers=providers, hedge=True)
+    failover.hedge_delay = 0.5
+    before = LLM_HEDGED_STREAMS.value(winner="primary")
+
+    assert _collect(failover) == "primary done"
+    assert LLM_HEDGED_STREAMS.value(winner="primary") == before
+
+
+def test_hedge_delay_follows_observed_p95_ttft(providers):
+    failover = FailoverLLM(providers=providers, hedge=True)
+    failover.hedge_delay = 2.0
+    samples = failover._ttft["primary"]
+
+    samples.extend([0.1] * 10)
+    # Too few samples to trust: the configured delay applies
+    assert failover._hedge_after("primary") == 2.0
+
+    samples.extend([0.1] * 9 + [0.3] * 1)
+    assert failover._hedge_after("primary") == 0.3
+    samples.extend([0.1] * 80)
+    assert failover._hedge_after("primary") == 0.1
+
+
+def test_cancelled_hedge_attempt_counts_as_a_ttft_sample(providers):
+    failover = FailoverLLM(providers=providers, hedge=True)
+    failover.hedge_delay = 0.05
+    failover.members[0][1].ttft = 1.0
+
+    assert _collect(failover) == "secondary done"
+    # The slow primary was cancelled, but its wait is still on record as a lower bound
+    [sample] = failover._ttft["primary"]
+    assert sample >= 0.05
+
+
+def test_embed_stays_on_the_primary_by_default(providers):
+    failover = FailoverLLM(providers=providers)
+    failover.members[0][1].fail = True
+
+    with pytest.raises(Rejected):
+        asyncio.run(failover.embed(["hi"]))
+    assert failover.embed_breakers["primary"]._failures == 1
+
+
+def test_embed_fails_over_among_embed_providers(providers, monkeypatch):
+    monkeypatch.setenv("FAILOVER_EMBED_PROVIDERS", "primary,secondary")
+    failover = FailoverLLM(providers=providers)
+    failover.members[0][1].fail = True
+
+    assert asyncio.run(failover.embed(["hi"])) == [[float(len("secondary"))]]
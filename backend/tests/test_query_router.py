@@ -0,0 +1,38 @@
+import pytest
+
+from services.query_router import ROUTE_COT, ROUTE_DIRECT, QueryRouter
+
+router = QueryRouter("auto")
+
+
+def _history(question):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": "..."}]
+
+
+@pytest.mark.parametrize("query, route", [
+    ("Where did you study?", ROUTE_DIRECT),
+    ("What is your current title?", ROUTE_DIRECT),
+    ("Why did you leave Acme?", ROUTE_COT),
+    ("Walk me through the retrieval platform design", ROUTE_COT),
+    ("你在哪裡念書？", ROUTE_DIRECT),
+    ("為什麼離開上一份工作？", ROUTE_COT),
+])
+def test_route_without_history(query, route):
+    assert router.route(query) == route
+
+
+@pytest.mark.parametrize("previous, query, route", [
+    # Elliptical follow-ups take the previous question's route
+    ("What was your title at Acme?", "And at Globex?", ROUTE_DIRECT),
+    ("Describe the hardest project at Acme", "And at Globex?", ROUTE_COT),
+    ("你在 Acme 的職稱是什麼？", "那 Globex 呢？", ROUTE_DIRECT),
+    # A follow-up with its own cue is routed on its own
+    ("What was your title at Acme?", "Why?", ROUTE_COT),
+    ("Describe the hardest project at Acme", "Where was it based?", ROUTE_DIRECT),
+])
+def test_followup_routes_with_history(previous, query, route):
+    assert router.route(query, _history(previous)) == route
+
+
+def test_followup_without_history_stays_cot():
+    assert router.route("And at Globex?") == ROUTE_COT
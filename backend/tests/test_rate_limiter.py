@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from llm.rate_limiter import RateLimiter, RateLimitWouldBlock, TokenBucket, get_rate_limiter
+
+
+def test_blocking_acquire_refuses_to_wait_on_the_loop():
+    limiter = RateLimiter("test", "chat", rpm=1)
+    limiter.acquire(1)
+
+    async def acquire_on_loop():
+        limiter.acquire(1)
+
+    with pytest.raises(RateLimitWouldBlock):
+        asyncio.run(acquire_on_loop())
+    # The refused reservation was handed back: the next caller waits no longer than before
+    assert limiter._requests.reserve(1) <= 60.5
+
+
+def test_blocking_acquire_within_budget_on_the_loop():
+    limiter = RateLimiter("test", "chat", rpm=10)
+
+    async def acquire_on_loop():
+        limiter.acquire(1)
+
+    asyncio.run(acquire_on_loop())
+
+
+def _tpm_level(limiter):
+    limiter._tokens.refund(0)  # refill up to now
+    return limiter._tokens._level
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    from llm.stub_module import StubLLM
+
+    monkeypatch.setenv("RATE_LIMIT_STUBTPM_CHAT_TPM", "6000")
+    monkeypatch.setenv("STUB_THINKING_TOKENS", "2")
+    monkeypatch.setenv("STUB_ANSWER_TOKENS", "3")
+    llm = StubLLM(provider="stubtpm")
+    limiter = get_rate_limiter("stubtpm", "chat")
+    limiter._tokens = TokenBucket(6000)
+    return llm, limiter
+
+
+def test_stream_settles_its_reservation(stub_llm):
+    llm, limiter = stub_llm
+
+    async def run():
+        return [chunk async for chunk in llm.stream(prompt="Hi")]
+
+    chunks = asyncio.run(run())
+
+    # Reserved prompt + 512 completion tokens up front; a ~20 token reply gives most of it back
+    assert chunks
+    assert _tpm_level(limiter) > 6000 - 50
+
+
+def test_stream_closed_early_settles_what_was_streamed(stub_llm):
+    llm, limiter = stub_llm
+
+    async def run():
+        stream = llm.stream(prompt="Hi")
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+
+    assert _tpm_level(limiter) > 6000 - 50
@@ -0,0 +1,69 @@
+import json
+import threading
+
+from utils.request_trace import TRACES_DROPPED, TraceWriter
+
+
+def _read_lines(directory):
+    return [json.loads(line) for path in sorted(directory.glob("*.jsonl")) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_close_writes_out_queued_records(tmp_path):
+    writer = TraceWriter(str(tmp_path))
+    for i in range(1200):
+        writer.write({"request_id": i, "query": "你好"})
+    writer.close()
+
+    records = _read_lines(tmp_path)
+    assert [r["request_id"] for r in records] == list(range(1200))
+    assert records[0]["query"] == "你好"
+
+
+def test_write_after_close_starts_a_new_writer(tmp_path):
+    writer = TraceWriter(str(tmp_path))
+    writer.write({"request_id": 1})
+    writer.close()
+    writer.write({"request_id": 2})
+    writer.close()
+
+    assert [r["request_id"] for r in _read_lines(tmp_path)] == [1, 2]
+
+
+def test_concurrent_writers(tmp_path):
+    writer = TraceWriter(str(tmp_path))
+
+    def produce(offset):
+        for i in range(200):
+            writer.write({"request_id": offset + i})
+
+    threads = [threading.Thread(target=produce, args=(n * 1000,)) for n in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+
+    assert sorted(r["request_id"] for r in _read_lines(tmp_path)) == sorted(n * 1000 + i for n in range(5) for i in range(200))
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    writer = TraceWriter(str(tmp_path), queue_size=1)
+    # Hold the writer thread before it can drain: the file rollover waits on this lock
+    gate = threading.Lock()
+    gate.acquire()
+    original = writer._current_file
+
+    def blocked_current_file():
+        with gate:
+            return original()
+
+    writer._current_file = blocked_current_file
+    before = TRACES_DROPPED.value()
+    for i in range(50):
+        writer.write({"request_id": i})
+    gate.release()
+    writer.close()
+
+    written = _read_lines(tmp_path)
+    assert 0 < len(written) < 50
+    assert TRACES_DROPPED.value() - before == 50 - len(written)
@@ -0,0 +1,43 @@
+import sys
+
+import pytest
+
+from services.reranker import CrossEncoderReranker, LexicalReranker, dense_similarity
+
+CANDIDATES = [
+    ("Skills\nPython, Go and Kubernetes.", {"Header_1": "Skills"}, 0.40),
+    ("Education\nMaster of Computer Science.", {"Header_1": "Education"}, 0.30),
+]
+
+
+def test_lexical_reranker_prefers_term_overlap():
+    ranked = LexicalReranker().rerank("Which languages: Python or Go?", CANDIDATES, top_n=1)
+
+    assert ranked[0][1]["Header_1"] == "Skills"
+
+
+@pytest.mark.parametrize("metric, distance, similarity", [
+    ("cosine", 0.2, 0.8),
+    ("ip", 0.2, 0.8),
+    ("l2", 0.4, 0.8),  # squared distance of unit vectors: 2 - 2 * cos
+])
+def test_dense_similarity_per_metric(metric, distance, similarity):
+    assert dense_similarity(distance, metric) == pytest.approx(similarity)
+
+
+def test_cross_encoder_load_failure_is_not_retried(monkeypatch):
+    loads = []
+
+    class FlagReranker:
+        def __init__(self, *args, **kwargs):
+            loads.append(args)
+            raise OSError("model download failed")
+
+    monkeypatch.setitem(sys.modules, "FlagEmbedding", type(sys)("FlagEmbedding"))
+    monkeypatch.setattr(sys.modules["FlagEmbedding"], "FlagReranker", FlagReranker, raising=False)
+    reranker = CrossEncoderReranker()
+    expected = LexicalReranker().score("Python", CANDIDATES)
+
+    assert reranker.score("Python", CANDIDATES) == expected
+    assert reranker.score("Python", CANDIDATES) == expected
+    assert len(loads) == 1
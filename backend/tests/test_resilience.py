@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+
+from llm import resilience
+from llm.base import LLM
+from llm.resilience import Deadline, DeadlineExceeded, backoff_delay, is_retryable
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class Rejected(Exception):
+    status_code = 400
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("slow down")
+        self.response = type("Response", (), {"status_code": 429, "headers": {"retry-after": retry_after}})()
+
+
+class FlakySyncLLM(LLM):
+    """Sync client whose first call fails with a retryable error."""
+
+    def __init__(self):
+        super().__init__(provider="flaky")
+        self.calls = 0
+
+    def _create_client(self):
+        return None
+
+    def chat(self, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise Unavailable()
+        return {"content": "ok"}
+
+    def stream(self, **kwargs):
+        yield "ok"
+
+    def embed(self, input_texts, **kwargs):
+        return [[0.0]]
+
+
+def test_sync_call_retries_off_the_loop():
+    llm = FlakySyncLLM()
+
+    assert llm.chat() == {"content": "ok"}
+    assert llm.calls == 2
+
+
+def test_sync_call_on_the_loop_fails_instead_of_blocking():
+    llm = FlakySyncLLM()
+
+    async def call():
+        start = time.perf_counter()
+        with pytest.raises(Unavailable):
+            llm.chat()
+        return time.perf_counter() - start
+
+    assert asyncio.run(call()) < 0.1
+    assert llm.calls == 1
+
+
+def test_to_thread_keeps_retrying():
+    llm = FlakySyncLLM()
+
+    assert asyncio.run(asyncio.to_thread(llm.chat)) == {"content": "ok"}
+
+
+class ScriptedLLM(LLM):
+    """Async client that raises the scripted errors in turn, then succeeds."""
+
+    def __init__(self, errors=(), chunks=("a", "b"), fail_after_first_chunk=False, delay=0.0):
+        super().__init__(provider="scripted")
+        self.errors = list(errors)
+        self.chunks = chunks
+        self.fail_after_first_chunk = fail_after_first_chunk
+        self.delay = delay
+        self.calls = 0
+        self.timeouts = []
+
+    def _create_client(self):
+        return None
+
+    def _next_error(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+    async def chat(self, **kwargs):
+        self._next_error()
+        await asyncio.sleep(self.delay)
+        return {"content": "ok"}
+
+    async def stream(self, **kwargs):
+        self._next_error()
+        for index, chunk in enumerate(self.chunks):
+            await asyncio.sleep(self.delay)
+            yield chunk
+            if index == 0 and self.fail_after_first_chunk:
+                raise Unavailable()
+
+    async def embed(self, input_texts, **kwargs):
+        return [[0.0]]
+
+
+class TimedSyncLLM(FlakySyncLLM):
+    def chat(self, timeout=None, **kwargs):
+        self.last_timeout = timeout
+        return {"content": "ok"}
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_RETRY_BASE_SECONDS", 0.0)
+
+
+def _collect(llm, **kwargs):
+    async def run():
+        return [chunk async for chunk in llm.stream(**kwargs)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (Unavailable(), True),
+    (Rejected(), False),
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (type("APIConnectionError", (Exception,), {})(), True),
+    (ValueError(), False),
+    (DeadlineExceeded(), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) == retryable
+
+
+def test_async_call_retries_transient_errors(no_backoff):
+    llm = ScriptedLLM(errors=[Unavailable(), Unavailable()])
+
+    assert asyncio.run(llm.chat()) == {"content": "ok"}
+    assert llm.calls == 3
+
+
+def test_async_call_gives_up_after_max_retries(no_backoff):
+    llm = ScriptedLLM(errors=[Unavailable()] * (resilience.LLM_MAX_RETRIES + 1))
+
+    with pytest.raises(Unavailable):
+        asyncio.run(llm.chat())
+    assert llm.calls == resilience.LLM_MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried(no_backoff):
+    llm = ScriptedLLM(errors=[Rejected()])
+
+    with pytest.raises(Rejected):
+        asyncio.run(llm.chat())
+    assert llm.calls == 1
+
+
+def test_stream_retries_before_its_first_chunk(no_backoff):
+    llm = ScriptedLLM(errors=[Unavailable()])
+
+    assert _collect(llm) == ["a", "b"]
+    assert llm.calls == 2
+
+
+def test_stream_is_not_retried_once_text_went_out(no_backoff):
+    llm = ScriptedLLM(fail_after_first_chunk=True)
+    received = []
+
+    async def run():
+        async for chunk in llm.stream():
+            received.append(chunk)
+
+    with pytest.raises(Unavailable):
+        asyncio.run(run())
+    assert received == ["a"]
+    assert llm.calls == 1
+
+
+def test_deadline_cancels_a_slow_async_call():
+    llm = ScriptedLLM(delay=1.0)
+    start = time.perf_counter()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(llm.chat(deadline=Deadline(0.05)))
+    assert time.perf_counter() - start < 0.5
+
+
+def test_deadline_bounds_a_stream_between_chunks():
+    llm = ScriptedLLM(delay=1.0)
+
+    with pytest.raises(DeadlineExceeded):
+        _collect(llm, deadline=Deadline(0.05))
+
+
+def test_expired_deadline_fails_before_calling():
+    llm = ScriptedLLM()
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(llm.chat(deadline=deadline))
+    assert llm.calls == 0
+
+
+def test_deadline_caps_the_sync_http_timeout():
+    llm = TimedSyncLLM()
+
+    llm.chat(timeout=30, deadline=Deadline(5))
+    assert 0 < llm.last_timeout <= 5
+    llm.chat(timeout=30)
+    assert llm.last_timeout == 30
+
+
+def test_backoff_honours_retry_after_and_the_deadline():
+    assert backoff_delay(0, RateLimited("3"), None) >= 3
+    # Waiting would overrun the request budget: give up now
+    assert backoff_delay(0, RateLimited("3"), Deadline(1)) is None
+    assert backoff_delay(resilience.LLM_MAX_RETRIES, Unavailable(), None) is None
+    assert backoff_delay(0, Rejected(), None) is None
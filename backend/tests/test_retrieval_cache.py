@@ -0,0 +1,32 @@
+import pytest
+
+from services.retrieval_cache import is_anaphoric_followup
+
+
+@pytest.mark.parametrize("query", [
+    "Tell me more about that",
+    "Why?",
+    "How so?",
+    "Can you elaborate on that?",
+    "Give me an example",
+    "What else?",
+    "為什麼？",
+    "可以再詳細說明嗎？",
+    "還有呢",
+])
+def test_followups_reuse_previous_context(query):
+    assert is_anaphoric_followup(query)
+
+
+@pytest.mark.parametrize("query", [
+    "Why did you leave your last job?",
+    "Do you have more experience with Java?",
+    "Is it possible to contact you?",
+    "What is this project's tech stack?",
+    "Tell me more about your Kubernetes work",
+    "你為什麼想換工作？",
+    "這個專案用了什麼技術？",
+    "",
+])
+def test_new_questions_are_not_followups(query):
+    assert not is_anaphoric_followup(query)
@@ -0,0 +1,86 @@
+import time
+import uuid
+
+from services import chat_service
+from services.singleflight import Flight, StreamFlights, flight_key, normalize_query
+
+
+class FakeStream:
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.done = False
+
+    def can_resume(self, after_seq):
+        return True
+
+
+def test_normalize_query():
+    assert normalize_query("  Where did you   STUDY？ ") == "where did you study"
+    assert normalize_query("Ｗhere did you study?!") == "where did you study"
+
+
+def test_flight_key_separates_options():
+    key = flight_key("Where did you study?", "en", "HR", {"k": None})
+
+    assert key == flight_key("where did you study", "en", "hr", {"k": None})
+    assert key != flight_key("where did you study", "zhtw", "hr", {"k": None})
+    assert key != flight_key("where did you study", "en", "hr", {"k": 3})
+
+
+def test_followers_join_the_running_flight():
+    flights = StreamFlights()
+    started = []
+
+    def start(flight):
+        started.append(flight)
+        return FakeStream(f"s{len(started)}")
+
+    leader, joined_leader = flights.join_or_start("k", "a", start)
+    follower, joined_follower = flights.join_or_start("k", "b", start)
+
+    assert (joined_leader, joined_follower) == (False, True)
+    assert follower is leader and len(started) == 1
+    assert flights.close(leader) == ["b"]
+    assert flights.close(leader) == []
+
+    # Closed: the next identical request leads a new flight
+    again, joined = flights.join_or_start("k", "c", start)
+    assert not joined and again.stream.stream_id == "s2"
+
+
+def test_finished_or_truncated_flights_are_not_joinable():
+    flight = Flight("k")
+    flight.stream = FakeStream("s")
+    assert flight.joinable()
+
+    flight.stream.can_resume = lambda after_seq: False
+    assert not flight.joinable()
+
+    flight.stream = FakeStream("s")
+    flight.stream.done = True
+    assert not flight.joinable()
+
+
+def test_identical_stream_requests_share_one_generation(monkeypatch):
+    # Slow enough that the second request arrives while the first is generating
+    monkeypatch.setattr(chat_service.llm, "ttft_seconds", 0.3)
+    monkeypatch.setattr(chat_service.llm, "ttft_sigma", 0.01)
+    query = f"Where did you study {uuid.uuid4().hex[:6]}?"
+    leader_session, follower_session = f"test-{uuid.uuid4().hex}", f"test-{uuid.uuid4().hex}"
+    released = []
+
+    first = chat_service.start_stream(query=query, lang="en", session_id=leader_session)
+    second = chat_service.start_stream(
+        on_done=lambda: released.append(True), query=query, lang="en", session_id=follower_session
+    )
+
+    assert first == second
+    # The follower starts no upstream work, so its slot is released right away
+    assert released == [True]
+    events = list(chat_service.stream_events(second))
+    assert events[-1]["type"] == "usage"
+    deadline = time.monotonic() + 2
+    while not chat_service._conversation_store.get_history(follower_session):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert chat_service._conversation_store.get_history(follower_session)[0]["content"] == query
@@ -0,0 +1,123 @@
+import asyncio
+
+from utils.sse import coalesce_tokens, set_write_timeout, with_heartbeat
+
+
+async def _events(items, closed=None):
+    """Yield items; a number means "pause this many seconds"."""
+    try:
+        for item in items:
+            if isinstance(item, (int, float)):
+                await asyncio.sleep(item)
+            else:
+                yield item
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+def _token(text):
+    return {"type": "token", "content": text}
+
+
+def _run(agen):
+    async def collect():
+        return [event async for event in agen]
+    return asyncio.run(collect())
+
+
+def test_first_token_passes_through_and_the_rest_is_merged():
+    events = [{"type": "sources", "sources": []}] + [_token(c) for c in "abcdef"] + [{"type": "usage"}]
+
+    out = _run(coalesce_tokens(_events(events), interval_ms=1000, max_bytes=0))
+
+    assert out == [{"type": "sources", "sources": []}, _token("a"), _token("bcdef"), {"type": "usage"}]
+
+
+def test_flushes_at_max_bytes():
+    out = _run(coalesce_tokens(_events([_token("x")] + [_token("ab")] * 5), interval_ms=1000, max_bytes=4))
+
+    assert [e["content"] for e in out] == ["x", "abab", "abab", "ab"]
+
+
+def test_stalled_source_does_not_hold_back_buffered_text():
+    # The second chunk must go out on the interval timer, before the stalled third one arrives
+    events = [_token("a"), _token("b"), 0.3, _token("c")]
+    stamps = []
+
+    async def collect():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async for event in coalesce_tokens(_events(events), interval_ms=20, max_bytes=0):
+            stamps.append((event["content"], loop.time() - start))
+
+    asyncio.run(collect())
+
+    assert [content for content, _ in stamps] == ["a", "b", "c"]
+    assert stamps[1][1] < 0.2
+
+
+def test_disabled_coalescing_passes_every_event():
+    events = [_token(c) for c in "abc"]
+
+    assert _run(coalesce_tokens(_events(events), interval_ms=0)) == events
+
+
+def test_closing_early_closes_the_source():
+    closed = []
+
+    async def run():
+        stream = coalesce_tokens(_events([_token("a"), 5, _token("b")], closed), interval_ms=20)
+        assert await stream.__anext__() == _token("a")
+        await stream.aclose()
+
+    asyncio.run(run())
+
+    assert closed == [True]
+
+
+def test_heartbeats_fill_silent_stretches():
+    out = _run(with_heartbeat(_events([_token("a"), 0.25, _token("b")]), interval=0.1))
+
+    assert out[0] == _token("a") and out[-1] == _token("b")
+    assert out[1:-1] == [{"type": "heartbeat"}] * len(out[1:-1])
+    assert 1 <= len(out[1:-1]) <= 3
+
+
+def test_no_heartbeat_when_events_keep_coming():
+    events = [_token(c) for c in "abc"]
+
+    assert _run(with_heartbeat(_events(events), interval=0.1)) == events
+
+
+def test_heartbeat_disabled():
+    assert _run(with_heartbeat(_events([0.05, _token("a")]), interval=0)) == [_token("a")]
+
+
+def test_heartbeat_consumer_closing_cancels_the_pending_read():
+    closed = []
+
+    async def run():
+        stream = with_heartbeat(_events([5, _token("late")], closed), interval=0.02)
+        # Only heartbeats while the source is stuck in its 5 s pause
+        assert await stream.__anext__() == {"type": "heartbeat"}
+        await stream.aclose()
+
+    asyncio.run(asyncio.wait_for(run(), 2))
+
+    assert closed == [True]
+
+
+def test_set_write_timeout_on_the_server_socket():
+    class Socket:
+        timeout = None
+
+        def settimeout(self, seconds):
+            self.timeout = seconds
+
+    sock = Socket()
+
+    assert set_write_timeout({"werkzeug.socket": sock}, seconds=7)
+    assert sock.timeout == 7
+    assert not set_write_timeout({}, seconds=7)
+    assert not set_write_timeout({"gunicorn.socket": Socket()}, seconds=0)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.stream_registry import ReplayStream, StreamGapError, StreamRegistry, parse_last_event_id
+
+
+async def _tokens(count, produced):
+    for i in range(count):
+        produced.append(i)
+        yield {"type": "token", "content": "x" * 20}
+        await asyncio.sleep(0.001)
+
+
+def test_unresumable_stream_is_cancelled_once_its_reader_leaves():
+    produced = []
+
+    async def run():
+        # Room for about two token events
+        stream = ReplayStream("s", max_bytes=110)
+        stream.start(_tokens(1000, produced))
+        reader = stream.subscribe()
+        await reader.__anext__()
+        await reader.aclose()
+        await asyncio.wait_for(stream._task, 2)
+        return stream
+
+    stream = asyncio.run(run())
+
+    assert stream.done
+    assert len(produced) < 10
+    assert stream._events[-1][1] == {"type": "error", "message": "stream cancelled"}
+
+
+def _answer(*contents):
+    async def events():
+        for content in contents:
+            yield {"type": "token", "content": content}
+        yield {"type": "usage"}
+    return events()
+
+
+def _wait_until_done(stream):
+    deadline = time.monotonic() + 2
+    while not stream.done:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_registry_replays_and_resumes_by_sequence():
+    registry = StreamRegistry()
+    stream = registry.start(_answer("a", "b", "c"))
+    _wait_until_done(stream)
+
+    full = list(registry.iterate(stream.stream_id))
+    resumed = list(registry.iterate(stream.stream_id, after_seq=2))
+
+    assert [(e["seq"], e["type"], e.get("content")) for e in full] == [
+        (1, "token", "a"), (2, "token", "b"), (3, "token", "c"), (4, "usage", None)
+    ]
+    assert [e["seq"] for e in resumed] == [3, 4]
+
+
+def test_on_done_runs_when_the_generation_ends():
+    done = threading.Event()
+    registry = StreamRegistry()
+    registry.start(_answer("a"), on_done=done.set)
+
+    assert done.wait(2)
+
+
+def test_unknown_and_expired_streams():
+    registry = StreamRegistry(ttl_seconds=0.05)
+    stream = registry.start(_answer("a"))
+    _wait_until_done(stream)
+
+    with pytest.raises(LookupError):
+        registry.iterate("nope")
+    time.sleep(0.1)
+    assert registry.get(stream.stream_id) is None
+    with pytest.raises(LookupError):
+        registry.iterate(stream.stream_id)
+
+
+def test_buffer_keeps_only_the_newest_events():
+    async def run():
+        stream = ReplayStream("s", max_bytes=120)
+        stream.start(_answer(*"abcdef"))
+        await asyncio.wait_for(stream._task, 2)
+        return stream, [e async for e in stream.subscribe(after_seq=stream.last_seq - 1)]
+
+    stream, tail = asyncio.run(run())
+
+    assert not stream.can_resume(0)
+    assert stream.can_resume(stream.last_seq - 1)
+    assert tail == [{"type": "usage", "seq": 7}]
+
+
+def test_gap_in_the_registry_is_reported(monkeypatch):
+    # Streams started by the registry get a buffer of about two token events
+    monkeypatch.setattr(ReplayStream.__init__, "__defaults__", (120,))
+    registry = StreamRegistry()
+    stream = registry.start(_answer(*"abcdef"))
+    _wait_until_done(stream)
+
+    with pytest.raises(StreamGapError):
+        registry.iterate(stream.stream_id, after_seq=0)
+
+
+@pytest.mark.parametrize("value, parsed", [
+    (None, (None, 0)),
+    ("abc:7", ("abc", 7)),
+    ("7", (None, 7)),
+    ("abc:x", (None, 0)),
+    ("abc:-3", ("abc", 0)),
+])
+def test_parse_last_event_id(value, parsed):
+    assert parse_last_event_id(value) == parsed
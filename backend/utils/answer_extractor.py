@@ -0,0 +1,133 @@
+from typing import List
+
+
+class AnswerExtractor:
+    """
+    Incremental scanner that pulls the text between <answer> and </answer> out of a
+    (streamed) completion.
+
+    Each chunk is scanned once; a tag split across chunk boundaries is handled by
+    carrying over at most len(tag) - 1 characters, so the total work is linear in
+    the length of the stream. Output that does not open with a tag (e.g. a direct
+    answer without <answer>) is passed through as soon as that is clear, while a
+    leading <thinking> block is held back until <answer> shows up.
+    """
+
+    START_TAG = "<answer>"
+    END_TAG = "</answer>"
+
+    _SEEKING = 0
+    _ANSWER = 1
+    _DONE = 2
+
+    def __init__(self, probe_chars: int = 8):
+        """
+        Args:
+            probe_chars: non-whitespace characters to look at before deciding that an
+                         output which doesn't start with a tag has no <answer> block
+        """
+        self._probe_chars = probe_chars
+        self._state = self._SEEKING
+        self._carry = ""                 # tail that may be the start of a tag
+        self._preamble: List[str] = []   # raw chunks seen before <answer>
+        self._head = ""                  # first non-whitespace characters of the output
+        self._parts: List[str] = []      # emitted answer text
+
+    @property
+    def ended(self) -> bool:
+        """True once </answer> has been seen; further chunks are ignored."""
+        return self._state == self._DONE
+
+    @property
+    def answer(self) -> str:
+        """Everything emitted so far."""
+        return "".join(self._parts)
+
+    @staticmethod
+    def _partial_tag_len(data: str, tag: str) -> int:
+        """Length of the suffix of data that is a proper prefix of tag (tags contain a single '<')."""
+        lt = data.rfind("<", max(0, len(data) - len(tag) + 1))
+        if lt == -1 or not tag.startswith(data[lt:]):
+            return 0
+        return len(data) - lt
+
+    def _emit(self, text: str) -> str:
+        if text:
+            self._parts.append(text)
+        return text
+
+    def _feed_answer(self, chunk: str) -> str:
+        data = self._carry + chunk if self._carry else chunk
+        end = data.find(self.END_TAG)
+        if end != -1:
+            self._carry = ""
+            self._state = self._DONE
+            return self._emit(data[:end])
+
+        hold = self._partial_tag_len(data, self.END_TAG)
+        if hold:
+            self._carry = data[-hold:]
+            data = data[:-hold]
+        else:
+            self._carry = ""
+        if data:
+            self._parts.append(data)
+        return data
+
+    def _feed_seeking(self, chunk: str) -> str:
+        data = self._carry + chunk if self._carry else chunk
+        start = data.find(self.START_TAG)
+        if start != -1:
+            # Discard everything before <answer>
+            self._preamble.clear()
+            self._carry = ""
+            self._state = self._ANSWER
+            return self._feed_answer(data[start + len(self.START_TAG):])
+
+        self._preamble.append(chunk)
+        hold = self._partial_tag_len(data, self.START_TAG)
+        self._carry = data[-hold:] if hold else ""
+
+        if len(self._head) < self._probe_chars:
+            self._head += chunk.lstrip() if not self._head else chunk
+            self._head = self._head[:self._probe_chars]
+            if len(self._head) >= self._probe_chars and not self._head.startswith("<"):
+                # No leading tag: the output is the answer itself, pass it through
+                return self._release_preamble()
+        return ""
+
+    def _release_preamble(self) -> str:
+        text = "".join(self._preamble)
+        self._preamble.clear()
+        self._carry = ""
+        self._state = self._ANSWER
+        return self._feed_answer(text)
+
+    def feed(self, chunk: str) -> str:
+        """Consume the next chunk and return the answer text that is now safe to emit."""
+        state = self._state
+        if state == self._ANSWER:
+            return self._feed_answer(chunk) if chunk else ""
+        if state == self._DONE or not chunk:
+            return ""
+        return self._feed_seeking(chunk)
+
+    def finish(self) -> str:
+        """Flush at end of stream: held-back characters, or the whole output if <answer> never appeared."""
+        if self._state == self._SEEKING:
+            text = self._release_preamble()
+        else:
+            text = ""
+        if self._state == self._ANSWER:
+            text += self._emit(self._carry)
+            self._carry = ""
+            self._state = self._DONE
+        return text
+
+
+def extract_answer(text: str) -> str:
+    """Non-streaming counterpart: the stripped <answer> block of a full completion."""
+    extractor = AnswerExtractor()
+    extractor.feed(text or "")
+    extractor.finish()
+    return extractor.answer.strip()
@@ -1,43 +1,201 @@
+"""
+Process-wide logging setup.
+
+Loggers only put records on an in-memory queue; a QueueListener thread does
+the formatting and the console / file writes, so no request thread or event
+loop ever blocks on stdout or disk. Files rotate by size.
+
+Configuration (env):
+    LOG_LEVEL             default level (INFO; set DEBUG to see per-request details)
+    LOG_LEVELS            per-module overrides, e.g. "ChatService=INFO,LLM_Resilience=WARNING"
+    LOG_FORMAT            "text" (default) or "json" (one structured object per line)
+    LOG_MAX_MESSAGE_CHARS messages longer than this are truncated (0 = never)
+    LOG_SAMPLING          keep only a fraction of a module's DEBUG/INFO records,
+                          e.g. "ChatService=0.1"; warnings and errors are always kept
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT   size-based rotation of the log file
+    LOG_QUEUE_SIZE        records buffered before new ones are dropped
+                          (counted in log_records_dropped_total on /metrics)
+"""
+
+import os
+import copy
+import json
+import queue
+import atexit
+import random
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Optional
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from utils.metrics import metrics
+
+TEXT_FORMAT = "[%(asctime)s] - [%(name)s] - [%(funcName)s():%(lineno)d %(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def _parse_module_map(value: str) -> Dict[str, str]:
+    """"A=x,B=y" -> {"A": "x", "B": "y"}; malformed entries are ignored."""
+    result = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip() and setting.strip():
+            result[name.strip()] = setting.strip()
+    return result
+
+
+LOG_LEVELS = _parse_module_map(os.getenv("LOG_LEVELS", ""))
+LOG_SAMPLING = {name: float(rate) for name, rate in _parse_module_map(os.getenv("LOG_SAMPLING", "")).items()}
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    "log_records_dropped_total", "Log records dropped because the logging queue was full", ("logger",)
+)
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and goes into JSON output
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, func, line, message, extras, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _formatter() -> logging.Formatter:
+    return JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+
+
+class _TruncatingQueueHandler(QueueHandler):
+    """
+    Enqueues records without formatting them (that happens on the listener thread),
+    cutting oversized messages and dropping records instead of blocking when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if 0 < LOG_MAX_MESSAGE_CHARS < len(message):
+            message = f"{message[:LOG_MAX_MESSAGE_CHARS]}... [truncated {len(message) - LOG_MAX_MESSAGE_CHARS} chars]"
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(logger=record.name)
+
+
+class _SamplingFilter(logging.Filter):
+    """Keeps `rate` of the records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _LogWriter:
+    """One queue + listener thread per log file, shared by every logger writing to it."""
+
+    _writers: Dict[Optional[Path], "_LogWriter"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, log_path: Optional[Path]):
+        handlers = [logging.StreamHandler()]
+        if log_path is not None:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            handlers.append(RotatingFileHandler(
+                log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            ))
+        formatter = _formatter()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.handler = _TruncatingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        self.listener = QueueListener(self.handler.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    @classmethod
+    def get(cls, log_path: Optional[Path]) -> "_LogWriter":
+        with cls._lock:
+            writer = cls._writers.get(log_path)
+            if writer is None:
+                writer = cls._writers[log_path] = cls(log_path)
+            return writer
+
+    @classmethod
+    def stop_all(cls) -> None:
+        """Flush what is still queued; registered to run at interpreter exit."""
+        with cls._lock:
+            for writer in cls._writers.values():
+                writer.listener.stop()
+            cls._writers.clear()
+
+
+atexit.register(_LogWriter.stop_all)
 
 
 class LoggerSetup:
     def __init__(
-            self, 
-            module_name: str, 
-            level: int = logging.DEBUG, 
+            self,
+            module_name: str,
+            level: Optional[int] = None,
             log_file_path: str | None = None
         ):
         """
-        Configure a logger with console output and optional file output.
+        Configure a logger that writes to the console and, optionally, a file via the shared
+        queue listener. LOG_LEVELS / LOG_LEVEL from the environment override `level`,
+        which defaults to LOG_LEVEL.
+        Calling it again for the same module returns the already configured logger.
         """
         self.logger = logging.getLogger(module_name)
-        self.logger.setLevel(level)
-
-        self.console_handler = logging.StreamHandler()
-        self.console_handler.setLevel(level)
-
-        fmt = "[%(asctime)s] - [%(name)s] - [%(funcName)s():%(lineno)d %(levelname)s] %(message)s"
-        datefmt = "%Y-%m-%d %H:%M:%S"
-        self.console_format = logging.Formatter(fmt, datefmt)
-        self.console_handler.setFormatter(self.console_format)
-        self.logger.addHandler(self.console_handler)
-
+        self.logger.setLevel(self._resolve_level(module_name, level))
         self.logger.propagate = False
 
-        # Determine log file path: default to ./logs/<YYYY-mm-dd>.log
-        log_path = self._resolve_log_path(log_file_path)
-        if log_path is not None:
-            # Ensure the directory exists
-            log_dir = log_path.parent
-            log_dir.mkdir(parents=True, exist_ok=True)
-
-            self.file_handler = logging.FileHandler(log_path)
-            self.file_handler.setLevel(level)
-            self.file_handler.setFormatter(self.console_format)
-            self.logger.addHandler(self.file_handler)
+        if any(isinstance(h, _TruncatingQueueHandler) for h in self.logger.handlers):
+            return
+
+        writer = _LogWriter.get(self._resolve_log_path(log_file_path))
+        self.logger.addHandler(writer.handler)
+        rate = LOG_SAMPLING.get(module_name)
+        if rate is not None and rate < 1:
+            self.logger.addFilter(_SamplingFilter(rate))
+
+    @staticmethod
+    def _resolve_level(module_name: str, level: Optional[int]) -> int:
+        configured = LOG_LEVELS.get(module_name)
+        if configured is None and ("LOG_LEVEL" in os.environ or level is None):
+            configured = LOG_LEVEL
+        if configured is None:
+            return level
+        resolved = logging.getLevelName(configured.upper())
+        if isinstance(resolved, int):
+            return resolved
+        return level if level is not None else logging.INFO
 
     def _resolve_log_path(self, log_file_path: str | None) -> Path | None:
         """
@@ -67,5 +225,3 @@ if __name__ == "__main__":
     logger.info("Logger initialized in main execution context")
     logger.debug("Logger initialized in main execution context")
     logger.warning("Logger initialized in main execution context")
-
-
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+
+class AsyncLoopThread:
+    """
+    A long-lived event loop running in a daemon thread.
+
+    Lets synchronous code (Flask request threads) drive coroutines and async
+    generators on a single loop, so async SDK clients and their connection
+    pools stay bound to the loop they were first used on.
+    """
+
+    def __init__(self, name: str = "async-bridge"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """
+        Iterate an async generator from synchronous code.
+
+        Closing the returned generator (e.g. the WSGI server closing the response
+        when the client goes away) closes the async generator on the loop too.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+
+def on_event_loop() -> bool:
+    """True when called from a thread running an event loop, where a blocking wait stalls every task on it."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+_bridge: Optional[AsyncLoopThread] = None
+_bridge_lock = threading.Lock()
+
+
+def get_async_bridge() -> AsyncLoopThread:
+    """Process-wide AsyncLoopThread, started on first use."""
+    global _bridge
+    with _bridge_lock:
+        if _bridge is None:
+            _bridge = AsyncLoopThread()
+        return _bridge
@@ -0,0 +1,131 @@
+"""
+Per-request trace log: one compact JSON object per line.
+
+Files are named by day (<REQUEST_TRACE_DIR>/<YYYY-MM-DD>.jsonl, local date like
+the text logs) so a day's traffic can be analysed offline with
+analysis/analyze_traces.py. Records are written by RequestMetrics.finish; see
+services/chat_metrics.py for the fields.
+
+Requests only serialise their record and put the line on an in-memory queue; a
+background thread writes whatever has queued up and flushes once per batch, so
+no request thread or event loop waits on disk. When the queue is full, new
+records are dropped (counted in request_traces_dropped_total on /metrics).
+"""
+
+import os
+import json
+import queue
+import atexit
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+from utils.app_logger import LoggerSetup
+from utils.metrics import metrics
+
+logger = LoggerSetup("RequestTrace").logger
+
+REQUEST_TRACE_ENABLED = os.getenv("REQUEST_TRACE_ENABLED", "true").lower() == "true"
+REQUEST_TRACE_DIR = os.getenv("REQUEST_TRACE_DIR", "./logs/traces")
+REQUEST_TRACE_QUEUE_SIZE = int(os.getenv("REQUEST_TRACE_QUEUE_SIZE", "10000"))
+# Lines written per flush at most
+TRACE_BATCH_SIZE = 500
+
+TRACES_DROPPED = metrics.counter(
+    "request_traces_dropped_total", "Request trace records dropped because the trace queue was full"
+)
+
+_STOP = object()
+
+
+class TraceWriter:
+    """
+    Appends records to the current day's file from a background thread; rolls over
+    at midnight. close() writes out everything queued before returning.
+    """
+
+    def __init__(self, directory: str = REQUEST_TRACE_DIR, queue_size: int = REQUEST_TRACE_QUEUE_SIZE):
+        self.directory = Path(directory)
+        self._date: Optional[str] = None
+        self._file: Optional[TextIO] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _current_file(self) -> TextIO:
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today != self._date:
+            if self._file is not None:
+                self._file.close()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.directory / f"{today}.jsonl", "a", encoding="utf-8")
+            self._date = today
+        return self._file
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-trace-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            TRACES_DROPPED.inc()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[str] = []
+            item = self._queue.get()
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= TRACE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is _STOP
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, lines: List[str]) -> None:
+        try:
+            f = self._current_file()
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+        except OSError as e:
+            logger.warning(f"Could not write {len(lines)} request traces: {e}")
+
+    def close(self) -> None:
+        """Write out the queued records, stop the writer thread and close the file."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._date = None
+
+
+trace_writer = TraceWriter()
+atexit.register(lambda: trace_writer.close())
+
+
+def write_trace(record: Dict[str, Any]) -> None:
+    """Write a trace record; tracing must never fail a request."""
+    if not REQUEST_TRACE_ENABLED:
+        return
+    try:
+        trace_writer.write(record)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not write request trace: {e}")
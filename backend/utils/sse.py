@@ -0,0 +1,236 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Token coalescing for streamed answers: buffered text is flushed every
+# SSE_FLUSH_INTERVAL_MS or once SSE_FLUSH_BYTES are buffered, whichever comes first.
+# SSE_FLUSH_INTERVAL_MS=0 disables coalescing (one frame per provider chunk).
+SSE_FLUSH_INTERVAL_MS = float(os.getenv("SSE_FLUSH_INTERVAL_MS", "40"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "512"))
+# Comment frame sent when nothing else was sent for this long (0 disables). Besides keeping
+# proxies from timing the connection out, the write is what reveals a client that went away
+# while we were still retrieving or the model was still thinking.
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "5"))
+# A blocked write to a client that stopped reading fails after this long (0 disables)
+SSE_WRITE_TIMEOUT_SECONDS = float(os.getenv("SSE_WRITE_TIMEOUT_SECONDS", "30"))
+
+SSE_HEARTBEAT = ": keep-alive\n\n"
+
+# Where WSGI servers expose the client connection
+_WSGI_SOCKET_KEYS = ("gunicorn.socket", "werkzeug.socket")
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """
+    Format one Server-Sent Events frame.
+
+    Non-string data is JSON-encoded. Multi-line strings are split over several
+    `data:` lines so clients reassemble them with the newlines intact.
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class SSEParser:
+    """
+    Incremental parser for the frames format_sse writes: feed it the response text
+    as it arrives and get back the complete events, as {"event", "data", "id"} dicts.
+    Comment frames (heartbeats) produce nothing.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[Dict[str, Optional[str]]]:
+        self._buffer += text.replace("\r\n", "\n")
+        events = []
+        while "\n\n" in self._buffer:
+            frame, self._buffer = self._buffer.split("\n\n", 1)
+            event: Dict[str, Optional[str]] = {"event": None, "data": None, "id": None}
+            data = []
+            for line in frame.split("\n"):
+                if not line or line.startswith(":"):
+                    continue
+                name, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if name == "data":
+                    data.append(value)
+                elif name in ("event", "id"):
+                    event[name] = value
+            if data or event["event"]:
+                event["data"] = "\n".join(data)
+                events.append(event)
+        return events
+
+
+def set_write_timeout(environ: Dict[str, Any], seconds: Optional[float] = None) -> bool:
+    """
+    Bound how long a streaming response may block writing to one client.
+
+    Frames are produced only as fast as the server writes them (the stream is
+    pulled end to end), so a client that stops reading makes the write block
+    once the socket buffer is full instead of growing a buffer on our side.
+    The timeout turns that block into an error, which makes the server close
+    the response and so cancel the upstream LLM stream.
+
+    Returns False when the server doesn't expose the socket.
+    """
+    seconds = SSE_WRITE_TIMEOUT_SECONDS if seconds is None else seconds
+    if seconds <= 0:
+        return False
+    for key in _WSGI_SOCKET_KEYS:
+        sock = environ.get(key)
+        if sock is not None and hasattr(sock, "settimeout"):
+            sock.settimeout(seconds)
+            return True
+    return False
+
+
+async def _cancel_read(pending: Optional[asyncio.Future]) -> None:
+    """Stop an in-flight __anext__ so the source generator can be closed."""
+    if pending is None:
+        return
+    pending.cancel()
+    try:
+        await pending
+    except BaseException:
+        pass
+
+
+def _token(parts: List[str]) -> Dict[str, Any]:
+    return {"type": "token", "content": "".join(parts)}
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[Dict[str, Any]],
+    interval_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Merge consecutive {"type": "token"} events from a stream of chat events.
+
+    The first token is passed through immediately so time-to-first-token is
+    unchanged. After that, text is buffered and flushed when `interval_ms` has
+    passed since the first buffered chunk or `max_bytes` (UTF-8) are buffered,
+    whichever comes first. Any other event flushes the buffer and is passed
+    through as is, so event ordering is preserved.
+
+    The interval is enforced with a timer, not only when the next chunk
+    arrives, so a stalled provider never holds back text it already produced.
+
+    Args:
+        events: async iterator of event dicts (see ChatService.astream_events)
+        interval_ms: flush interval; <= 0 disables coalescing (default SSE_FLUSH_INTERVAL_MS)
+        max_bytes: flush size; <= 0 for no size limit (default SSE_FLUSH_BYTES)
+    """
+    interval = (SSE_FLUSH_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+    max_bytes = SSE_FLUSH_BYTES if max_bytes is None else max_bytes
+
+    if interval <= 0:
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    deadline = None      # when the buffered text has to go out
+    pending = None       # in-flight __anext__ while a deadline is running
+    first_sent = False
+    try:
+        while True:
+            if pending is None and deadline is None:
+                # Nothing buffered: no timer needed, wait for the next event directly
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(events.__anext__())
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait((pending,), timeout=timeout)
+                if not done:
+                    # Interval elapsed before the next chunk; keep waiting on the same read
+                    parts, buffer, size, deadline = buffer, [], 0, None
+                    yield _token(parts)
+                    continue
+                task, pending = pending, None
+                try:
+                    event = task.result()
+                except StopAsyncIteration:
+                    break
+
+            if event.get("type") != "token":
+                if buffer:
+                    parts, buffer, size, deadline = buffer, [], 0, None
+                    yield _token(parts)
+                yield event
+                continue
+
+            if not first_sent:
+                first_sent = True
+                yield event
+                continue
+
+            content = event["content"]
+            buffer.append(content)
+            size += len(content.encode("utf-8"))
+            if deadline is None:
+                deadline = loop.time() + interval
+            if (max_bytes > 0 and size >= max_bytes) or loop.time() >= deadline:
+                parts, buffer, size, deadline = buffer, [], 0, None
+                yield _token(parts)
+
+        if buffer:
+            yield _token(buffer)
+    finally:
+        # Closed mid-read (e.g. client went away): stop the read before closing the source
+        await _cancel_read(pending)
+        await events.aclose()
+
+
+async def with_heartbeat(
+    events: AsyncIterator[Dict[str, Any]],
+    interval: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Pass events through, inserting {"type": "heartbeat"} whenever none arrived
+    for `interval` seconds (default SSE_HEARTBEAT_SECONDS; <= 0 disables).
+    """
+    interval = SSE_HEARTBEAT_SECONDS if interval is None else interval
+    pending = None
+    try:
+        if interval <= 0:
+            async for event in events:
+                yield event
+            return
+
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            done, _ = await asyncio.wait((pending,), timeout=interval)
+            if not done:
+                yield {"type": "heartbeat"}
+                continue
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                break
+            yield event
+    finally:
+        await _cancel_read(pending)
+        await events.aclose()
@@ -130,7 +130,7 @@ def render_chat_ui(config: Dict[str, Any]) -> None:
                 query=user_input,
                 conversation_history=conversation_history,
                 session_id=session_id,
-                k=5,
+                k=None,
                 temperature=0.7,
                 max_tokens=None,
                 system_prompt=config["system_prompt"],